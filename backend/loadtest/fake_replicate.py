@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita a API do Replicate para testes de carga
+
+Implementa o mínimo usado pelo backend:
+- POST /v1/predictions            cria uma predição
+- GET  /v1/predictions/<id>       status da predição
+- GET  /v1/predictions            listagem paginada (mais recentes primeiro)
+- GET  /v1/models                 usado pelo health check
+- GET  /outputs/<id>.png          "URL" da imagem processada
+
+Latência (log-normal), taxa de erros 5xx, taxa de 429 e tamanho da saída são
+configuráveis. Nenhum crédito do Replicate é consumido.
+
+Uso: python loadtest/fake_replicate.py --port 9100 --latency-median 8 --latency-p95 20
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeReplicateConfig:
+    def __init__(self, latency_median=5.0, latency_p95=15.0, error_rate=0.0,
+                 rate_limit_rate=0.0, model_error_rate=0.0, output_pixels=4000000, seed=None):
+        self.latency_median = latency_median
+        self.latency_p95 = latency_p95
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.model_error_rate = model_error_rate
+        self.output_pixels = output_pixels
+        self.random = random.Random(seed)
+
+    def sample_latency(self):
+        """Amostra log-normal com a mediana e o p95 configurados"""
+        mu = math.log(max(self.latency_median, 0.001))
+        sigma = max(0.0, math.log(max(self.latency_p95, self.latency_median) / max(self.latency_median, 0.001)) / 1.645)
+        return self.random.lognormvariate(mu, sigma)
+
+
+def build_output_png(pixels):
+    """PNG de ruído (incompressível) com aproximadamente o número de pixels pedido (só stdlib)"""
+    side = max(1, int(math.sqrt(pixels)))
+    raw = b''.join(b'\x00' + os.urandom(side * 3) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', header)
+        + chunk(b'IDAT', zlib.compress(raw, 1))
+        + chunk(b'IEND', b'')
+    )
+
+
+# Predições por página da listagem (igual à API real)
+LIST_PAGE_SIZE = 100
+
+
+class FakeReplicateState:
+    def __init__(self, config):
+        self.config = config
+        self.predictions = {}
+        self.lock = threading.Lock()
+        self.output = build_output_png(config.output_pixels)
+        self.stats = {'created': 0, 'errors': 0, 'rate_limited': 0, 'polls': 0, 'lists': 0, 'downloads': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        @property
+        def base_url(self):
+            return f"http://{self.headers.get('Host', '127.0.0.1')}"
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def prediction_payload(self, prediction):
+            now = time.time()
+            payload = {
+                'id': prediction['id'],
+                'model': 'nightmareai/real-esrgan',
+                'version': prediction['version'],
+                'input': {},
+                'logs': '',
+                'error': None,
+                'output': None,
+                'status': 'processing',
+                'created_at': prediction['created_at'],
+                'started_at': prediction['created_at'],
+                'completed_at': None,
+                'urls': {
+                    'get': f"{self.base_url}/v1/predictions/{prediction['id']}",
+                    'cancel': f"{self.base_url}/v1/predictions/{prediction['id']}/cancel",
+                },
+                'metrics': {},
+            }
+            if now >= prediction['ready_at']:
+                if prediction['fails']:
+                    payload.update(status='failed', error='CUDA out of memory (simulado)', completed_at=prediction['created_at'])
+                else:
+                    payload.update(
+                        status='succeeded',
+                        completed_at=prediction['created_at'],
+                        output=f"{self.base_url}/outputs/{prediction['id']}.png",
+                        metrics={'predict_time': round(prediction['ready_at'] - prediction['started_at'], 3)}
+                    )
+            return payload
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if self.path.rstrip('/') != '/v1/predictions':
+                return self.send_json(404, {'detail': 'Not found'})
+
+            config = state.config
+            roll = config.random.random()
+            if roll < config.rate_limit_rate:
+                state.count('rate_limited')
+                return self.send_json(429, {'detail': 'Request was throttled'}, {'Retry-After': '1'})
+            if roll < config.rate_limit_rate + config.error_rate:
+                state.count('errors')
+                return self.send_json(500, {'detail': 'Internal server error (simulado)'})
+
+            try:
+                version = json.loads(body or b'{}').get('version')
+            except ValueError:
+                version = None
+            now = time.time()
+            prediction = {
+                'id': uuid.uuid4().hex,
+                'version': version,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(now)),
+                'started_at': now,
+                'ready_at': now + config.sample_latency(),
+                'fails': config.random.random() < config.model_error_rate,
+            }
+            with state.lock:
+                state.predictions[prediction['id']] = prediction
+            state.count('created')
+            self.send_json(201, self.prediction_payload(prediction))
+
+        def do_GET(self):
+            match = re.match(r'^/v1/predictions/([0-9a-f]+)$', self.path)
+            if match:
+                state.count('polls')
+                with state.lock:
+                    prediction = state.predictions.get(match.group(1))
+                if prediction is None:
+                    return self.send_json(404, {'detail': 'Not found'})
+                return self.send_json(200, self.prediction_payload(prediction))
+
+            match = re.match(r'^/v1/predictions/?(?:\?cursor=(\d+))?$', self.path)
+            if match:
+                state.count('lists')
+                offset = int(match.group(1) or 0)
+                with state.lock:
+                    newest_first = sorted(state.predictions.values(), key=lambda p: p['started_at'], reverse=True)
+                page = newest_first[offset:offset + LIST_PAGE_SIZE]
+                has_next = offset + LIST_PAGE_SIZE < len(newest_first)
+                return self.send_json(200, {
+                    'results': [self.prediction_payload(prediction) for prediction in page],
+                    'next': f"{self.base_url}/v1/predictions?cursor={offset + LIST_PAGE_SIZE}" if has_next else None,
+                    'previous': None,
+                })
+
+            if self.path.startswith('/v1/models'):
+                return self.send_json(200, {'results': [], 'next': None, 'previous': None})
+
+            if re.match(r'^/outputs/[0-9a-f]+\.png$', self.path):
+                state.count('downloads')
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(state.output)))
+                self.end_headers()
+                self.wfile.write(state.output)
+                return
+
+            self.send_json(404, {'detail': 'Not found'})
+
+    return Handler
+
+
+def start_fake_replicate(config, host='127.0.0.1', port=0):
+    """
+    Inicia o servidor falso numa thread daemon
+
+    Returns:
+        tuple: (servidor, estado, URL base)
+    """
+    state = FakeReplicateState(config)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='fake-replicate', daemon=True)
+    thread.start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
+
+
+def add_config_arguments(parser):
+    parser.add_argument('--latency-median', type=float, default=5.0, help='Mediana da latência da predição (s)')
+    parser.add_argument('--latency-p95', type=float, default=15.0, help='p95 da latência da predição (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fração de criações que retornam 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fração de criações que retornam 429')
+    parser.add_argument('--model-error-rate', type=float, default=0.0, help='Fração de predições que terminam em failed')
+    parser.add_argument('--output-pixels', type=int, default=4000000, help='Pixels da imagem de saída')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args):
+    return FakeReplicateConfig(
+        latency_median=args.latency_median,
+        latency_p95=args.latency_p95,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        model_error_rate=args.model_error_rate,
+        output_pixels=args.output_pixels,
+        seed=args.seed
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replicate falso para testes de carga')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, state, url = start_fake_replicate(config_from_args(args), args.host, args.port)
+    print(f"🚀 Replicate falso em {url} (REPLICATE_BASE_URL={url}, REPLICATE_API_URL={url}/v1)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 {state.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
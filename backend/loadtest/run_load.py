@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Teste de carga ponta a ponta do UltraImageAI
+
+Sobe o Replicate falso (fake_replicate.py), inicia o backend apontando para ele
+com um banco SQLite temporário, cria usuários e dispara uma mistura de
+requisições (/api/auth/login, /api/auth/check-auth, /api/upload, planos e
+assinatura) a uma taxa fixa (open loop: a latência é medida a partir do horário
+agendado, então filas no servidor aparecem nos percentis).
+
+Relata throughput, p50/p95/p99, taxa de erros por endpoint e o RSS dos workers.
+
+Uso:
+    python loadtest/run_load.py --rate 20 --duration 60 --server gunicorn --workers 4
+    python loadtest/run_load.py --rate 50 --duration 60 --server asgi --latency-median 8
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_replicate import add_config_arguments, config_from_args, start_fake_replicate
+
+DEFAULT_MIX = 'login=10,check-auth=45,upload=10,plans=20,subscription=15'
+USER_PASSWORD = 'LoadTest123'
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, weight = item.split('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Endpoints desconhecidos: {sorted(unknown)}")
+    return mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_upload_image(pixels):
+    """JPEG de teste com aproximadamente o número de pixels pedido"""
+    from PIL import Image
+
+    side = max(16, int(pixels ** 0.5))
+    img = Image.effect_noise((side, side), 64).convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def seed_users(env, count):
+    """Cria os usuários de teste direto no banco (em subprocesso, com o env do servidor)"""
+    script = (
+        "import sys\n"
+        "from src.main import app\n"
+        "from src.models.user import db, User\n"
+        "count, password = int(sys.argv[1]), sys.argv[2]\n"
+        "with app.app_context():\n"
+        "    for i in range(count):\n"
+        "        email = f'load{i}@example.com'\n"
+        "        if User.query.filter_by(email=email).first():\n"
+        "            continue\n"
+        "        user = User(name=f'Load {i}', email=email, subscription_plan='pro', images_limit=-1)\n"
+        "        user.set_password(password)\n"
+        "        db.session.add(user)\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', script, str(count), USER_PASSWORD], cwd=BACKEND_DIR, env=env, check=True)
+
+
+def start_server(args, env, port):
+    if args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'src.asgi:app', '--host', '127.0.0.1',
+                   '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', 'src.main:app', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(args.workers), '--worker-class', 'gthread',
+                   '--threads', str(args.threads), '--timeout', '600', '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, start_new_session=True)
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor terminou durante a inicialização (código {process.returncode})")
+        try:
+            requests.get(f'{base_url}/api/payment/plans', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError("Servidor não respondeu em 60s")
+
+
+def process_tree_rss(root_pid):
+    """RSS (bytes) do processo raiz e de todos os descendentes, via /proc"""
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            children[ppid].append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    rss = {}
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss[pid] = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        stack.extend(children.get(pid, ()))
+    return rss
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, root_pid, interval=1.0):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.samples.append(process_tree_rss(self.root_pid))
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        per_process_peak = defaultdict(int)
+        for sample in self.samples:
+            for pid, rss in sample.items():
+                per_process_peak[pid] = max(per_process_peak[pid], rss)
+        totals = [sum(sample.values()) for sample in self.samples]
+        return {
+            'processes': len(per_process_peak),
+            'peak_worker_rss_mb': round(max(per_process_peak.values()) / 1024 ** 2, 1),
+            'peak_total_rss_mb': round(max(totals) / 1024 ** 2, 1),
+            'avg_total_rss_mb': round(sum(totals) / len(totals) / 1024 ** 2, 1),
+        }
+
+
+class VirtualUser:
+    def __init__(self, base_url, index):
+        self.base_url = base_url
+        self.email = f'load{index}@example.com'
+        self.session = requests.Session()
+
+    def login(self):
+        return self.session.post(f'{self.base_url}/api/auth/login',
+                                 json={'email': self.email, 'password': USER_PASSWORD}, timeout=30)
+
+
+def do_login(user, ctx):
+    return user.login()
+
+
+def do_check_auth(user, ctx):
+    return user.session.get(f'{user.base_url}/api/auth/check-auth', timeout=30)
+
+
+def do_upload(user, ctx):
+    return user.session.post(
+        f'{user.base_url}/api/upload',
+        files={'image': ('load.jpg', ctx['image'], 'image/jpeg')},
+        data={'scale': str(ctx['scale'])},
+        timeout=ctx['upload_timeout']
+    )
+
+
+def do_plans(user, ctx):
+    return user.session.get(f'{user.base_url}/api/payment/plans', timeout=30)
+
+
+def do_subscription(user, ctx):
+    return user.session.get(f'{user.base_url}/api/payment/subscription', timeout=30)
+
+
+ENDPOINTS = {
+    'login': do_login,
+    'check-auth': do_check_auth,
+    'upload': do_upload,
+    'plans': do_plans,
+    'subscription': do_subscription,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_load(base_url, users, mix, ctx, rate, duration, max_in_flight):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = defaultdict(list)
+    results_lock = threading.Lock()
+    rng = random.Random(ctx.get('seed'))
+
+    def execute(name, user, scheduled):
+        status = None
+        started = time.monotonic()
+        try:
+            status = ENDPOINTS[name](user, ctx).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        finished = time.monotonic()
+        with results_lock:
+            results[name].append((finished - scheduled, finished - started, status))
+
+    total = int(rate * duration)
+    start = time.monotonic() + 0.5
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            name = rng.choices(names, weights)[0]
+            pool.submit(execute, name, rng.choice(users), scheduled)
+    elapsed = time.monotonic() - start
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    report = {'elapsed_s': round(elapsed, 2), 'endpoints': {}}
+    all_latencies = []
+    total = errors = 0
+    for name, samples in sorted(results.items()):
+        latencies = sorted(sample[0] for sample in samples)
+        failed = [sample for sample in samples if not isinstance(sample[2], int) or sample[2] >= 400]
+        by_status = defaultdict(int)
+        for sample in samples:
+            by_status[str(sample[2])] += 1
+        report['endpoints'][name] = {
+            'requests': len(samples),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'error_rate': round(len(failed) / len(samples), 4),
+            'status': dict(by_status),
+        }
+        all_latencies.extend(latencies)
+        total += len(samples)
+        errors += len(failed)
+
+    all_latencies.sort()
+    report['overall'] = {
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+        'p50_ms': round((percentile(all_latencies, 50) or 0) * 1000, 1),
+        'p95_ms': round((percentile(all_latencies, 95) or 0) * 1000, 1),
+        'p99_ms': round((percentile(all_latencies, 99) or 0) * 1000, 1),
+        'error_rate': round(errors / total, 4) if total else 0,
+    }
+    return report
+
+
+def print_report(report):
+    print()
+    print(f"{'endpoint':<14}{'reqs':>7}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}  status")
+    print('-' * 90)
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['overall'])]
+    for name, data in rows:
+        print(f"{name:<14}{data['requests']:>7}{data['throughput_rps']:>8}{data['p50_ms']:>10}"
+              f"{data['p95_ms']:>10}{data['p99_ms']:>10}{data['error_rate'] * 100:>7.1f}%  {data.get('status', '')}")
+    if report.get('rss'):
+        rss = report['rss']
+        print(f"\n💾 RSS: pico por worker {rss['peak_worker_rss_mb']} MB | pico total {rss['peak_total_rss_mb']} MB "
+              f"| média total {rss['avg_total_rss_mb']} MB ({rss['processes']} processos)")
+    if report.get('fake_replicate'):
+        print(f"🤖 Replicate falso: {report['fake_replicate']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do UltraImageAI contra um Replicate falso')
+    parser.add_argument('--rate', type=float, default=10, help='Requisições por segundo (total)')
+    parser.add_argument('--duration', type=float, default=30, help='Duração da carga (s)')
+    parser.add_argument('--users', type=int, default=50, help='Usuários virtuais')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Pesos por endpoint (padrão: {DEFAULT_MIX})')
+    parser.add_argument('--server', choices=['gunicorn', 'asgi'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='Threads por worker (gunicorn gthread)')
+    parser.add_argument('--app-url', help='Usar um backend já em execução em vez de iniciar um')
+    parser.add_argument('--max-in-flight', type=int, default=512, help='Máximo de requisições simultâneas do gerador')
+    parser.add_argument('--image-pixels', type=int, default=1000000, help='Pixels da imagem enviada no upload')
+    parser.add_argument('--scale', type=int, default=2)
+    parser.add_argument('--upload-timeout', type=float, default=600)
+    parser.add_argument('--json', dest='json_path', help='Salvar o relatório em JSON neste caminho')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    fake_server, fake_state, fake_url = start_fake_replicate(config_from_args(args))
+    print(f"🤖 Replicate falso em {fake_url}")
+
+    workdir = tempfile.mkdtemp(prefix='ultraimage-load-')
+    server = sampler = None
+    try:
+        if args.app_url:
+            base_url = args.app_url.rstrip('/')
+        else:
+            env = dict(os.environ)
+            env.update({
+                'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'load.db')}",
+                'ARTIFACT_ROOT': os.path.join(workdir, 'artifacts'),
+                'REPLICATE_API_TOKEN': 'fake-token',
+                'REPLICATE_BASE_URL': fake_url,
+                'REPLICATE_API_URL': f'{fake_url}/v1',
+                'REPLICATE_POLL_INTERVAL': '0.5',
+                'SECRET_KEY': 'load-test',
+            })
+            seed_users(env, args.users)
+            server, base_url = start_server(args, env, free_port())
+            sampler = RssSampler(server.pid)
+            sampler.start()
+            print(f"🚀 Backend ({args.server}, {args.workers} workers) em {base_url}")
+
+        users = [VirtualUser(base_url, i) for i in range(args.users)]
+        for user in users:
+            user.login()
+
+        ctx = {
+            'image': build_upload_image(args.image_pixels) if args.mix.get('upload') else b'',
+            'scale': args.scale,
+            'upload_timeout': args.upload_timeout,
+            'seed': args.seed,
+        }
+        print(f"🔥 {args.rate} req/s por {args.duration}s, mix {args.mix}")
+        results, elapsed = run_load(base_url, users, args.mix, ctx, args.rate, args.duration, args.max_in_flight)
+
+        report = summarize(results, elapsed)
+        report['config'] = {key: value for key, value in vars(args).items() if key != 'mix'}
+        report['config']['mix'] = args.mix
+        if sampler:
+            sampler.stop()
+            report['rss'] = sampler.summary()
+        report['fake_replicate'] = dict(fake_state.stats)
+        print_report(report)
+
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"📝 Relatório salvo em {args.json_path}")
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=30)
+        fake_server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
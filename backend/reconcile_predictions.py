@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Reconciliação de predições do UltraImageAI
+
+Atualiza os jobs que ficaram parados esperando o Replicate (processo caiu,
+notificação perdida) a partir da listagem paginada de predições, em poucas
+chamadas à API e transações. Também roda em background no servidor
+(RECONCILE_INTERVAL); este script serve para execução manual após incidentes.
+
+Uso: python reconcile_predictions.py --max-pages 50
+"""
+
+import argparse
+import os
+import sys
+
+# Permite importar o pacote src (mesmo layout usado pelo gunicorn: src.main:app)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Só a app: as threads de manutenção rodam no servidor web
+os.environ.setdefault('BACKGROUND_TASKS', 'false')
+
+from src.main import app
+from src.services.reconciliation import MAX_PAGES, reconcile_predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconciliação de jobs com as predições do Replicate')
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGES)
+    args = parser.parse_args()
+
+    print("🔄 Reconciliando jobs com o Replicate...")
+    with app.app_context():
+        report = reconcile_predictions(args.max_pages)
+
+    print(f"📊 Jobs parados: {report['in_flight']} ({report['pages']} páginas consultadas)")
+    print(f"✅ Concluídos: {report['completed']}")
+    print(f"❌ Falhos: {report['failed']}")
+    print(f"⏳ Ainda rodando: {report['running']}")
+    if report['not_found']:
+        print(f"⚠️  Não encontrados na listagem: {report['not_found']}")
+
+
+if __name__ == "__main__":
+    main()
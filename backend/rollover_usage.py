@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Virada mensal do ledger de uso do UltraImageAI
+
+Encerra o período anterior movendo seus eventos de uso para o arquivo
+(usage_events_archive) em lotes, por faixa de ids. A virada também é disparada
+pela thread de consolidação do servidor; este script serve para execução
+manual, para retomar uma virada interrompida ou para encerrar períodos antigos.
+
+Uso: python rollover_usage.py [--period 2024-05]
+"""
+
+import argparse
+import os
+import sys
+
+# Permite importar o pacote src (mesmo layout usado pelo gunicorn: src.main:app)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Só a app: as threads de manutenção rodam no servidor web
+os.environ.setdefault('BACKGROUND_TASKS', 'false')
+
+from src.main import app
+from src.services.usage_ledger import ROLLOVER_CHUNK_SIZE, rollover_usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Virada mensal do ledger de uso')
+    parser.add_argument('--period', help='Período encerrado (AAAA-MM); padrão: mês anterior')
+    parser.add_argument('--chunk-size', type=int, default=ROLLOVER_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print("🔄 Iniciando virada de cotas...")
+    with app.app_context():
+        try:
+            result = rollover_usage(args.period, chunk_size=args.chunk_size)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    if result['completed_at'] is None:
+        print(f"⏳ Período {result['period']}: a consolidação ainda não passou do fim do período; tente em instantes")
+        sys.exit(1)
+    print(f"✅ Período {result['period']} encerrado")
+    print(f"📦 Eventos arquivados: {result['events_archived']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Aplicação ASGI do UltraImageAI
+
+Serve em asyncio o endpoint de upload (/api/upload) e o stream SSE de
+eventos dos jobs (/api/jobs/events). No upload, as chamadas ao Replicate
+e o download da saída são feitos com httpx assíncrono, e o trabalho de CPU
+(Pillow, base64, hash dos artefatos) vai para o thread pool. As etapas antes e
+depois do modelo são as mesmas da rota Flask (src/services/upload_service.py),
+incluindo animações e o modo assíncrono. Todas as demais rotas continuam sendo
+atendidas pela app Flask, montada via WSGIMiddleware.
+
+Execução: uvicorn src.asgi:app --host 0.0.0.0 --port 8000
+"""
+
+import asyncio
+import base64
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import aiofiles
+import httpx
+import replicate
+from fastapi import FastAPI, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from src.main import app as flask_app
+from src.models.user import db, ProcessingJob
+from src.services.job_events import job_events, publish_job, active_jobs_snapshot, format_sse
+from src.services.replicate_service import REPLICATE_API_URL, async_replicate_call
+from src.services.rate_limit import RATE_LIMIT_ENABLED, rate_limiter, user_plan
+from src.services.upload_service import (
+    REPLICATE_MODEL, MAX_UPLOAD_BYTES, MAX_OUTPUT_BYTES, UploadResult,
+    parse_upload_options, prepare_upload, resample_upload, finish_upload, error_result,
+    fail_job, output_extension
+)
+
+REPLICATE_POLL_INTERVAL = float(os.environ.get('REPLICATE_POLL_INTERVAL', 1.0))
+REPLICATE_TIMEOUT = float(os.environ.get('REPLICATE_TIMEOUT', 600))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Intervalo do comentário keep-alive do SSE (mesmo valor da rota Flask)
+SSE_KEEPALIVE = 15
+
+
+class PredictionFailed(replicate.exceptions.ModelError):
+    """Predição terminou com status failed/canceled"""
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Um único cliente HTTP por processo reaproveita conexões com o Replicate
+    app.state.http = httpx.AsyncClient(
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_connections=500, max_keepalive_connections=100)
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+
+
+app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+
+def error_response(message, status_code, retry_after=None):
+    headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+    return JSONResponse({'error': message}, status_code=status_code, headers=headers)
+
+
+def session_user_id(request):
+    """Lê o user_id da sessão assinada do Flask (mesmo cookie das rotas WSGI)"""
+    cookie = request.cookies.get(flask_app.config.get('SESSION_COOKIE_NAME', 'session'))
+    if not cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if serializer is None:
+        return None
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(cookie, max_age=max_age).get('user_id')
+    except Exception:
+        return None
+
+
+def check_rate_limit(user_id, ip):
+    """Mesmo limite da rota Flask (por usuário ou por IP), antes de ler o upload"""
+    with flask_app.app_context():
+        try:
+            return rate_limiter.check('upload', user_id, user_plan(user_id), ip)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro no rate limiter: {e}")
+            return True, 0, 0, 0
+
+
+def update_job(job_id, event_status=None, timings=None, **fields):
+    """Atualiza campos do job (numa app context própria) e publica o evento"""
+    if job_id is None:
+        return
+    with flask_app.app_context():
+        job = ProcessingJob.query.get(job_id)
+        if job is None:
+            return
+        for name, value in fields.items():
+            setattr(job, name, value)
+        if fields:
+            db.session.commit()
+        extra = {'timings': timings} if timings is not None else {}
+        if event_status:
+            extra['status'] = event_status
+        publish_job(job, **extra)
+
+
+def in_app_context(func, *args):
+    """Executa uma etapa do serviço de upload (síncrona) numa app context do Flask"""
+    with flask_app.app_context():
+        return func(*args)
+
+
+def upload_response(result):
+    return JSONResponse(result.payload, status_code=result.status_code, headers=result.headers or None)
+
+
+def data_uri(path):
+    with open(path, 'rb') as f:
+        return 'data:image/png;base64,' + base64.b64encode(f.read()).decode('utf-8')
+
+
+def mark_processing(job_id, prediction_id, timings):
+    """Marca o job como processing com o id da predição (erro de banco só é registrado)"""
+    try:
+        update_job(job_id, None, timings, status='processing', replicate_prediction_id=prediction_id)
+    except Exception as e:
+        print(f"Erro ao gravar a predição {prediction_id} do job {job_id}: {e}")
+
+
+async def run_prediction(http, temp_img_path, scale, face_enhance, job_id=None, timings=None):
+    """
+    Cria a predição no Replicate e aguarda o resultado sem bloquear o event loop
+
+    O id da predição é gravado no job logo após a criação (para a reconciliação),
+    sem que um erro de banco conte como falha do Replicate no circuit breaker.
+
+    Returns:
+        dict: Predição finalizada (com output e metrics)
+    """
+    headers = {'Authorization': f"Token {os.environ.get('REPLICATE_API_TOKEN', '')}"}
+    image = await run_in_threadpool(data_uri, temp_img_path)
+    response = await http.post(
+        f"{REPLICATE_API_URL}/predictions",
+        headers=headers,
+        json={
+            'version': REPLICATE_MODEL.split(':', 1)[1],
+            'input': {'image': image, 'scale': scale, 'face_enhance': face_enhance}
+        }
+    )
+    response.raise_for_status()
+    prediction = response.json()
+    await run_in_threadpool(mark_processing, job_id, prediction['id'], timings)
+
+    deadline = time.monotonic() + REPLICATE_TIMEOUT
+    while prediction['status'] not in ('succeeded', 'failed', 'canceled'):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Predição {prediction['id']} não terminou em {REPLICATE_TIMEOUT}s")
+        await asyncio.sleep(REPLICATE_POLL_INTERVAL)
+        response = await http.get(prediction['urls']['get'], headers=headers)
+        response.raise_for_status()
+        prediction = response.json()
+
+    if prediction['status'] != 'succeeded':
+        raise PredictionFailed(prediction.get('error') or prediction['status'])
+    return prediction
+
+
+async def download_output(http, url, suffix):
+    """Baixa a saída em streaming para um arquivo temporário"""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    written = 0
+    try:
+        async with http.stream('GET', url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(path, 'wb') as output_file:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    written += len(chunk)
+                    if written > MAX_OUTPUT_BYTES:
+                        raise ValueError(f"Imagem processada excede {MAX_OUTPUT_BYTES} bytes")
+                    await output_file.write(chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
+@app.post('/api/upload')
+async def upload_image(request: Request):
+    """
+    Upload de imagem (mesmos parâmetros e respostas da rota Flask)
+
+    Recebe o Request cru: o FastAPI não lê o corpo antes do handler, então o
+    Content-Length e o rate limit são conferidos antes do multipart ser lido.
+    """
+    content_length = request.headers.get('content-length')
+    if content_length is None:
+        return error_response("Content-Length obrigatório", 411)
+    try:
+        content_length = int(content_length)
+    except ValueError:
+        return error_response("Content-Length inválido", 400)
+    if content_length > MAX_UPLOAD_BYTES:
+        return error_response(f"Arquivo muito grande. O máximo é {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", 413)
+
+    user_id = session_user_id(request)
+    if RATE_LIMIT_ENABLED:
+        allowed, _, _, retry_after = await run_in_threadpool(
+            check_rate_limit, user_id, request.client.host if request.client else None
+        )
+        if not allowed:
+            return error_response("Muitas requisições. Tente novamente em instantes.", 429, retry_after)
+
+    # O Starlette faz spool dos arquivos em disco ao ler o multipart
+    form = await request.form()
+    try:
+        image = form.get('image')
+        if image is None or isinstance(image, str):
+            return error_response("Nenhuma imagem fornecida", 400)
+        if not image.filename:
+            return error_response("Nenhum arquivo selecionado", 400)
+        try:
+            options = parse_upload_options(form)
+        except ValueError as e:
+            return error_response(str(e), 400)
+
+        # Validação, animações e modo assíncrono: mesma etapa da rota Flask
+        prepared = await run_in_threadpool(in_app_context, prepare_upload, image.file, image.filename, options, user_id)
+        if isinstance(prepared, UploadResult):
+            return upload_response(prepared)
+
+        result = await predict(request.app.state.http, prepared)
+        return upload_response(result)
+    finally:
+        await form.close()
+
+
+async def predict(http, prepared):
+    """
+    Etapa do modelo em asyncio (httpx); o fim do upload volta ao serviço compartilhado
+
+    Returns:
+        UploadResult: Resposta do upload
+    """
+    job_id = prepared.job_id
+    timings = prepared.timings
+    try:
+        if prepared.scale is None:
+            output_path, output_ext, prediction_metrics = await run_in_threadpool(resample_upload, prepared)
+        else:
+            await run_in_threadpool(update_job, job_id, 'queued')
+            queued_at = time.monotonic()
+            try:
+                async with async_replicate_call():
+                    timings['queue'] = round(time.monotonic() - queued_at, 3)
+                    predict_started = time.monotonic()
+                    prediction = await run_prediction(http, prepared.temp_img_path, prepared.scale,
+                                                      prepared.face_enhance, job_id, timings)
+            finally:
+                os.unlink(prepared.temp_img_path)
+            timings['predict'] = round(time.monotonic() - predict_started, 3)
+
+            output_url = prediction['output']
+            await run_in_threadpool(update_job, job_id, 'downloading', timings)
+            download_started = time.monotonic()
+            output_ext = output_extension(output_url)
+            output_path = await download_output(http, output_url, f".{output_ext}")
+            timings['download'] = round(time.monotonic() - download_started, 3)
+            prediction_metrics = prediction.get('metrics')
+    except httpx.HTTPError as e:
+        await run_in_threadpool(in_app_context, fail_job, job_id, e)
+        return UploadResult({'error': f"Erro de comunicação com o Replicate: {e}"}, 502)
+    except Exception as e:
+        return await run_in_threadpool(in_app_context, error_result, e, job_id)
+
+    return await run_in_threadpool(in_app_context, finish_upload, prepared, output_path, output_ext, prediction_metrics)
+
+
+@app.get('/api/jobs/events')
+async def job_events_stream(request: Request):
+    """
+    Stream SSE com as transições de status dos jobs do usuário
+
+    Mesmo protocolo da rota Flask, mas cada conexão é só uma corrotina
+    esperando num asyncio.Event (sem thread presa). O broker, que é publicado
+    por threads (thread pool, repasse do log de eventos), acorda a corrotina
+    com loop.call_soon_threadsafe. Eventos de worker.py e de outros nós chegam
+    pelo repasse de start_event_relay.
+    """
+    user_id = session_user_id(request)
+    if not user_id:
+        return error_response('Usuário não autenticado', 401)
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+    # Assina antes do snapshot: uma transição entre os dois chega como evento
+    # (no máximo repetida) em vez de se perder
+    subscription = job_events.subscribe(user_id, notify=notify)
+    try:
+        snapshot = await run_in_threadpool(in_app_context, active_jobs_snapshot, user_id)
+    except BaseException:
+        job_events.unsubscribe(subscription)
+        raise
+
+    async def stream():
+        try:
+            yield "retry: 3000\n" + format_sse(snapshot, 'snapshot')
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                ready.clear()
+                for event in subscription.drain():
+                    yield format_sse(event)
+        finally:
+            job_events.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+# Todo o resto (auth, pagamentos, jobs, SPA) continua na app Flask
+app.mount('/', WSGIMiddleware(flask_app))
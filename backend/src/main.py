@@ -6,6 +6,14 @@ from src.routes.user import user_bp
 from src.routes.image import image_bp
 from src.routes.auth import auth_bp
 from src.routes.payment import payment_bp
+from src.routes.job import job_bp
+from src.routes.admin import admin_bp
+from src.services.retention import start_retention_sweeper, start_artifact_evictor
+from src.services.usage_ledger import start_usage_compactor
+from src.services.profiler import init_profiler
+from src.services.reconciliation import start_reconciler
+from src.services.replicate_service import start_health_monitor
+from src.services.job_events import start_event_relay
 
 # Cria a app Flask e configura a pasta estática
 app = Flask(
@@ -19,6 +27,10 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
     f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 )
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Teto do corpo das requisições (também cobre uploads sem Content-Length);
+# arquivos maiores que 500 KB são mantidos pelo Werkzeug em disco (spooled)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+app.config['MAX_FORM_MEMORY_SIZE'] = 1024 * 1024
 
 # Habilita CORS
 CORS(app, supports_credentials=True)
@@ -28,11 +40,42 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+# Profiling opcional de requisições selecionadas (PROFILE_* / ADMIN_TOKEN)
+init_profiler(app)
+
 # Registra blueprints
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(image_bp, url_prefix='/api')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(payment_bp, url_prefix='/api/payment')
+app.register_blueprint(job_bp, url_prefix='/api')
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+# Threads de manutenção em background. Processos que só importam a app
+# (worker.py e os scripts de linha de comando) definem BACKGROUND_TASKS=false.
+BACKGROUND_TASKS = os.environ.get('BACKGROUND_TASKS', 'true').lower() not in ('0', 'false', 'no')
+
+def start_background_tasks(app):
+    # Health check do Replicate em background (GET /api/health só lê o estado em cache)
+    start_health_monitor(app)
+
+    # Varredura periódica de artefatos e jobs cuja retenção do plano expirou
+    start_retention_sweeper(app)
+
+    # Orçamento de bytes do armazenamento (LRU), fora do caminho das requisições
+    start_artifact_evictor(app)
+
+    # Consolidação periódica do ledger de uso em totais por usuário/período
+    start_usage_compactor(app)
+
+    # Repasse dos eventos de jobs publicados por outros processos (worker.py, outros nós) ao SSE
+    start_event_relay(app)
+
+    # Reconciliação periódica dos jobs parados com o estado das predições no Replicate
+    start_reconciler(app)
+
+if BACKGROUND_TASKS:
+    start_background_tasks(app)
 
 # Rota para servir SPA + API
 @app.route('/', defaults={'path': ''})
@@ -12,7 +12,7 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     subscription_plan = db.Column(db.String(50), default='free')
-    images_processed = db.Column(db.Integer, default=0)
+    images_processed = db.Column(db.Integer, default=0)  # obsoleto: uso vem de usage_events/usage_totals
     images_limit = db.Column(db.Integer, default=5)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -25,13 +25,19 @@ class User(db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
-    def to_dict(self):
+    def to_dict(self, images_processed=None):
+        # O uso vem do ledger (a coluna images_processed não é mais atualizada).
+        # Listagens passam images_processed já carregado em lote (get_usage_counts).
+        if images_processed is None:
+            # Import local: usage_ledger importa este módulo
+            from src.services.usage_ledger import get_usage_count
+            images_processed = get_usage_count(self.id)
         return {
             'id': self.id,
             'name': self.name,
             'email': self.email,
             'subscription_plan': self.subscription_plan,
-            'images_processed': self.images_processed,
+            'images_processed': images_processed,
             'images_limit': self.images_limit,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -59,7 +65,163 @@ class ProcessingJob(db.Model):
             'original_filename': self.original_filename,
             'file_size': self.file_size,
             'error_message': self.error_message,
+            'has_input': bool(self.input_path),
+            'has_output': bool(self.output_path),
+            'thumbnail_url': f'/api/jobs/{self.id}/thumbnail' if self.output_path else None,
+            'preview_url': f'/api/jobs/{self.id}/preview' if self.output_path else None,
+            'tiles_url': f'/api/jobs/{self.id}/tiles.dzi' if self.output_path else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+
+class JobQueueEntry(db.Model):
+    """Fila de jobs para os workers (parâmetros + lease do worker que o processa)"""
+    __tablename__ = 'job_queue'
+
+    job_id = db.Column(db.Integer, db.ForeignKey('processing_jobs.id'), primary_key=True)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON: scale, face_enhance, final_size
+    worker_id = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    job = db.relationship('ProcessingJob', backref=db.backref('queue_entry', uselist=False))
+
+class UsageEvent(db.Model):
+    """Registro append-only de uso (uma linha por imagem processada)"""
+    __tablename__ = 'usage_events'
+    __table_args__ = (
+        db.Index('ix_usage_events_user_period_id', 'user_id', 'period', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_id = db.Column(db.Integer, nullable=True)
+    period = db.Column(db.String(7), nullable=False)  # AAAA-MM
+    images = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UsageEventArchive(db.Model):
+    """Eventos de uso de períodos encerrados (mesmas colunas de UsageEvent, movidos na virada mensal)"""
+    __tablename__ = 'usage_events_archive'
+    __table_args__ = (
+        db.Index('ix_usage_events_archive_user_period', 'user_id', 'period'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # mesmo id do evento original
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    job_id = db.Column(db.Integer, nullable=True)
+    period = db.Column(db.String(7), nullable=False)
+    images = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UsageTotal(db.Model):
+    """Totais de uso por usuário e período, consolidados a partir de UsageEvent"""
+    __tablename__ = 'usage_totals'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='uq_usage_totals_user_period'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(7), nullable=False)
+    images = db.Column(db.Integer, nullable=False, default=0)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # último evento consolidado
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UsageCompactionState(db.Model):
+    """Marca d'água por id da consolidação (obsoleta: só lida uma vez, ver UsageCompactionCursor)"""
+    __tablename__ = 'usage_compaction_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UsageCompactionCursor(db.Model):
+    """Marca d'água global da consolidação do ledger de uso, por tempo (linha única)"""
+    __tablename__ = 'usage_compaction_cursor'
+
+    id = db.Column(db.Integer, primary_key=True)
+    compacted_until = db.Column(db.DateTime, nullable=False)  # eventos com created_at anterior já estão nos totais
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UsageRolloverState(db.Model):
+    """Progresso da virada mensal de cada período (permite retomar se interrompida)"""
+    __tablename__ = 'usage_rollover_state'
+
+    period = db.Column(db.String(7), primary_key=True)  # período encerrado, AAAA-MM
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)  # último usuário processado
+    event_watermark = db.Column(db.Integer, nullable=False, default=0)  # obsoleto: o arquivamento usa UsageCompactionCursor
+    events_archived = db.Column(db.Integer, nullable=False, default=0)  # movidos para usage_events_archive
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+class UploadSession(db.Model):
+    """Upload em partes (retomável): o arquivo é montado em disco a cada parte recebida"""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    filename = db.Column(db.String(255), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)  # checksum do arquivo inteiro, se informado
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # bytes gravados (próximo offset)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.total_size,
+            'offset': self.received,
+            'complete': self.received >= self.total_size,
+        }
+
+class JobMetrics(db.Model):
+    """Tempos de cada etapa e tamanhos de um job concluído (histórico para relatórios)"""
+    __tablename__ = 'job_metrics'
+
+    # Sem FK: o histórico sobrevive à remoção do job pela retenção
+    job_id = db.Column(db.Integer, primary_key=True)
+    plan = db.Column(db.String(50), nullable=True)
+    scale = db.Column(db.Integer, nullable=True)  # None = só reamostragem local
+    input_pixels = db.Column(db.BigInteger, nullable=True)  # pixels enviados ao modelo
+    output_pixels = db.Column(db.BigInteger, nullable=True)
+    # Segundos em cada etapa
+    preprocess = db.Column(db.Float, nullable=True)
+    queue = db.Column(db.Float, nullable=True)
+    predict = db.Column(db.Float, nullable=True)  # chamada completa, medida localmente
+    replicate_predict = db.Column(db.Float, nullable=True)  # predict_time reportado pelo Replicate
+    download = db.Column(db.Float, nullable=True)
+    delivery = db.Column(db.Float, nullable=True)  # codificação e envio da resposta
+    total = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class RateLimitBucket(db.Model):
+    """Token bucket compartilhado entre os nós (backend 'database' do rate limiter)"""
+    __tablename__ = 'rate_limit_buckets'
+
+    key = db.Column(db.String(150), primary_key=True)  # escopo:usuário ou escopo:ip
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)  # epoch (segundos)
+
+class JobEventLog(db.Model):
+    """Eventos de jobs publicados por qualquer processo (web, ASGI ou worker), repassados às conexões SSE"""
+    __tablename__ = 'job_event_log'
+
+    id = db.Column(db.Integer, primary_key=True)  # também é o id do evento no SSE
+    user_id = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(32), nullable=False)  # processo que publicou
+    payload = db.Column(db.Text, nullable=False)  # JSON do evento
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class TaskLease(db.Model):
+    """Lease de tarefas periódicas que devem rodar em um único processo (ex.: reconciliação)"""
+    __tablename__ = 'task_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)  # host:pid do processo que executa
+    expires_at = db.Column(db.DateTime, nullable=False)
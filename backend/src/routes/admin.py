@@ -0,0 +1,20 @@
+from flask import Blueprint, request, jsonify
+from src.services.admin import admin_required
+from src.services.job_metrics import latency_report, REPORT_GROUPS
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/latency-report', methods=['GET'])
+@admin_required
+def get_latency_report():
+    """
+    Percentis de latência por etapa (preprocess, fila, predição, download, entrega)
+
+    Query: days (padrão 30) e group_by (ex.: plan,scale,size)
+    """
+    days = request.args.get('days', type=int, default=30)
+    group_by = tuple(g for g in request.args.get('group_by', ','.join(REPORT_GROUPS)).split(',') if g)
+    invalid = [g for g in group_by if g not in REPORT_GROUPS]
+    if invalid or days <= 0:
+        return jsonify({'error': f"Parâmetros inválidos. group_by aceita: {', '.join(REPORT_GROUPS)}"}), 400
+    return jsonify(latency_report(days, group_by)), 200
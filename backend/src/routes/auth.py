@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from src.models.user import User, db
+from src.services.http_cache import conditional_json, etag_for
+from src.services.rate_limit import rate_limited
+from src.services.usage_ledger import get_usage_count
 import uuid
 import re
 
@@ -24,6 +27,7 @@ def validate_password(password):
     return True, "Senha válida"
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited('auth')
 def register():
     try:
         data = request.get_json()
@@ -73,7 +77,7 @@ def register():
                 'name': user.name,
                 'subscription_plan': user.subscription_plan,
                 'images_limit': user.images_limit,
-                'images_processed': user.images_processed
+                'images_processed': 0
             }
         }), 201
         
@@ -82,6 +86,7 @@ def register():
         return jsonify({'error': f'Erro no registro: {str(e)}'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited('auth')
 def login():
     try:
         data = request.get_json()
@@ -113,7 +118,7 @@ def login():
                 'name': user.name,
                 'subscription_plan': user.subscription_plan,
                 'images_limit': user.images_limit,
-                'images_processed': user.images_processed
+                'images_processed': get_usage_count(user.id)
             }
         }), 200
         
@@ -141,17 +146,21 @@ def get_profile():
         if not user:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         
-        return jsonify({
+        # ETag a partir dos campos do perfil: sem mudanças, responde 304 sem corpo
+        images_processed = get_usage_count(user.id)
+        etag = etag_for('profile', user.id, user.email, user.name, user.subscription_plan,
+                        user.images_limit, images_processed, user.created_at)
+        return conditional_json(etag, lambda: {
             'user': {
                 'id': user.id,
                 'email': user.email,
                 'name': user.name,
                 'subscription_plan': user.subscription_plan,
                 'images_limit': user.images_limit,
-                'images_processed': user.images_processed,
+                'images_processed': images_processed,
                 'created_at': user.created_at.isoformat() if user.created_at else None
             }
-        }), 200
+        })
         
     except Exception as e:
         return jsonify({'error': f'Erro ao buscar perfil: {str(e)}'}), 500
@@ -200,7 +209,7 @@ def update_profile():
                 'name': user.name,
                 'subscription_plan': user.subscription_plan,
                 'images_limit': user.images_limit,
-                'images_processed': user.images_processed
+                'images_processed': get_usage_count(user.id)
             }
         }), 200
         
@@ -223,7 +232,8 @@ def check_auth():
             session.clear()
             return jsonify({'authenticated': False}), 200
         
-        return jsonify({
+        images_processed = get_usage_count(user.id)
+        payload = lambda: {
             'authenticated': True,
             'user': {
                 'id': user.id,
@@ -231,9 +241,14 @@ def check_auth():
                 'name': user.name,
                 'subscription_plan': user.subscription_plan,
                 'images_limit': user.images_limit,
-                'images_processed': user.images_processed
+                'images_processed': images_processed
             }
-        }), 200
+        }
+        if request.method != 'GET':
+            return jsonify(payload()), 200
+        etag = etag_for('check-auth', user.id, user.email, user.name, user.subscription_plan,
+                        user.images_limit, images_processed)
+        return conditional_json(etag, payload)
         
     except Exception as e:
         return jsonify({'error': f'Erro ao verificar autenticação: {str(e)}'}), 500
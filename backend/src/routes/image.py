@@ -1,13 +1,11 @@
 import os
-import io
-import base64
-import time
-from flask import Blueprint, request, jsonify, send_file
-from PIL import Image
-import replicate
-import tempfile
-import numpy as np # Certifique-se de que numpy está importado
-import requests # <--- IMPORTANTE: GARANTA QUE ESTA LINHA ESTÁ AQUI NO TOPO!
+from flask import Blueprint, request, jsonify, session, current_app
+from src.services.replicate_service import get_cached_health
+from src.services.rate_limit import rate_limited
+from src.services.upload_service import MAX_UPLOAD_BYTES, parse_upload_options, process_upload
+from src.services.chunked_upload import (
+    MAX_CHUNK_BYTES, UploadError, create_session, get_session, write_chunk, verify_complete, discard_session
+)
 
 image_bp = Blueprint('image', __name__)
 
@@ -15,12 +13,34 @@ image_bp = Blueprint('image', __name__)
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
 
-# Definir um limite máximo de pixels para evitar erros de memória na GPU do Replicate
-# O limite de 2096784 pixels é para o modelo Real-ESRGAN.
-MAX_PIXELS = 2000000 # Um pouco abaixo do limite para ter margem de segurança
+def upload_response(result):
+    """Converte o UploadResult do serviço de upload numa resposta Flask"""
+    response = jsonify(result.payload)
+    response.headers.update(result.headers)
+    return response, result.status_code
+
+def run_upload(stream, filename):
+    """Processa o upload com os parâmetros de request.form (scale, face_enhance, target_*, async)"""
+    try:
+        options = parse_upload_options(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return upload_response(process_upload(stream, filename, options, session.get('user_id')))
+
+@image_bp.route('/health', methods=['GET'])
+def health():
+    """Health check barato para load balancers (usa o estado em cache)"""
+    state = get_cached_health()
+    status_code = 503 if state['breaker']['state'] == 'open' else 200
+    return jsonify(state), status_code
 
 @image_bp.route('/upload', methods=['POST'])
+@rate_limited('upload')
 def upload_image():
+    # Recusa pelo Content-Length antes de ler o corpo
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Arquivo muito grande. O máximo é {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."}), 413
+
     if 'image' not in request.files:
         return jsonify({"error": "Nenhuma imagem fornecida"}), 400
 
@@ -28,75 +48,89 @@ def upload_image():
     if file.filename == '':
         return jsonify({"error": "Nenhum arquivo selecionado"}), 400
 
+    return run_upload(file.stream, file.filename)
+
+def upload_error(e):
+    response = jsonify({"error": str(e), "offset": e.offset})
+    if e.offset is not None:
+        response.headers['Upload-Offset'] = str(e.offset)
+    return response, e.status_code
+
+@image_bp.route('/uploads', methods=['POST'])
+@rate_limited('upload')
+def create_upload():
+    """
+    Inicia um upload em partes (retomável)
+
+    Corpo JSON: filename, size (bytes) e, opcionalmente, sha256 do arquivo.
+    Em seguida o cliente envia as partes com PUT /uploads/<id> (header
+    Upload-Offset) e finaliza com POST /uploads/<id>/complete, que recebe os
+    mesmos parâmetros de /upload.
+    """
+    data = request.get_json(silent=True) or {}
     try:
-        # Ler a imagem e converter para RGB
-        img = Image.open(io.BytesIO(file.read())).convert("RGB")
-        original_width, original_height = img.size
-        print(f"Dimensões originais da imagem: {original_width}x{original_height} pixels")
-
-        # Redimensionar se exceder o MAX_PIXELS
-        if original_width * original_height > MAX_PIXELS:
-            ratio = (MAX_PIXELS / (original_width * original_height))**0.5
-            new_width = int(original_width * ratio)
-            new_height = int(original_height * ratio)
-            img = img.resize((new_width, new_height), Image.LANCZOS)
-            print(f"Imagem redimensionada para: {new_width}x{new_height} pixels (total: {new_width * new_height} pixels)")
-        else:
-            print(f"Imagem dentro do limite de pixels. Total: {original_width * original_height} pixels")
-
-        # Salvar a imagem redimensionada em um buffer para enviar ao Replicate
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        # Parâmetros de regulagem do frontend
-        scale = request.form.get('scale', type=int, default=2)
-        face_enhance = request.form.get('face_enhance', type=bool, default=False)
-
-        print(f"Parâmetros recebidos do frontend: scale={scale}, face_enhance={face_enhance}")
-
-        # Salvar temporariamente a imagem para o Replicate
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_img_file:
-            temp_img_file.write(img_byte_arr)
-            temp_img_path = temp_img_file.name
-
-        print(f"Imagem temporária criada em: {temp_img_path}")
-
-        # Chamar a API do Replicate
-        print("Iniciando processamento Replicate...")
-        output = replicate.run(
-            "nightmareai/real-esrgan:42fed1c4974146d4d2414e2be2c5277c7fdb0ef3c0669c590548134787689c5299b",
-            input={
-                "image": open(temp_img_path, "rb"),
-                "scale": scale,
-                "face_enhance": face_enhance,
-            }
-        )
-        output_url = output
-
-        print(f"Processamento Replicate concluído. Output URL: {output_url}")
-
-        # Remover o arquivo temporário
-        os.unlink(temp_img_path)
-
-        # Baixar a imagem processada
-        response = requests.get(output_url)
-        response.raise_for_status() # Levanta um erro para status HTTP ruins (4xx ou 5xx)
-
-        # Retornar a imagem como base64
-        encoded_image = base64.b64encode(response.content).decode('utf-8')
-        return jsonify({"image": encoded_image})
-
-    except replicate.exceptions.ModelError as e:
-        print(f"Erro do Replicate (ModelError): {e}")
-        # Captura o erro específico de modelo do Replicate
-        return jsonify({"error": f"Erro no processamento da imagem: {e}. Por favor, tente com uma imagem menor ou de menor resolução."}), 400
-    except requests.exceptions.RequestException as e:
-        print(f"Erro de requisição HTTP: {e}")
-        # Captura erros de rede ou HTTP ao baixar a imagem do Replicate
-        return jsonify({"error": f"Erro ao baixar a imagem processada: {e}"}), 500
-    except Exception as e:
-        print(f"Erro inesperado no upload: {e}")
-        # Captura qualquer outro erro inesperado
-        return jsonify({"error": f"Ocorreu um erro inesperado: {e}"}), 500
-
+        upload = create_session(session.get('user_id'), data.get('filename'), data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return upload_error(e)
+    response = jsonify({**upload.to_dict(), "chunk_size": MAX_CHUNK_BYTES})
+    response.headers['Location'] = f"/api/uploads/{upload.id}"
+    return response, 201
+
+@image_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Estado do upload: o cliente retoma a partir de `offset`"""
+    upload = get_session(upload_id, session.get('user_id'))
+    if upload is None:
+        return jsonify({"error": "Upload não encontrado"}), 404
+    response = jsonify(upload.to_dict())
+    response.headers['Upload-Offset'] = str(upload.received)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@image_bp.route('/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Recebe uma parte (corpo cru) a partir do offset do header Upload-Offset"""
+    upload = get_session(upload_id, session.get('user_id'))
+    if upload is None:
+        return jsonify({"error": "Upload não encontrado"}), 404
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({"error": "Header Upload-Offset obrigatório"}), 400
+    try:
+        received = write_chunk(upload, offset, request.stream, request.content_length,
+                               request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return upload_error(e)
+    response = jsonify({"upload_id": upload_id, "offset": received})
+    response.headers['Upload-Offset'] = str(received)
+    return response
+
+@image_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    upload = get_session(upload_id, session.get('user_id'))
+    if upload is None:
+        return jsonify({"error": "Upload não encontrado"}), 404
+    discard_session(upload)
+    return '', 204
+
+@image_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """
+    Confere o arquivo montado e o processa como um upload normal
+
+    Sem @rate_limited: o token do upload já foi cobrado em POST /uploads.
+    """
+    upload = get_session(upload_id, session.get('user_id'))
+    if upload is None:
+        return jsonify({"error": "Upload não encontrado"}), 404
+    try:
+        path = verify_complete(upload)
+    except UploadError as e:
+        return upload_error(e)
+
+    with open(path, 'rb') as stream:
+        response = current_app.make_response(run_upload(stream, upload.filename))
+    # Erros temporários (ex.: 503 por sobrecarga) mantêm o arquivo para nova tentativa
+    if response.status_code < 500:
+        discard_session(upload)
+    return response
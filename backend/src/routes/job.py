@@ -0,0 +1,255 @@
+from flask import Blueprint, Response, request, jsonify, session, send_file
+from src.models.user import ProcessingJob
+from concurrent.futures import TimeoutError as FutureTimeout
+from src.services.artifact_store import artifact_store
+from src.services.thumbnail_service import get_preview
+from src.services.tile_service import descriptor_key, tile_key, schedule_tiles, schedule_level, valid_tile
+from src.services.format_service import negotiate, get_converted
+from src.services.job_events import job_events, active_jobs_snapshot, format_sse
+
+job_bp = Blueprint('job', __name__)
+
+# Intervalo do comentário keep-alive do SSE (mantém proxies e balanceadores com a conexão aberta)
+SSE_KEEPALIVE = 15
+
+MIMETYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'gif': 'image/gif',
+    'avif': 'image/avif',
+    'dzi': 'application/xml',
+}
+
+def get_owned_job(job_id):
+    """Busca um job do usuário da sessão; retorna (job, resposta_de_erro)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, (jsonify({'error': 'Usuário não autenticado'}), 401)
+
+    job = ProcessingJob.query.get(job_id)
+    if not job or str(job.user_id) != str(user_id):
+        return None, (jsonify({'error': 'Job não encontrado'}), 404)
+
+    return job, None
+
+def send_artifact(key, download_name=None):
+    """
+    Envia um artefato do disco (sendfile via wsgi.file_wrapper, suporte a Range)
+
+    As URLs são por job (/api/jobs/<id>/...), não pelo conteúdo, e exigem a
+    sessão: só o navegador do dono guarda a resposta (private) e revalida a
+    cada uso pelo ETag (no-cache), recebendo 304 se nada mudou. Assim uma saída
+    regenerada na mesma URL nunca é servida velha.
+    """
+    if not key or not artifact_store.exists(key):
+        return jsonify({'error': 'Arquivo não disponível (expirado ou removido)'}), 410
+
+    artifact_store.touch(key)
+    ext = key.rsplit('.', 1)[-1].lower()
+    response = send_file(
+        artifact_store.path_for(key),
+        mimetype=MIMETYPES.get(ext, 'application/octet-stream'),
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        max_age=None
+    )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+@job_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Lista os jobs do usuário autenticado"""
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Usuário não autenticado'}), 401
+
+        jobs = (
+            ProcessingJob.query.filter_by(user_id=user_id)
+            .order_by(ProcessingJob.created_at.desc())
+            .limit(100)
+            .all()
+        )
+        return jsonify({'jobs': [job.to_dict() for job in jobs]}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Erro ao buscar jobs: {str(e)}'}), 500
+
+@job_bp.route('/jobs/events', methods=['GET'])
+def job_events_stream():
+    """
+    Stream SSE com as transições de status dos jobs do usuário
+
+    Substitui o polling por job: uma única conexão por cliente recebe os eventos
+    (uploaded, queued, processing, downloading, completed/failed, com tempos).
+    Ao conectar, envia um snapshot dos jobs ainda em andamento.
+
+    Em produção o stream é servido pela app ASGI (src/asgi.py), em asyncio,
+    antes de chegar ao Flask. Esta versão fica para o servidor de
+    desenvolvimento e para deploys só WSGI: cada conexão ocupa uma thread
+    (ou um worker síncrono do gunicorn) enquanto estiver aberta.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Usuário não autenticado'}), 401
+
+    # Assina antes do snapshot: uma transição entre os dois chega como evento
+    subscription = job_events.subscribe(user_id)
+    try:
+        snapshot = active_jobs_snapshot(user_id)
+    except Exception:
+        job_events.unsubscribe(subscription)
+        raise
+
+    def stream():
+        try:
+            yield "retry: 3000\n" + format_sse(snapshot, 'snapshot')
+            while True:
+                events = subscription.wait(SSE_KEEPALIVE)
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            job_events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@job_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Retorna os dados de um job"""
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+    return jsonify({'job': job.to_dict()}), 200
+
+@job_bp.route('/jobs/<int:job_id>/input', methods=['GET'])
+def get_job_input(job_id):
+    """Baixa a imagem de entrada de um job"""
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+    return send_artifact(job.input_path)
+
+@job_bp.route('/jobs/<int:job_id>/output', methods=['GET'])
+def get_job_output(job_id):
+    """
+    Baixa a imagem processada de um job
+
+    Aceita ?format=webp|jpeg|avif|original|auto e ?quality=1-100; sem format,
+    entrega o original. Com format=auto, o formato é negociado pelo cabeçalho
+    Accept. Cada variante é convertida uma única vez e servida do cache nas
+    requisições seguintes.
+    """
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+
+    try:
+        output_format, from_accept = negotiate(request.args.get('format'), request.headers.get('Accept'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not artifact_store.exists(job.output_path):
+        return send_artifact(job.output_path)
+
+    if output_format is None:
+        response = send_artifact(job.output_path)
+    else:
+        try:
+            key = get_converted(job.output_path, output_format, request.args.get('quality', type=int))
+        except FutureTimeout:
+            response = jsonify({'error': 'Conversão em andamento, tente novamente em instantes'})
+            response.headers['Retry-After'] = '2'
+            return response, 503
+        except Exception as e:
+            return jsonify({'error': f'Erro ao converter imagem: {str(e)}'}), 500
+        response = send_artifact(key)
+
+    if from_accept:
+        # A mesma URL entrega formatos diferentes conforme o Accept
+        response.vary.add('Accept')
+    return response
+
+@job_bp.route('/jobs/<int:job_id>/thumbnail', methods=['GET'])
+@job_bp.route('/jobs/<int:job_id>/preview', methods=['GET'], defaults={'variant': 'preview'})
+def get_job_preview(job_id, variant='thumb'):
+    """Retorna a miniatura (ou preview média) WebP da saída de um job"""
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+
+    try:
+        key = get_preview(job.output_path, variant)
+    except FutureTimeout:
+        response = jsonify({'error': 'Preview em geração, tente novamente em instantes'})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    except Exception as e:
+        return jsonify({'error': f'Erro ao gerar preview: {str(e)}'}), 500
+
+    return send_artifact(key)
+
+def tiles_generating(source_key, level=None):
+    """
+    Agenda a pirâmide (ou só um nível, se ela já existe) e responde 202 até ficar pronta
+    """
+    if level is None:
+        schedule_tiles(source_key, force=True)
+    else:
+        schedule_level(source_key, level)
+    response = jsonify({'status': 'generating'})
+    response.headers['Retry-After'] = '5'
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 202
+
+@job_bp.route('/jobs/<int:job_id>/tiles.dzi', methods=['GET'])
+def get_job_tiles(job_id):
+    """
+    Descritor Deep Zoom (DZI) da saída de um job
+
+    Os tiles ficam em tiles_files/<nível>/<coluna>_<linha>.webp, relativo a esta
+    URL (o layout que o OpenSeadragon espera). Se a pirâmide ainda não existir,
+    ela é gerada em background e a resposta é 202 com Retry-After.
+    """
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+    if not job.output_path or not artifact_store.exists(job.output_path):
+        return jsonify({'error': 'Arquivo não disponível (expirado ou removido)'}), 410
+
+    key = descriptor_key(job.output_path)
+    if not artifact_store.exists(key):
+        return tiles_generating(job.output_path)
+    return send_artifact(key)
+
+@job_bp.route('/jobs/<int:job_id>/tiles_files/<int:level>/<int:col>_<int:row>.webp', methods=['GET'])
+def get_job_tile(job_id, level, col, row):
+    """Um tile da pirâmide"""
+    job, error = get_owned_job(job_id)
+    if error:
+        return error
+    if not job.output_path:
+        return jsonify({'error': 'Arquivo não disponível (expirado ou removido)'}), 410
+
+    key = tile_key(job.output_path, level, col, row)
+    if not artifact_store.exists(key):
+        if not artifact_store.exists(job.output_path):
+            return jsonify({'error': 'Arquivo não disponível (expirado ou removido)'}), 410
+        valid = valid_tile(job.output_path, level, col, row)
+        if valid is False:
+            return jsonify({'error': 'Tile não encontrado'}), 404
+        if valid is None:
+            # Pirâmide ainda não gerada
+            return tiles_generating(job.output_path)
+        # Tile removido pela eviction do armazenamento: só os tiles que faltam no nível
+        return tiles_generating(job.output_path, level)
+    return send_artifact(key)
@@ -1,59 +1,20 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import User, db
+from src.services.usage_ledger import get_usage_count
+from src.services.http_cache import StaticJSON, conditional_json, etag_for
+from src.services.plans import PLANS
 import uuid
 
 payment_bp = Blueprint('payment', __name__)
 
-# Configurações dos planos
-PLANS = {
-    'basic': {
-        'name': 'Básico',
-        'price': 29.00,
-        'currency': 'BRL',
-        'images_limit': 50,
-        'features': [
-            '50 imagens por mês',
-            'Resolução até 4K',
-            'Suporte por email',
-            'Processamento padrão'
-        ]
-    },
-    'pro': {
-        'name': 'Pro',
-        'price': 79.00,
-        'currency': 'BRL',
-        'images_limit': 200,
-        'features': [
-            '200 imagens por mês',
-            'Resolução até 8K',
-            'Suporte prioritário',
-            'Processamento rápido',
-            'API de integração'
-        ]
-    },
-    'enterprise': {
-        'name': 'Empresarial',
-        'price': 199.00,
-        'currency': 'BRL',
-        'images_limit': -1,  # Ilimitado
-        'features': [
-            'Imagens ilimitadas',
-            'Resolução até 16K',
-            'Suporte 24/7',
-            'Processamento ultra-rápido',
-            'API completa',
-            'Gerenciamento de equipe'
-        ]
-    }
-}
+# Os planos são estáticos: serializados uma vez, com ETag fixa
+PLANS_RESPONSE = StaticJSON({'plans': PLANS})
 
 @payment_bp.route('/plans', methods=['GET'])
 def get_plans():
     """Retorna todos os planos disponíveis"""
     try:
-        return jsonify({
-            'plans': PLANS
-        }), 200
+        return PLANS_RESPONSE.response()
     except Exception as e:
         return jsonify({'error': f'Erro ao buscar planos: {str(e)}'}), 500
 
@@ -168,15 +129,17 @@ def get_subscription():
             'features': ['5 imagens por mês', 'Resolução até 2K']
         })
         
-        return jsonify({
+        images_processed = get_usage_count(user.id)
+        etag = etag_for('subscription', user.id, user.subscription_plan, images_processed, user.images_limit)
+        return conditional_json(etag, lambda: {
             'subscription': {
                 'plan': user.subscription_plan,
                 'plan_name': plan_info['name'],
-                'images_processed': user.images_processed,
+                'images_processed': images_processed,
                 'images_limit': user.images_limit,
                 'status': 'active' if user.subscription_plan != 'free' else 'free'
             }
-        }), 200
+        })
         
     except Exception as e:
         return jsonify({'error': f'Erro ao buscar assinatura: {str(e)}'}), 500
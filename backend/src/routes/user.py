@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import User, db
+from src.services.usage_ledger import get_usage_count, get_usage_counts, current_period, reset_usage_count
 import uuid
 
 user_bp = Blueprint('user', __name__)
@@ -15,7 +16,9 @@ def get_users():
         
         # Em produção, adicionar verificação de admin
         users = User.query.all()
-        users_data = [user.to_dict() for user in users]
+        # Uso de todos os usuários em lote (sem uma consulta por usuário)
+        usage = get_usage_counts(user.id for user in users)
+        users_data = [user.to_dict(images_processed=usage[user.id]) for user in users]
         
         return jsonify({
             'users': users_data,
@@ -178,18 +181,20 @@ def get_usage(user_id):
         if not user:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         
-        # Calcular estatísticas
-        remaining_images = max(0, user.images_limit - user.images_processed) if user.images_limit > 0 else -1
-        usage_percentage = (user.images_processed / user.images_limit * 100) if user.images_limit > 0 else 0
+        # Calcular estatísticas (total consolidado do ledger + eventos recentes)
+        images_processed = get_usage_count(user.id)
+        remaining_images = max(0, user.images_limit - images_processed) if user.images_limit > 0 else -1
+        usage_percentage = (images_processed / user.images_limit * 100) if user.images_limit > 0 else 0
         
         return jsonify({
             'user_id': user.id,
             'subscription_plan': user.subscription_plan,
-            'images_processed': user.images_processed,
+            'period': current_period(),
+            'images_processed': images_processed,
             'images_limit': user.images_limit,
             'remaining_images': remaining_images,
             'usage_percentage': round(usage_percentage, 2),
-            'can_process_more': user.can_process_image()
+            'can_process_more': user.images_limit < 0 or images_processed < user.images_limit
         }), 200
         
     except Exception as e:
@@ -208,9 +213,8 @@ def reset_usage(user_id):
         if not user:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         
-        # Resetar contador
-        user.images_processed = 0
-        db.session.commit()
+        # Resetar contador: ajuste no ledger de uso (o histórico é mantido)
+        reset_usage_count(user.id)
         
         return jsonify({
             'message': 'Contador de uso resetado com sucesso',
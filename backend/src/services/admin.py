@@ -0,0 +1,24 @@
+import hmac
+import os
+from functools import wraps
+from flask import request, jsonify
+
+# Token compartilhado para as ferramentas operacionais (header X-Admin-Token);
+# sem token configurado, nenhuma requisição é considerada de admin
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+def is_admin_request():
+    """Verifica se a requisição traz o token de admin"""
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+
+def admin_required(view):
+    """Restringe a rota a requisições com o token de admin"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Acesso restrito'}), 403
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,191 @@
+import os
+import tempfile
+import numpy as np
+from PIL import Image, ImageSequence
+
+# Limites para entradas animadas: cada quadro único vira uma predição no Replicate
+MAX_ANIMATION_FRAMES = int(os.environ.get('MAX_ANIMATION_FRAMES', 300))
+MAX_FRAME_PIXELS = int(os.environ.get('MAX_ANIMATION_FRAME_PIXELS', 500000))
+MAX_ANIMATION_OUTPUT_PIXELS = int(os.environ.get('MAX_ANIMATION_OUTPUT_PIXELS', 200000000))
+
+# Pixels decodificados somados de todos os quadros (após a redução a
+# MAX_FRAME_PIXELS); verificado pelo cabeçalho antes de decodificar
+MAX_ANIMATION_INPUT_PIXELS = int(os.environ.get('MAX_ANIMATION_INPUT_PIXELS', 30000000))
+
+# Dois quadros são o mesmo se nenhum pixel difere mais que DEDUP_PIXEL_TOLERANCE
+# (por canal, 0-255) além de no máximo DEDUP_MAX_CHANGED_PIXELS pixels. A
+# comparação é por pixel, não pela média do quadro: um cursor piscando ou um
+# spinner pequeno mudam poucos pixels e não podem ser descartados.
+DEDUP_PIXEL_TOLERANCE = int(os.environ.get('ANIMATION_DEDUP_PIXEL_TOLERANCE', 4))
+DEDUP_MAX_CHANGED_PIXELS = int(os.environ.get('ANIMATION_DEDUP_MAX_CHANGED_PIXELS', 0))
+
+# Lado da miniatura usada para escolher os candidatos entre os quadros únicos
+SIGNATURE_SIZE = 32
+
+# Candidatos (os mais próximos pela miniatura) conferidos na resolução cheia
+DEDUP_CANDIDATES = 3
+
+# Formatos animados aceitos e o formato de saída correspondente
+ANIMATED_FORMATS = {'GIF': 'gif', 'WEBP': 'webp', 'PNG': 'png'}
+
+
+class AnimationTooLarge(Exception):
+    """Animação acima dos limites de quadros/pixels"""
+
+
+def is_animated(stream):
+    """Verifica (só pelo cabeçalho) se o arquivo enviado tem mais de um quadro"""
+    position = stream.tell()
+    try:
+        with Image.open(stream) as img:
+            return img.format in ANIMATED_FORMATS and getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False
+    finally:
+        stream.seek(position)
+
+
+def is_animated_file(path):
+    """is_animated para um arquivo em disco (ex.: uma saída no armazenamento)"""
+    try:
+        with open(path, 'rb') as f:
+            return is_animated(f)
+    except OSError:
+        return False
+
+
+def frame_size(img):
+    """Tamanho em que os quadros são processados (reduzido a MAX_FRAME_PIXELS)"""
+    width, height = img.size
+    if width * height <= MAX_FRAME_PIXELS:
+        return width, height
+    ratio = (MAX_FRAME_PIXELS / (width * height)) ** 0.5
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def check_input_budget(img, max_input_pixels):
+    """
+    Recusa animações grandes demais usando só o cabeçalho (antes de decodificar)
+
+    Args:
+        img (Image): Animação aberta (ainda não decodificada)
+        max_input_pixels (int): Limite de pixels por quadro (o mesmo das imagens estáticas)
+    """
+    width, height = img.size
+    n_frames = getattr(img, 'n_frames', 1)
+    if width * height > max_input_pixels:
+        raise AnimationTooLarge(f"Animação muito grande ({width}x{height}). O máximo é {max_input_pixels} pixels.")
+    if n_frames > MAX_ANIMATION_FRAMES:
+        raise AnimationTooLarge(f"Animação com {n_frames} quadros. O máximo é {MAX_ANIMATION_FRAMES}.")
+    processed_width, processed_height = frame_size(img)
+    if processed_width * processed_height * n_frames > MAX_ANIMATION_INPUT_PIXELS:
+        raise AnimationTooLarge(
+            f"Animação muito grande ({n_frames} quadros de {width}x{height}). "
+            f"Reduza o tamanho ou o número de quadros."
+        )
+
+
+def _signature(frame):
+    return np.asarray(frame.resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR), dtype=np.int16)
+
+
+def same_frame(a, b, pixel_tolerance=DEDUP_PIXEL_TOLERANCE, max_changed=DEDUP_MAX_CHANGED_PIXELS):
+    """Compara dois quadros (arrays HxWx3) pixel a pixel: poucos pixels diferentes bastam para distingui-los"""
+    changed = (np.abs(a - b).max(axis=2) > pixel_tolerance).sum()
+    return int(changed) <= max_changed
+
+
+def extract_unique_frames(img):
+    """
+    Decodifica a animação mantendo na memória só os quadros únicos
+
+    Cada quadro (já composto, em RGB, reduzido a MAX_FRAME_PIXELS) é comparado
+    com os quadros únicos já vistos: as miniaturas escolhem os candidatos mais
+    próximos (vetorizado) e a igualdade é confirmada pixel a pixel na resolução
+    cheia (same_frame). Quadros repetidos são descartados logo após a leitura.
+
+    Returns:
+        tuple: (quadros únicos, índice do único de cada quadro, durações em ms, loop, formato de saída)
+    """
+    size = frame_size(img)
+    unique = []
+    signatures = []
+    mapping = []
+    durations = []
+    default_duration = img.info.get('duration', 100)
+    for frame in ImageSequence.Iterator(img):
+        durations.append(frame.info.get('duration', default_duration) or default_duration)
+        rgb = frame.convert('RGB')
+        if rgb.size != size:
+            rgb = rgb.resize(size, Image.LANCZOS)
+        array = np.asarray(rgb, dtype=np.int16)
+        signature = _signature(rgb)
+
+        match = None
+        if signatures:
+            distances = np.abs(np.stack(signatures) - signature).max(axis=(1, 2, 3))
+            for candidate in np.argsort(distances, kind='stable')[:DEDUP_CANDIDATES]:
+                if same_frame(np.asarray(unique[candidate], dtype=np.int16), array):
+                    match = int(candidate)
+                    break
+        if match is None:
+            unique.append(rgb)
+            signatures.append(signature)
+            match = len(unique) - 1
+        mapping.append(match)
+    return unique, mapping, durations, img.info.get('loop', 0), ANIMATED_FORMATS[img.format]
+
+
+def check_output_budget(size, unique_count, scale):
+    """Recusa animações cuja saída (quadros únicos ampliados) não cabe na memória"""
+    output_pixels = size[0] * size[1] * scale ** 2 * unique_count
+    if output_pixels > MAX_ANIMATION_OUTPUT_PIXELS:
+        raise AnimationTooLarge(
+            f"Animação muito grande para ampliar {scale}x ({unique_count} quadros únicos). "
+            f"Reduza a escala, o tamanho ou o número de quadros."
+        )
+
+
+def assemble(unique_outputs, mapping, durations, loop, ext):
+    """
+    Remonta a animação com os quadros ampliados e a temporização original
+
+    Quadros repetidos em sequência viram um só quadro com a soma das durações.
+
+    Args:
+        unique_outputs (list): Caminhos dos quadros únicos ampliados
+        mapping (list): Índice do quadro único de cada quadro original
+        durations (list): Duração de cada quadro original (ms)
+        loop (int): Repetições (0 = infinito)
+        ext (str): Formato de saída (gif, webp ou png)
+
+    Returns:
+        str: Caminho do arquivo temporário com a animação
+    """
+    images = []
+    for path in unique_outputs:
+        with Image.open(path) as output:
+            frame = output.convert('RGB')
+        # GIF é paletizado de qualquer forma; quantizar já reduz a memória a 1/3
+        images.append(frame.quantize(256) if ext == 'gif' else frame)
+
+    sequence = []
+    sequence_durations = []
+    for index, duration in zip(mapping, durations):
+        if sequence and sequence[-1] == index:
+            sequence_durations[-1] += duration
+        else:
+            sequence.append(index)
+            sequence_durations.append(duration)
+
+    frames = [images[index] for index in sequence]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{ext}') as output_file:
+        frames[0].save(
+            output_file,
+            format=ext.upper(),
+            save_all=True,
+            append_images=frames[1:],
+            duration=sequence_durations,
+            loop=loop,
+        )
+        return output_file.name
@@ -0,0 +1,292 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Retenção (em dias) dos artefatos de cada plano
+RETENTION_DAYS = {
+    'free': 1,
+    'basic': 7,
+    'pro': 30,
+    'enterprise': 90,
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+def retention_days(plan):
+    """Retorna a retenção (em dias) dos artefatos do plano informado"""
+    return RETENTION_DAYS.get(plan, RETENTION_DAYS['free'])
+
+
+class ArtifactStore:
+    """
+    Armazenamento local de artefatos (entradas e saídas dos jobs)
+
+    Os arquivos são endereçados pelo SHA-256 do conteúdo e distribuídos em
+    subdiretórios de dois níveis (ab/cd/abcd...png) para não concentrar milhares
+    de arquivos num único diretório. O tamanho total é limitado; quando o limite
+    é ultrapassado, os arquivos acessados há mais tempo são removidos (LRU, usando
+    o mtime como marca de último acesso).
+
+    A gravação não mede nem limpa o armazenamento: evict() roda numa tarefa em
+    background (retention.start_artifact_evictor), em um único processo, sobre
+    a árvore compartilhada, então o orçamento vale para todos os workers.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._usage = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        root = os.environ.get(
+            'ARTIFACT_ROOT',
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'artifacts')
+        )
+        max_bytes = int(os.environ.get('ARTIFACT_MAX_BYTES', 10 * 1024 ** 3))
+        return cls(root, max_bytes)
+
+    @staticmethod
+    def key_for(digest, ext):
+        """Monta a chave relativa (sharded) para um hash de conteúdo"""
+        ext = ext.lower().lstrip('.')
+        return os.path.join(digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    @staticmethod
+    def variant_key(source_key, variant, ext):
+        """
+        Chave de um artefato derivado (miniatura, formato convertido...) de outro artefato
+
+        Fica no mesmo shard da origem, então não precisa de coluna extra no banco:
+        ab/cd/<hash>.png -> ab/cd/<hash>.<variante>.<ext>
+        """
+        base = source_key.split('.', 1)[0]
+        return f"{base}.{variant}.{ext.lower().lstrip('.')}"
+
+    @staticmethod
+    def variant_dir(source_key, variant):
+        """
+        Diretório de um conjunto grande de derivados (ex.: tiles), ao lado da origem
+
+        ab/cd/<hash>.png -> ab/cd/<hash>.<variante>/ (subdiretórios e nomes ficam
+        a cargo de quem grava, com put_key); removido por delete_with_variants.
+        """
+        return f"{source_key.split('.', 1)[0]}.{variant}"
+
+    def put_variant(self, source_key, variant, ext, data):
+        """Armazena os bytes de um artefato derivado e retorna sua chave"""
+        return self.put_key(self.variant_key(source_key, variant, ext), data)
+
+    def put_key(self, key, data):
+        """Armazena bytes numa chave já montada (derivados) e retorna a chave"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self._commit(tmp_path, path, len(data))
+        return key
+
+    def path_for(self, key):
+        """Caminho absoluto de uma chave; recusa chaves que escapem da raiz"""
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.realpath(self.root) + os.sep):
+            raise ValueError(f"Chave de artefato inválida: {key}")
+        return path
+
+    def exists(self, key):
+        return bool(key) and os.path.isfile(self.path_for(key))
+
+    def put_bytes(self, data, ext):
+        """Armazena bytes e retorna a chave do artefato"""
+        digest = hashlib.sha256(data).hexdigest()
+        key = self.key_for(digest, ext)
+        path = self.path_for(key)
+        if os.path.exists(path):
+            self.touch(key)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self._commit(tmp_path, path, len(data))
+        return key
+
+    def put_stream(self, stream, ext):
+        """
+        Armazena o conteúdo de um stream (ex.: upload) copiando em blocos
+
+        Returns:
+            tuple: (chave do artefato, tamanho em bytes)
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return self.put_file(tmp_path, ext, move=True), size
+
+    def put_file(self, src_path, ext, move=False):
+        """
+        Armazena um arquivo existente em disco sem carregá-lo inteiro na memória
+
+        Args:
+            src_path (str): Caminho do arquivo de origem
+            ext (str): Extensão do artefato
+            move (bool): Se True, move o arquivo em vez de copiá-lo
+
+        Returns:
+            str: Chave do artefato
+        """
+        sha = hashlib.sha256()
+        with open(src_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        key = self.key_for(sha.hexdigest(), ext)
+        path = self.path_for(key)
+        if os.path.exists(path):
+            self.touch(key)
+            if move:
+                os.unlink(src_path)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(src_path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        os.close(fd)
+        if move:
+            shutil.move(src_path, tmp_path)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        self._commit(tmp_path, path, size)
+        return key
+
+    def _commit(self, tmp_path, path, size):
+        # os.replace é atômico: leitores nunca veem um arquivo pela metade
+        os.replace(tmp_path, path)
+
+    def touch(self, key):
+        """Marca o artefato como acessado agora (usado pela ordem LRU)"""
+        try:
+            os.utime(self.path_for(key))
+        except OSError:
+            pass
+
+    def delete(self, key):
+        """Remove um artefato; retorna o número de bytes liberados"""
+        path = self.path_for(key)
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return 0
+        return size
+
+    def delete_with_variants(self, key):
+        """Remove um artefato e todos os seus derivados; retorna os bytes liberados"""
+        base = os.path.basename(key).split('.', 1)[0]
+        shard = os.path.dirname(self.path_for(key))
+        freed = 0
+        try:
+            names = os.listdir(shard)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.startswith(base + '.') or name.endswith('.part'):
+                continue
+            path = os.path.join(shard, name)
+            if os.path.isdir(path):
+                freed += self._delete_tree(path)
+            else:
+                freed += self.delete(os.path.join(os.path.dirname(key), name))
+        return freed
+
+    def _delete_tree(self, path):
+        freed = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    freed += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        shutil.rmtree(path, ignore_errors=True)
+        return freed
+
+    def _scan(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, protected=(), min_age=0, target_ratio=0.9):
+        """
+        Remove os artefatos menos recentemente usados até ficar abaixo do orçamento
+
+        Args:
+            protected (iterable): Chaves que não podem sair (ex.: entradas de jobs
+                ainda na fila); os derivados delas (mesmo hash) também ficam
+            min_age (float): Arquivos gravados/acessados há menos segundos que isso
+                ficam (o job que os referencia pode ainda não ter sido gravado)
+            target_ratio (float): Fração do orçamento a atingir
+
+        Returns:
+            int: Bytes liberados
+        """
+        protected_bases = {os.path.basename(key).split('.', 1)[0] for key in protected if key}
+        root = os.path.realpath(self.root)
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * target_ratio
+            cutoff = time.time() - min_age
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= target or mtime > cutoff:
+                    break
+                # Tiles ficam em <hash>.tiles/<nível>/: o hash é o primeiro componente após o shard
+                relative = os.path.relpath(path, root).split(os.sep)
+                base = relative[2].split('.', 1)[0] if len(relative) > 2 else relative[-1].split('.', 1)[0]
+                if base in protected_bases:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                freed += size
+        with self._lock:
+            self._usage = total
+        return freed
+
+    def usage(self):
+        """Uso do armazenamento (medido na última eviction, ou agora se ainda não houve)"""
+        with self._lock:
+            total = self._usage
+        if total is None:
+            total = sum(size for _, size, _ in self._scan())
+            with self._lock:
+                self._usage = total
+        return {'bytes': total, 'max_bytes': self.max_bytes}
+
+
+artifact_store = ArtifactStore.from_env()
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from src.models.user import db, UploadSession
+
+# Diretório dos arquivos em montagem (precisa ser compartilhado entre os nós)
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'ultraimage-uploads'))
+
+# Tamanho máximo de um arquivo enviado em partes (o mesmo limite de /upload,
+# já que o arquivo montado passa pelo mesmo pipeline) e de cada parte
+MAX_RESUMABLE_BYTES = int(os.environ.get(
+    'MAX_RESUMABLE_UPLOAD_BYTES', os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024)
+))
+MAX_CHUNK_BYTES = int(os.environ.get('MAX_UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024))
+
+# Sessões sem atividade por mais que isso são descartadas
+SESSION_TTL_HOURS = float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+
+COPY_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Erro de protocolo do upload em partes (com o status HTTP correspondente)"""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+def data_path(upload_id):
+    return os.path.join(UPLOAD_SESSION_DIR, f"{upload_id}.bin")
+
+
+def create_session(user_id, filename, total_size, sha256=None):
+    """Abre uma sessão de upload e cria o arquivo de destino vazio (valida os campos do JSON)"""
+    if total_size is None:
+        raise UploadError("Tamanho do arquivo não informado")
+    if isinstance(total_size, bool) or not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError("size deve ser um inteiro positivo (bytes)")
+    if total_size > MAX_RESUMABLE_BYTES:
+        raise UploadError(f"Arquivo muito grande. O máximo é {MAX_RESUMABLE_BYTES // (1024 * 1024)} MB.", 413)
+    if sha256 is not None:
+        if not isinstance(sha256, str) or len(sha256) != 64:
+            raise UploadError("sha256 inválido")
+        try:
+            bytes.fromhex(sha256)
+        except ValueError:
+            raise UploadError("sha256 inválido")
+    if filename is not None and not isinstance(filename, str):
+        raise UploadError("filename deve ser texto")
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename[:255] if filename else None,
+        total_size=total_size,
+        sha256=sha256.lower() if sha256 else None,
+    )
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    open(data_path(upload.id), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def get_session(upload_id, user_id):
+    """Retorna a sessão do usuário (ou None se não existir / for de outro usuário)"""
+    upload = UploadSession.query.get(upload_id)
+    if upload is None or upload.user_id != user_id:
+        return None
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, chunk_sha256=None):
+    """
+    Grava uma parte do arquivo a partir de `offset`
+
+    A parte é recebida num arquivo temporário (sem lock nenhum, por mais lenta
+    que seja a conexão) e conferida; só então a sessão é travada, o offset
+    revalidado e os bytes copiados para o arquivo de destino. Partes repetidas
+    ou fora de ordem são recusadas com o offset atual para o cliente retomar.
+
+    Args:
+        upload (UploadSession): Sessão do upload
+        offset (int): Posição da parte no arquivo
+        stream: Corpo da requisição
+        length (int): Tamanho da parte (Content-Length)
+        chunk_sha256 (str): Checksum da parte, se informado
+
+    Returns:
+        int: Novo offset (bytes recebidos)
+    """
+    if offset != upload.received:
+        raise UploadError("Offset inesperado", 409, upload.received)
+    if length is None or length <= 0:
+        raise UploadError("Parte vazia ou sem Content-Length", 411)
+    if length > MAX_CHUNK_BYTES:
+        raise UploadError(f"Parte muito grande. O máximo é {MAX_CHUNK_BYTES // (1024 * 1024)} MB.", 413)
+    if offset + length > upload.total_size:
+        raise UploadError("Parte ultrapassa o tamanho declarado", 416, upload.received)
+
+    upload_id = upload.id
+    sha = hashlib.sha256()
+    received = 0
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_SESSION_DIR, suffix='.part', delete=False) as part:
+        try:
+            while received < length:
+                chunk = stream.read(min(COPY_BUFFER, length - received))
+                if not chunk:
+                    break
+                sha.update(chunk)
+                part.write(chunk)
+                received += len(chunk)
+        except Exception:
+            part.close()
+            os.unlink(part.name)
+            raise
+
+    try:
+        if received != length:
+            raise UploadError("Parte incompleta", 400, upload.received)
+        if chunk_sha256 and sha.hexdigest() != chunk_sha256.lower():
+            raise UploadError("Checksum da parte não confere", 422, upload.received)
+
+        # Revalida o offset com a sessão travada (outra requisição pode ter gravado a mesma parte)
+        db.session.rollback()
+        upload = UploadSession.query.with_for_update().get(upload_id)
+        if upload is None:
+            raise UploadError("Upload não encontrado", 404)
+        if upload.received != offset:
+            db.session.rollback()
+            raise UploadError("Offset inesperado", 409, upload.received)
+
+        with open(part.name, 'rb') as src, open(data_path(upload_id), 'r+b') as dst:
+            dst.seek(offset)
+            shutil.copyfileobj(src, dst, COPY_BUFFER)
+            dst.flush()
+            os.fsync(dst.fileno())
+        upload.received = offset + length
+        db.session.commit()
+        return upload.received
+    finally:
+        os.unlink(part.name)
+
+
+def verify_complete(upload):
+    """Confere se o arquivo está completo e íntegro; retorna o caminho montado"""
+    if upload.received < upload.total_size:
+        raise UploadError("Upload incompleto", 409, upload.received)
+    path = data_path(upload.id)
+    if upload.sha256:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_BUFFER), b''):
+                sha.update(chunk)
+        if sha.hexdigest() != upload.sha256:
+            raise UploadError("Checksum do arquivo não confere", 422)
+    return path
+
+
+def discard_session(upload):
+    """Remove a sessão e o arquivo montado"""
+    path = data_path(upload.id)
+    db.session.delete(upload)
+    db.session.commit()
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def purge_stale_sessions(now=None):
+    """
+    Remove sessões abandonadas (sem partes novas há mais de SESSION_TTL_HOURS)
+
+    Returns:
+        int: Sessões removidas
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=SESSION_TTL_HOURS)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    ids = [upload.id for upload in stale]
+    if ids:
+        UploadSession.query.filter(UploadSession.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    for upload_id in ids:
+        path = data_path(upload_id)
+        if os.path.exists(path):
+            os.unlink(path)
+    return len(ids)
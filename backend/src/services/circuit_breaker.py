@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class CircuitOpen(Exception):
+    """Levantada quando o circuito está aberto e a chamada é recusada sem tocar a rede"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuito '{name}' aberto, tente novamente em {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples com três estados: closed, open e half_open
+
+    - closed: chamadas passam; falhas consecutivas são contadas
+    - open: chamadas falham imediatamente até o fim do cooldown
+    - half_open: uma única chamada de teste é liberada; sucesso fecha o circuito,
+      falha reabre
+    O circuito também pode ser fechado por um probe externo (ex.: health check).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, is_failure=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Retorna True (falha do provedor), False (provedor respondeu) ou None (sem sinal)
+        self.is_failure = is_failure or (lambda exc: True)
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name, prefix, is_failure=None):
+        return cls(
+            name,
+            failure_threshold=int(os.environ.get(f'{prefix}_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.environ.get(f'{prefix}_BREAKER_RESET', 30)),
+            is_failure=is_failure,
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return 1
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, int(round(remaining)))
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_after': self._retry_after() if state == self.OPEN else 0,
+            }
+
+    def before_call(self):
+        """Verifica se a chamada pode prosseguir; levanta CircuitOpen caso contrário"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpen(self.name, self._retry_after())
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        """Executa o bloco protegido pelo circuito"""
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            verdict = self.is_failure(e)
+            if verdict is None:
+                # Erro sem informação sobre o provedor (ex.: fila local cheia)
+                self.release_probe()
+            elif verdict:
+                self.record_failure()
+            else:
+                # Erros de entrada (ex.: imagem inválida) não indicam falha do provedor
+                self.record_success()
+            raise
+        else:
+            self.record_success()
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+
+class LimiterSaturated(Exception):
+    """Levantada quando a fila de espera do limitador está cheia ou o tempo de espera expirou"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Capacidade do Replicate esgotada, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _status_code(exc):
+    """Extrai o status HTTP de exceções do replicate/httpx/requests, se houver"""
+    status = getattr(exc, 'status', None)
+    if isinstance(status, int):
+        return status
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_overload_error(exc):
+    """Indica se a exceção sinaliza sobrecarga do provedor (429 ou 5xx)"""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    message = str(exc).lower()
+    return '429' in message or 'rate limit' in message or 'throttled' in message
+
+
+class AdaptiveLimiter:
+    """
+    Limitador de concorrência adaptativo (AIMD) para chamadas ao Replicate
+
+    O limite cresce de forma aditiva (+1 a cada "janela" de chamadas bem-sucedidas)
+    enquanto a latência fica abaixo do alvo, e cai de forma multiplicativa quando
+    o provedor responde 429/5xx ou a latência ultrapassa o alvo. Chamadas acima do
+    limite aguardam numa fila limitada; se a fila estiver cheia, falham na hora.
+
+    A diminuição acontece no máximo uma vez por janela de latência média: uma
+    rajada de 429 das chamadas que já estavam em voo é um único evento de
+    sobrecarga, não N (que levaria o limite direto a min_limit).
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, max_queue=32,
+                 queue_timeout=10.0, latency_target=90.0, backoff_ratio=0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_latency = None
+        self._last_decrease = None
+        self._cond = threading.Condition()
+        # Threads para espera na fila a partir de código asyncio (no máximo max_queue esperam)
+        self._wait_executor = ThreadPoolExecutor(max_workers=max(1, max_queue), thread_name_prefix='limiter-wait')
+
+    @classmethod
+    def from_env(cls, prefix='REPLICATE'):
+        """Cria o limitador a partir de variáveis de ambiente (ex.: REPLICATE_MAX_CONCURRENCY)"""
+        env = os.environ.get
+        return cls(
+            initial_limit=int(env(f'{prefix}_INITIAL_CONCURRENCY', 4)),
+            min_limit=int(env(f'{prefix}_MIN_CONCURRENCY', 1)),
+            max_limit=int(env(f'{prefix}_MAX_CONCURRENCY', 64)),
+            max_queue=int(env(f'{prefix}_MAX_QUEUE', 32)),
+            queue_timeout=float(env(f'{prefix}_QUEUE_TIMEOUT', 10)),
+            latency_target=float(env(f'{prefix}_LATENCY_TARGET', 90)),
+        )
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def snapshot(self):
+        """Estado atual do limitador (para health checks e métricas)"""
+        with self._cond:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'max_queue': self.max_queue,
+                'avg_latency': round(self._avg_latency, 3) if self._avg_latency is not None else None,
+            }
+
+    def retry_after(self):
+        """Estimativa (em segundos) de quando uma vaga deve abrir"""
+        latency = self._avg_latency or 5.0
+        backlog = (self._waiting + 1) / max(1, int(self._limit))
+        return max(1, int(round(latency * backlog)))
+
+    def try_acquire(self):
+        """Reserva uma vaga se houver uma livre agora, sem esperar"""
+        with self._cond:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return
+            if self._waiting >= self.max_queue:
+                raise LimiterSaturated(self.retry_after())
+
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self._in_flight >= int(self._limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LimiterSaturated(self.retry_after())
+                    self._cond.wait(remaining)
+                self._in_flight += 1
+            finally:
+                self._waiting -= 1
+
+    def release(self, latency, overloaded=False):
+        with self._cond:
+            self._in_flight -= 1
+
+            if latency is not None:
+                if self._avg_latency is None:
+                    self._avg_latency = latency
+                else:
+                    self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+
+            if overloaded or (latency is not None and latency > self.latency_target):
+                # Diminuição multiplicativa, uma vez por janela de latência
+                now = time.monotonic()
+                window = self._avg_latency or 0.0
+                if self._last_decrease is None or now - self._last_decrease >= window:
+                    self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+                    self._last_decrease = now
+            elif self._in_flight + 1 >= int(self._limit):
+                # Aumento aditivo: só cresce quando o limite está de fato sendo usado
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Reserva uma vaga durante o bloco; registra latência e sinais de sobrecarga"""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(time.monotonic() - started, overloaded=is_overload_error(e))
+            raise
+        else:
+            self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Versão asyncio de slot(): a espera na fila não bloqueia o event loop"""
+        if not self.try_acquire():
+            loop = asyncio.get_running_loop()
+            waiter = loop.run_in_executor(self._wait_executor, self.acquire)
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # Requisição cancelada: devolve a vaga se ela chegar a ser concedida
+                waiter.add_done_callback(
+                    lambda f: f.cancelled() or f.exception() is not None or self.release(None)
+                )
+                raise
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.release(time.monotonic() - started, overloaded=is_overload_error(e))
+            raise
+        else:
+            self.release(time.monotonic() - started)
+
+
+# Limitador global compartilhado por todas as chamadas ao Replicate deste processo
+replicate_limiter = AdaptiveLimiter.from_env()
@@ -0,0 +1,161 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from src.services.animation import is_animated_file
+from src.services.artifact_store import artifact_store
+
+# Formatos de entrega: nome -> (formato Pillow, qualidade padrão, suporta alfa)
+OUTPUT_FORMATS = {
+    'webp': ('WEBP', 82, True),
+    'jpeg': ('JPEG', 85, False),
+    'avif': ('AVIF', 60, True),
+}
+
+# Ordem de preferência (em empate de q) quando o cliente pede format=auto
+ACCEPT_PREFERENCE = (('image/avif', 'avif'), ('image/webp', 'webp'))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('FORMAT_WORKERS', 2)),
+    thread_name_prefix='format-convert'
+)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def is_supported(name):
+    """Indica se o Pillow instalado consegue gravar o formato"""
+    if name not in OUTPUT_FORMATS:
+        return False
+    Image.init()
+    return OUTPUT_FORMATS[name][0] in Image.SAVE
+
+
+def normalize_quality(name, quality=None):
+    """Qualidade em passos de 5 (limita o número de variantes em cache)"""
+    if quality is None:
+        return OUTPUT_FORMATS[name][1]
+    quality = max(10, min(100, int(quality)))
+    return int(round(quality / 5.0)) * 5
+
+
+def accepted_quality(accept_header):
+    """
+    Valores q do cabeçalho Accept por tipo exato (curingas como */* e image/* são ignorados)
+
+    Returns:
+        dict: mimetype -> q (0 a 1)
+    """
+    qualities = {}
+    for entry in (accept_header or '').lower().split(','):
+        mimetype, *params = [part.strip() for part in entry.split(';')]
+        if not mimetype or '*' in mimetype:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = max(0.0, min(1.0, float(value)))
+                except ValueError:
+                    q = 0.0
+        qualities[mimetype] = max(q, qualities.get(mimetype, 0.0))
+    return qualities
+
+
+def negotiate(requested=None, accept_header=None):
+    """
+    Escolhe o formato de entrega
+
+    A conversão só acontece quando pedida: sem format (ou com original), a
+    saída é entregue como foi gerada. Com format=auto, o formato vem do
+    Accept, considerando só tipos listados explicitamente e com q > 0 (o Accept
+    de navegação dos navegadores inclui image/avif, mas quem clica em "baixar"
+    espera o original).
+
+    Args:
+        requested (str): Formato pedido via query string (webp, jpeg, avif, original ou auto)
+        accept_header (str): Cabeçalho Accept da requisição (usado com format=auto)
+
+    Returns:
+        tuple: (formato ou None para o original, veio do Accept?)
+    """
+    if not requested:
+        return None, False
+    requested = requested.lower()
+    if requested == 'jpg':
+        requested = 'jpeg'
+    if requested in ('original', 'png'):
+        return None, False
+
+    if requested == 'auto':
+        qualities = accepted_quality(accept_header)
+        best, best_q = None, 0.0
+        for mimetype, name in ACCEPT_PREFERENCE:
+            q = qualities.get(mimetype, 0.0)
+            if q > best_q and is_supported(name):
+                best, best_q = name, q
+        return best, True
+
+    if not is_supported(requested):
+        raise ValueError(f"Formato não suportado: {requested}")
+    return requested, False
+
+
+def variant_name(name, quality):
+    return f"{name}q{quality}"
+
+
+def convert(source_key, name, quality):
+    """Converte o artefato para o formato pedido e guarda a variante"""
+    pillow_format, _, has_alpha = OUTPUT_FORMATS[name]
+    with Image.open(artifact_store.path_for(source_key)) as img:
+        if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        options = {'quality': quality}
+        if pillow_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif pillow_format == 'WEBP':
+            options.update(method=4)
+        img.save(buffer, format=pillow_format, **options)
+    return artifact_store.put_variant(source_key, variant_name(name, quality), name, buffer.getvalue())
+
+
+def _convert_and_forget(source_key, name, quality):
+    try:
+        return convert(source_key, name, quality)
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop((source_key, name, quality), None)
+
+
+def get_converted(source_key, name, quality=None, timeout=60):
+    """
+    Retorna a chave da variante convertida, convertendo no pool se preciso
+
+    Cada variante (formato + qualidade) é convertida no máximo uma vez: pedidos
+    simultâneos aguardam a mesma conversão e os seguintes leem do cache em disco.
+    Saídas animadas são entregues como foram geradas: a conversão guardaria só
+    o primeiro quadro.
+
+    Returns:
+        str: Chave da variante (ou source_key, se a saída for animada)
+    """
+    if is_animated_file(artifact_store.path_for(source_key)):
+        return source_key
+    quality = normalize_quality(name, quality)
+    key = artifact_store.variant_key(source_key, variant_name(name, quality), name)
+    if artifact_store.exists(key):
+        return key
+
+    job_key = (source_key, name, quality)
+    with _in_flight_lock:
+        future = _in_flight.get(job_key)
+        if future is None:
+            future = _executor.submit(_convert_and_forget, source_key, name, quality)
+            _in_flight[job_key] = future
+    return future.result(timeout=timeout)
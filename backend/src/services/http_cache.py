@@ -0,0 +1,72 @@
+import hashlib
+from flask import current_app, request, jsonify
+
+# Dados do usuário: o navegador pode guardar, mas precisa revalidar (304 é barato)
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+
+def etag_for(*parts):
+    """ETag a partir dos campos que definem a versão de um recurso"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def not_modified(etag, cache_control):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def conditional_json(etag, build_payload, cache_control=PRIVATE_REVALIDATE, vary_cookie=True):
+    """
+    Responde 304 se o If-None-Match bater com a ETag; senão serializa o payload
+
+    Args:
+        etag (str): Versão atual do recurso (ver etag_for)
+        build_payload (callable): Monta o dict da resposta (só chamado se necessário)
+        cache_control (str): Valor do Cache-Control
+        vary_cookie (bool): Se a resposta depende da sessão
+
+    Returns:
+        Response: 304 sem corpo ou 200 com JSON
+    """
+    if request.if_none_match.contains(etag):
+        response = not_modified(etag, cache_control)
+    else:
+        response = jsonify(build_payload())
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+    if vary_cookie:
+        response.vary.add('Cookie')
+    return response
+
+
+class StaticJSON:
+    """
+    Corpo JSON serializado uma única vez (para dados estáticos como PLANS)
+
+    A serialização acontece na primeira resposta (usando o JSON provider da app,
+    igual ao jsonify) e a ETag é o hash do corpo.
+    """
+
+    def __init__(self, payload, max_age=300):
+        self.payload = payload
+        self.cache_control = f'public, max-age={max_age}'
+        self._body = None
+        self._etag = None
+
+    def _build(self):
+        if self._body is None:
+            body = current_app.json.dumps(self.payload) + '\n'
+            self._body = body.encode('utf-8')
+            self._etag = hashlib.sha1(self._body).hexdigest()[:32]
+
+    def response(self):
+        self._build()
+        if request.if_none_match.contains(self._etag):
+            return not_modified(self._etag, self.cache_control)
+        response = current_app.response_class(self._body, mimetype='application/json')
+        response.set_etag(self._etag)
+        response.headers['Cache-Control'] = self.cache_control
+        return response
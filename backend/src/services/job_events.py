@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from src.models.user import db, JobEventLog, ProcessingJob
+
+# Intervalo (segundos) em que cada processo web lê os eventos publicados pelos
+# outros processos (workers, outros nós); 0 desativa o repasse
+EVENT_RELAY_INTERVAL = float(os.environ.get('JOB_EVENT_RELAY_INTERVAL', 1.0))
+
+# Eventos mais antigos que isso são removidos do log
+EVENT_LOG_TTL = timedelta(seconds=int(os.environ.get('JOB_EVENT_LOG_TTL', 600)))
+
+RELAY_BATCH = 500
+
+# O repasse relê os eventos criados nos últimos segundos: o id é atribuído no
+# INSERT, mas o commit de outro processo pode chegar depois de um id maior, e
+# uma marca por id pularia esse evento. Cobre também a diferença de relógio
+# entre os nós (created_at vem de quem publicou)
+RELAY_GRACE = timedelta(seconds=float(os.environ.get('JOB_EVENT_RELAY_GRACE', 10)))
+
+# Identifica este processo no log (seus próprios eventos já foram entregues localmente)
+SOURCE_ID = uuid.uuid4().hex
+
+ACTIVE_STATUSES = ('pending', 'uploaded', 'processing')
+
+
+class Subscription:
+    """
+    Fila de eventos de um assinante (uma conexão SSE)
+
+    Não usa thread própria: o publicador só enfileira e sinaliza um Event, e quem
+    consome espera nele. Consumidores asyncio passam `notify` (ex.: um
+    loop.call_soon_threadsafe) e leem com drain(). Se o cliente ficar lento, os
+    eventos mais antigos são descartados (a fila é limitada).
+    """
+
+    def __init__(self, user_id, max_events=100, notify=None):
+        self.user_id = str(user_id)
+        self._events = deque(maxlen=max_events)
+        self._ready = threading.Event()
+        self._notify = notify
+
+    def push(self, event):
+        self._events.append(event)
+        self._ready.set()
+        if self._notify is not None:
+            self._notify()
+
+    def drain(self):
+        """Retorna (e remove) os eventos pendentes"""
+        self._ready.clear()
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    def wait(self, timeout):
+        """Aguarda até timeout e retorna os eventos pendentes (lista possivelmente vazia)"""
+        if not self._events:
+            self._ready.wait(timeout)
+        return self.drain()
+
+
+class JobEventBroker:
+    """
+    Pub/sub em processo de eventos de jobs, indexado por usuário
+
+    Só entrega às conexões deste processo; eventos de outros processos chegam
+    pelo log no banco (ver publish_job e start_event_relay).
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, notify=None):
+        subscription = Subscription(user_id, notify=notify)
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(user_id), ()))
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+job_events = JobEventBroker()
+
+
+def publish_job(job, **extra):
+    """
+    Publica a transição de status de um job para as conexões do dono
+
+    O evento é gravado em job_event_log (o id do registro vira o `seq` do SSE)
+    e entregue na hora às conexões deste processo; os demais processos web o
+    recebem pelo repasse (start_event_relay). Assim eventos publicados por
+    worker.py ou por outro nó chegam a qualquer conexão SSE.
+
+    Args:
+        job (ProcessingJob): Job com o status já atualizado
+        **extra: Campos adicionais (ex.: tempos de cada etapa)
+    """
+    if job is None:
+        return None
+    elapsed = None
+    if job.created_at is not None:
+        elapsed = round((datetime.utcnow() - job.created_at).total_seconds(), 3)
+    event = {
+        'job_id': job.id,
+        'status': job.status,
+        'elapsed': elapsed,
+        'error_message': job.error_message,
+        'timestamp': time.time(),
+    }
+    event.update(extra)
+    try:
+        with db.engine.begin() as conn:
+            result = conn.execute(JobEventLog.__table__.insert().values(
+                user_id=job.user_id, source=SOURCE_ID, payload=json.dumps(event), created_at=datetime.utcnow()
+            ))
+            event['seq'] = result.inserted_primary_key[0]
+    except Exception as e:
+        # Sem o log o evento ainda chega às conexões deste processo
+        print(f"Erro ao gravar evento do job {job.id}: {e}")
+    return job_events.publish(job.user_id, event)
+
+
+def active_jobs_snapshot(user_id):
+    """Snapshot enviado ao abrir o stream: jobs do usuário ainda em andamento"""
+    active_jobs = ProcessingJob.query.filter(
+        ProcessingJob.user_id == user_id,
+        ProcessingJob.status.in_(ACTIVE_STATUSES)
+    ).all()
+    return {'seq': 0, 'jobs': [job.to_dict() for job in active_jobs]}
+
+
+def format_sse(event, event_type='job'):
+    """Serializa um evento no formato text/event-stream"""
+    seq = event.get('seq')
+    prefix = f"id: {seq}\n" if seq else ''
+    return f"{prefix}event: {event_type}\ndata: {json.dumps(event)}\n\n"
+
+
+class RelayCursor:
+    """Posição do repasse: marca d'água por tempo e ids já vistos dentro da carência"""
+
+    def __init__(self, since):
+        self.since = since
+        self.seen = {}  # id -> created_at
+
+
+def relay_events(cursor, now=None):
+    """
+    Entrega às conexões locais os eventos gravados por outros processos
+
+    Lê os eventos com created_at a partir de `cursor.since - RELAY_GRACE` e
+    descarta os ids já vistos, então um evento com commit atrasado ainda é
+    entregue (uma única vez) em vez de ficar para trás de um id maior.
+
+    Args:
+        cursor (RelayCursor): Posição do repasse deste processo (atualizada)
+        now (datetime): Referência de tempo (padrão: agora, UTC)
+
+    Returns:
+        int: Eventos entregues
+    """
+    now = now or datetime.utcnow()
+    floor = cursor.since - RELAY_GRACE
+    delivered = 0
+    after_id = 0
+    while True:
+        rows = JobEventLog.query.filter(
+            JobEventLog.created_at >= floor, JobEventLog.id > after_id
+        ).order_by(JobEventLog.id).limit(RELAY_BATCH).all()
+        for row in rows:
+            after_id = row.id
+            if row.id in cursor.seen:
+                continue
+            cursor.seen[row.id] = row.created_at
+            if row.source == SOURCE_ID:
+                continue
+            # Sem ninguém conectado o publish não entrega nada; o id fica marcado mesmo assim
+            job_events.publish(row.user_id, dict(json.loads(row.payload), seq=row.id))
+            delivered += 1
+        if len(rows) < RELAY_BATCH:
+            break
+    db.session.commit()
+
+    cursor.since = now
+    floor = now - RELAY_GRACE
+    cursor.seen = {event_id: created_at for event_id, created_at in cursor.seen.items() if created_at >= floor}
+    return delivered
+
+
+def prune_event_log(now=None):
+    """Remove eventos mais antigos que EVENT_LOG_TTL; retorna quantos"""
+    cutoff = (now or datetime.utcnow()) - EVENT_LOG_TTL
+    deleted = JobEventLog.query.filter(JobEventLog.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def start_event_relay(app):
+    """Repassa periodicamente os eventos de outros processos (worker.py, outros nós) numa thread daemon"""
+    if EVENT_RELAY_INTERVAL <= 0:
+        return None
+
+    def loop():
+        cursor = RelayCursor(datetime.utcnow())
+        pruned_at = time.monotonic()
+        while True:
+            time.sleep(EVENT_RELAY_INTERVAL)
+            with app.app_context():
+                try:
+                    relay_events(cursor)
+                    if time.monotonic() - pruned_at > EVENT_LOG_TTL.total_seconds() / 2:
+                        prune_event_log()
+                        pruned_at = time.monotonic()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro no repasse de eventos de jobs: {e}")
+
+    thread = threading.Thread(target=loop, name='job-event-relay', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,141 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image
+from src.models.user import db, User, JobMetrics
+
+# Etapas registradas (colunas de JobMetrics, em segundos)
+STAGES = ('preprocess', 'queue', 'predict', 'replicate_predict', 'download', 'delivery', 'total')
+
+PERCENTILES = (50, 90, 99)
+
+# Faixas de tamanho da entrada (megapixels) usadas no relatório
+SIZE_BUCKETS = ((0.25, '<0.25MP'), (0.5, '0.25-0.5MP'), (1.0, '0.5-1MP'), (2.0, '1-2MP'))
+LARGEST_BUCKET = '>2MP'
+
+REPORT_GROUPS = ('plan', 'scale', 'size')
+
+# Histórico mantido pela varredura de retenção
+METRICS_RETENTION_DAYS = int(os.environ.get('JOB_METRICS_RETENTION_DAYS', 365))
+
+
+def image_pixels(path):
+    """Pixels de uma imagem em disco (só lê o cabeçalho)"""
+    try:
+        with Image.open(path) as img:
+            return img.width * img.height
+    except Exception:
+        return None
+
+
+def record_job_metrics(job, timings, scale=None, input_pixels=None, output_path=None,
+                       prediction_metrics=None, commit=True):
+    """
+    Registra os tempos e tamanhos de um job concluído
+
+    Args:
+        job (ProcessingJob): Job concluído
+        timings (dict): Segundos por etapa (as mesmas chaves publicadas nos eventos)
+        scale (int): Escala enviada ao modelo (None = só reamostragem)
+        input_pixels (int): Pixels da imagem enviada ao modelo
+        output_path (str): Arquivo de saída (para contar os pixels)
+        prediction_metrics (dict): Campo metrics da predição do Replicate
+        commit (bool): Se True, faz commit
+    """
+    user = User.query.get(job.user_id)
+    metrics = JobMetrics(
+        job_id=job.id,
+        plan=user.subscription_plan if user else None,
+        scale=scale,
+        input_pixels=input_pixels,
+        output_pixels=image_pixels(output_path) if output_path else None,
+        replicate_predict=(prediction_metrics or {}).get('predict_time'),
+        **{stage: timings.get(stage) for stage in STAGES if stage != 'replicate_predict'}
+    )
+    db.session.merge(metrics)
+    if commit:
+        db.session.commit()
+    return metrics
+
+
+def size_bucket(pixels):
+    if pixels is None:
+        return None
+    megapixels = pixels / 1000000
+    for limit, label in SIZE_BUCKETS:
+        if megapixels < limit:
+            return label
+    return LARGEST_BUCKET
+
+
+def _summary(values):
+    data = np.array(values, dtype=np.float64)
+    summary = {}
+    for stage_index, stage in enumerate(STAGES):
+        column = data[:, stage_index]
+        column = column[~np.isnan(column)]
+        if column.size == 0:
+            summary[stage] = None
+            continue
+        summary[stage] = {
+            f'p{p}': round(float(value), 3)
+            for p, value in zip(PERCENTILES, np.percentile(column, PERCENTILES))
+        }
+        summary[stage]['mean'] = round(float(column.mean()), 3)
+    return summary
+
+
+def latency_report(days=30, group_by=REPORT_GROUPS):
+    """
+    Percentis de cada etapa agrupados por plano, escala e faixa de tamanho
+
+    Args:
+        days (int): Janela do relatório
+        group_by (tuple): Subconjunto de REPORT_GROUPS
+
+    Returns:
+        dict: Grupos com contagem, pixels médios e percentis por etapa
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    columns = [getattr(JobMetrics, stage) for stage in STAGES]
+    query = db.session.query(
+        JobMetrics.plan, JobMetrics.scale, JobMetrics.input_pixels, JobMetrics.output_pixels, *columns
+    ).filter(JobMetrics.created_at >= since)
+
+    groups = defaultdict(lambda: {'values': [], 'input_pixels': [], 'output_pixels': []})
+    for plan, scale, input_pixels, output_pixels, *stage_values in query.yield_per(1000):
+        key_fields = {'plan': plan, 'scale': scale, 'size': size_bucket(input_pixels)}
+        key = tuple(key_fields[name] for name in group_by)
+        group = groups[key]
+        group['values'].append([np.nan if v is None else v for v in stage_values])
+        if input_pixels:
+            group['input_pixels'].append(input_pixels)
+        if output_pixels:
+            group['output_pixels'].append(output_pixels)
+    db.session.commit()
+
+    report = []
+    for key, group in sorted(groups.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        report.append({
+            **dict(zip(group_by, key)),
+            'count': len(group['values']),
+            'avg_input_pixels': int(np.mean(group['input_pixels'])) if group['input_pixels'] else None,
+            'avg_output_pixels': int(np.mean(group['output_pixels'])) if group['output_pixels'] else None,
+            'stages': _summary(group['values']),
+        })
+    return {'since': since.isoformat(), 'days': days, 'group_by': list(group_by), 'groups': report}
+
+
+def purge_old_metrics(now=None, batch_size=1000):
+    """Remove o histórico mais antigo que METRICS_RETENTION_DAYS, em lotes"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=METRICS_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        ids = [job_id for (job_id,) in db.session.query(JobMetrics.job_id)
+               .filter(JobMetrics.created_at < cutoff).limit(batch_size)]
+        if not ids:
+            db.session.commit()
+            return deleted
+        deleted += JobMetrics.query.filter(JobMetrics.job_id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
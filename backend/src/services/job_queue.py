@@ -0,0 +1,208 @@
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, ProcessingJob, JobQueueEntry, TaskLease
+
+# Duração do lease de um job; o worker renova via heartbeat enquanto processa
+LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+# Status de um job ainda sem resultado (na fila, enviado ou no Replicate)
+OPEN_STATUSES = ('pending', 'uploaded', 'processing')
+
+# Bancos com SELECT ... FOR UPDATE SKIP LOCKED
+SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'mariadb')
+
+
+def enqueue_job(job, params, commit=True):
+    """Coloca um job na fila dos workers"""
+    job.status = 'pending'
+    entry = JobQueueEntry(job_id=job.id, params=json.dumps(params))
+    db.session.add(entry)
+    if commit:
+        db.session.commit()
+    return entry
+
+
+def _claimable(now):
+    return or_(JobQueueEntry.lease_expires_at.is_(None), JobQueueEntry.lease_expires_at < now)
+
+
+def claim_jobs(worker_id, limit, lease_seconds=LEASE_SECONDS):
+    """
+    Reserva até `limit` jobs livres (ou com lease expirado) para o worker
+
+    No PostgreSQL/MySQL usa SELECT ... FOR UPDATE SKIP LOCKED, então vários
+    workers disputam a fila sem bloquear uns aos outros. No SQLite faz um claim
+    otimista: UPDATE condicional por linha, conferindo o rowcount.
+
+    Returns:
+        list: [(job_id, params, attempts)] reservados
+    """
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=lease_seconds)
+    claimed = []
+
+    if db.engine.dialect.name in SKIP_LOCKED_DIALECTS:
+        entries = (
+            JobQueueEntry.query.filter(_claimable(now))
+            .order_by(JobQueueEntry.enqueued_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for entry in entries:
+            entry.worker_id = worker_id
+            entry.lease_expires_at = expires
+            entry.attempts += 1
+            claimed.append(entry.job_id)
+    else:
+        candidates = [
+            job_id for (job_id,) in db.session.query(JobQueueEntry.job_id)
+            .filter(_claimable(now))
+            .order_by(JobQueueEntry.enqueued_at)
+            .limit(limit * 2)
+        ]
+        for job_id in candidates:
+            if len(claimed) >= limit:
+                break
+            result = db.session.execute(
+                update(JobQueueEntry)
+                .where(JobQueueEntry.job_id == job_id, _claimable(now))
+                .values(worker_id=worker_id, lease_expires_at=expires, attempts=JobQueueEntry.attempts + 1)
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+
+    if not claimed:
+        db.session.commit()
+        return []
+
+    ProcessingJob.query.filter(ProcessingJob.id.in_(claimed)).update(
+        {'status': 'processing'}, synchronize_session=False
+    )
+    rows = db.session.query(JobQueueEntry.job_id, JobQueueEntry.params, JobQueueEntry.attempts).filter(
+        JobQueueEntry.job_id.in_(claimed)
+    ).all()
+    db.session.commit()
+    return [(job_id, json.loads(params or '{}'), attempts) for job_id, params, attempts in rows]
+
+
+def heartbeat(worker_id, job_ids, lease_seconds=LEASE_SECONDS):
+    """
+    Renova o lease dos jobs em andamento deste worker
+
+    Returns:
+        set: ids cujo lease ainda pertence ao worker
+    """
+    if not job_ids:
+        return set()
+    db.session.execute(
+        update(JobQueueEntry)
+        .where(JobQueueEntry.worker_id == worker_id, JobQueueEntry.job_id.in_(list(job_ids)))
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    owned = {
+        job_id for (job_id,) in db.session.query(JobQueueEntry.job_id).filter(
+            JobQueueEntry.worker_id == worker_id, JobQueueEntry.job_id.in_(list(job_ids))
+        )
+    }
+    db.session.commit()
+    return owned
+
+
+def owns_lease(job_id, worker_id):
+    entry = JobQueueEntry.query.get(job_id)
+    return entry is not None and entry.worker_id == worker_id
+
+
+def finish_job(job_id, worker_id):
+    """Remove o job da fila (na mesma transação do resultado; o commit é do chamador)"""
+    return JobQueueEntry.query.filter_by(job_id=job_id, worker_id=worker_id).delete(synchronize_session=False)
+
+
+def release_job(job_id, worker_id, delay=0, count_attempt=True):
+    """Devolve o job à fila (opcionalmente só depois de `delay` segundos)"""
+    values = {
+        'worker_id': None,
+        'lease_expires_at': datetime.utcnow() + timedelta(seconds=delay) if delay else None,
+    }
+    if not count_attempt:
+        values['attempts'] = JobQueueEntry.attempts - 1
+    db.session.execute(
+        update(JobQueueEntry)
+        .where(JobQueueEntry.job_id == job_id, JobQueueEntry.worker_id == worker_id)
+        .values(**values)
+    )
+    ProcessingJob.query.filter_by(id=job_id).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+
+def queue_stats():
+    now = datetime.utcnow()
+    pending = JobQueueEntry.query.filter(_claimable(now)).count()
+    leased = JobQueueEntry.query.filter(JobQueueEntry.lease_expires_at >= now).count()
+    return {'pending': pending, 'leased': leased}
+
+
+def settle_job(job_id, from_statuses=OPEN_STATUSES, **values):
+    """
+    Grava o resultado de um job só se ele ainda estiver num dos status informados
+
+    É um UPDATE condicional conferido pelo rowcount (não depende de
+    SELECT ... FOR UPDATE, que no SQLite não trava nada): entre a requisição
+    original, o worker e a reconciliação, só quem fizer a transição conclui o
+    job e registra o uso. O commit é do chamador.
+
+    Returns:
+        bool: True se a transição foi feita por esta chamada
+    """
+    result = db.session.execute(
+        update(ProcessingJob)
+        .where(ProcessingJob.id == job_id, ProcessingJob.status.in_(from_statuses))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def acquire_task_lease(name, holder, ttl):
+    """
+    Adquire (ou renova) o lease de uma tarefa que deve rodar num único processo
+
+    Cada processo tenta a cada execução; só o dono atual ou, com o lease
+    vencido, o primeiro que chegar consegue (UPDATE condicional + rowcount,
+    ou o INSERT da primeira vez, decidido pela chave primária).
+
+    Args:
+        name (str): Nome da tarefa
+        holder (str): Identificação do processo
+        ttl (float): Validade do lease em segundos (maior que o intervalo da tarefa)
+
+    Returns:
+        bool: True se este processo deve executar a tarefa agora
+    """
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=ttl)
+    result = db.session.execute(
+        update(TaskLease)
+        .where(TaskLease.name == name, or_(TaskLease.holder == holder, TaskLease.expires_at < now))
+        .values(holder=holder, expires_at=expires)
+    )
+    if result.rowcount == 1:
+        db.session.commit()
+        return True
+    if db.session.query(TaskLease.name).filter(TaskLease.name == name).first() is not None:
+        db.session.commit()
+        return False
+    try:
+        db.session.add(TaskLease(name=name, holder=holder, expires_at=expires))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
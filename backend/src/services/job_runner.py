@@ -0,0 +1,150 @@
+import os
+import tempfile
+import time
+from datetime import datetime
+import replicate
+from src.models.user import db, ProcessingJob, JobQueueEntry
+from src.services.upload_service import run_model, download_output, output_extension
+from src.services.artifact_store import artifact_store
+from src.services.circuit_breaker import CircuitOpen
+from src.services.concurrency_limiter import LimiterSaturated
+from src.services.job_events import publish_job
+from src.services.job_metrics import record_job_metrics, image_pixels
+from src.services.job_queue import MAX_ATTEMPTS, owns_lease, finish_job, release_job, settle_job
+from src.services.replicate_service import replicate_call
+from src.services.resolution import resample_to
+from src.services.thumbnail_service import schedule_previews
+from src.services.usage_ledger import record_usage
+
+
+class LeaseLost(Exception):
+    """O lease do job expirou e outro worker assumiu"""
+
+
+def _process(job, params, timings):
+    """
+    Executa o upscale de um job
+
+    Returns:
+        tuple: (caminho temporário da saída, extensão, predição do Replicate ou None)
+    """
+    scale = params.get('scale')
+    final_size = params.get('final_size')
+    input_path = artifact_store.path_for(job.input_path)
+
+    if scale is None:
+        fd, output_path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        resample_to(input_path, final_size, output_path)
+        return output_path, 'png', None
+
+    queued_at = time.monotonic()
+    with replicate_call():
+        # Soma a espera pelo limitador ao tempo já passado na fila (run_job)
+        timings['queue'] = round(timings.get('queue', 0) + time.monotonic() - queued_at, 3)
+        predict_started = time.monotonic()
+        with open(input_path, 'rb') as image_file:
+            prediction = run_model({
+                "image": image_file,
+                "scale": scale,
+                "face_enhance": bool(params.get('face_enhance')),
+            }, job, timings)
+    timings['predict'] = round(time.monotonic() - predict_started, 3)
+    output_url = prediction.output
+
+    download_started = time.monotonic()
+    output_ext = output_extension(output_url)
+    output_path = download_output(output_url, f".{output_ext}")
+    timings['download'] = round(time.monotonic() - download_started, 3)
+
+    if final_size:
+        resample_to(output_path, final_size)
+    return output_path, output_ext, prediction
+
+
+def run_job(job_id, params, attempts, worker_id):
+    """
+    Processa um job reservado pelo worker (deve rodar dentro de uma app context)
+
+    Erros de capacidade (limitador/circuit breaker) devolvem o job à fila sem
+    gastar tentativa; erros transitórios são re-tentados até MAX_ATTEMPTS; erros
+    do modelo falham o job na hora.
+    """
+    job = ProcessingJob.query.get(job_id)
+    if job is None or not job.input_path:
+        finish_job(job_id, worker_id)
+        db.session.commit()
+        return
+    if attempts > MAX_ATTEMPTS:
+        # Leases expirados repetidamente (ex.: workers caindo no meio do job)
+        _fail(job_id, worker_id, f"Job excedeu {MAX_ATTEMPTS} tentativas")
+        return
+
+    # Tempo na fila (do enqueue até este claim): a entrada é removida ao concluir,
+    # então é lido agora. Em re-tentativas inclui as tentativas anteriores.
+    entry = JobQueueEntry.query.get(job_id)
+    queue_wait = 0.0
+    if entry is not None and entry.enqueued_at is not None:
+        queue_wait = max(0.0, (datetime.utcnow() - entry.enqueued_at).total_seconds())
+    started = time.monotonic() - queue_wait
+    timings = {'queue': round(queue_wait, 3)}
+    publish_job(job, status='processing', worker=worker_id)
+    output_path = None
+    try:
+        output_path, output_ext, prediction = _process(job, params, timings)
+
+        db.session.refresh(job)
+        if not owns_lease(job_id, worker_id):
+            raise LeaseLost(f"Lease do job {job_id} perdido")
+
+        output_key = artifact_store.put_file(output_path, output_ext, move=True)
+        output_path = None
+        # Condicional ao status: se a reconciliação já concluiu o job, não cobra de novo
+        if not settle_job(job_id, status='completed', completed_at=datetime.utcnow(), output_path=output_key):
+            raise LeaseLost(f"Job {job_id} já finalizado por outro processo")
+        record_usage(job.user_id, job.id, commit=False)
+        finish_job(job_id, worker_id)
+        db.session.commit()
+
+        timings['total'] = round(time.monotonic() - started, 3)
+        publish_job(job, timings=timings)
+        schedule_previews(job.output_path)
+        try:
+            stored_path = artifact_store.path_for(job.output_path)
+            record_job_metrics(job, timings, params.get('scale'), image_pixels(artifact_store.path_for(job.input_path)),
+                               stored_path, prediction.metrics if prediction else None)
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  Erro ao registrar métricas do job {job_id}: {e}")
+
+    except LeaseLost as e:
+        db.session.rollback()
+        print(f"⚠️  {e}; resultado descartado")
+    except (LimiterSaturated, CircuitOpen) as e:
+        db.session.rollback()
+        release_job(job_id, worker_id, delay=e.retry_after, count_attempt=False)
+    except replicate.exceptions.ModelError as e:
+        db.session.rollback()
+        _fail(job_id, worker_id, e)
+    except Exception as e:
+        db.session.rollback()
+        if attempts < MAX_ATTEMPTS:
+            print(f"⚠️  Job {job_id} falhou (tentativa {attempts}/{MAX_ATTEMPTS}): {e}")
+            release_job(job_id, worker_id, delay=min(60, 2 ** attempts))
+        else:
+            _fail(job_id, worker_id, e)
+    finally:
+        if output_path and os.path.exists(output_path):
+            os.unlink(output_path)
+
+
+def _fail(job_id, worker_id, error):
+    job = ProcessingJob.query.get(job_id)
+    if job is None or not owns_lease(job_id, worker_id):
+        return
+    if not settle_job(job_id, status='failed', error_message=str(error), completed_at=datetime.utcnow()):
+        db.session.rollback()
+        return
+    finish_job(job_id, worker_id)
+    db.session.commit()
+    publish_job(job)
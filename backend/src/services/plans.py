@@ -0,0 +1,45 @@
+# Configurações dos planos
+PLANS = {
+    'basic': {
+        'name': 'Básico',
+        'price': 29.00,
+        'currency': 'BRL',
+        'images_limit': 50,
+        'uploads_per_minute': 10,
+        'features': [
+            '50 imagens por mês',
+            'Resolução até 4K',
+            'Suporte por email',
+            'Processamento padrão'
+        ]
+    },
+    'pro': {
+        'name': 'Pro',
+        'price': 79.00,
+        'currency': 'BRL',
+        'images_limit': 200,
+        'uploads_per_minute': 30,
+        'features': [
+            '200 imagens por mês',
+            'Resolução até 8K',
+            'Suporte prioritário',
+            'Processamento rápido',
+            'API de integração'
+        ]
+    },
+    'enterprise': {
+        'name': 'Empresarial',
+        'price': 199.00,
+        'currency': 'BRL',
+        'images_limit': -1,  # Ilimitado
+        'uploads_per_minute': 120,
+        'features': [
+            'Imagens ilimitadas',
+            'Resolução até 16K',
+            'Suporte 24/7',
+            'Processamento ultra-rápido',
+            'API completa',
+            'Gerenciamento de equipe'
+        ]
+    }
+}
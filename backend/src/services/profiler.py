@@ -0,0 +1,127 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from flask import g, request
+from src.services.admin import ADMIN_TOKEN, is_admin_request
+
+# Perfila todas as requisições selecionadas (use só em diagnóstico pontual)
+PROFILE_ALL = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+
+# Fração das requisições selecionadas que é perfilada (0.01 = 1%)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# Prefixos de rota elegíveis
+PROFILE_PATHS = tuple(p for p in os.environ.get('PROFILE_PATHS', '/api/upload').split(',') if p)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'profiles'))
+
+# Quantas funções entram no resumo texto
+SUMMARY_LINES = int(os.environ.get('PROFILE_SUMMARY_LINES', 25))
+
+# Desde o Python 3.12 o cProfile usa sys.monitoring, que vale para o processo
+# inteiro: só um profiler pode estar ativo e ele registra as chamadas de todas
+# as threads. Uma requisição por vez é perfilada, as demais seguem sem perfil
+_active = threading.Lock()
+
+# Perfis de 3.12+ incluem as outras threads do processo
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+def _should_profile():
+    if not request.path.startswith(PROFILE_PATHS):
+        return False
+    # Admin pede o perfil de uma requisição específica com X-Profile: 1
+    if request.headers.get('X-Profile') and is_admin_request():
+        return True
+    return PROFILE_ALL or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def _start():
+    if not _should_profile() or not _active.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Outra ferramenta de profiling já está ativa
+        _active.release()
+        return
+    g.profiler = profiler
+    g.profile_started = time.monotonic()
+
+
+def _stop():
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None
+    profiler.disable()
+    _active.release()
+    return profiler
+
+
+def _write(profiler, status_code):
+    """Grava o .prof (para snakeviz/pstats) e um resumo .txt das funções mais caras"""
+    elapsed = time.monotonic() - g.pop('profile_started')
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    profiler.dump_stats(base + '.prof')
+
+    summary = io.StringIO()
+    summary.write(f"{request.method} {request.path} -> {status_code} em {elapsed * 1000:.1f} ms\n")
+    if PROCESS_WIDE:
+        summary.write("Python 3.12+: inclui as chamadas das outras threads do processo no mesmo intervalo\n")
+    summary.write("\n")
+    stats = pstats.Stats(profiler, stream=summary).strip_dirs()
+    stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    stats.sort_stats('tottime').print_stats(SUMMARY_LINES)
+    with open(base + '.txt', 'w') as f:
+        f.write(summary.getvalue())
+    return profile_id
+
+
+def init_profiler(app):
+    """
+    Registra o profiling por requisição (cProfile) na app
+
+    Ativado por PROFILE_REQUESTS, PROFILE_SAMPLE_RATE ou pelo header X-Profile
+    de um admin (ADMIN_TOKEN). Sem nenhum deles configurado os hooks nem são
+    registrados, então o custo com o profiling desligado é zero.
+
+    As requisições perfiladas são serializadas por um lock; se já houver uma em
+    andamento, a nova segue sem perfil. Os números só valem com workers
+    síncronos (gunicorn -k sync, uma requisição por processo): com threads ou
+    no ASGI, no Python 3.12+ o perfil mistura as chamadas de outras requisições
+    atendidas ao mesmo tempo.
+    """
+    if not (PROFILE_ALL or PROFILE_SAMPLE_RATE > 0 or ADMIN_TOKEN):
+        return False
+
+    @app.before_request
+    def start_profile():
+        _start()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = _stop()
+        if profiler is not None:
+            try:
+                profile_id = _write(profiler, response.status_code)
+                response.headers['X-Profile-Id'] = profile_id
+                app.logger.info(f"Perfil {profile_id} gravado em {PROFILE_DIR}")
+            except Exception as e:
+                app.logger.error(f"Erro ao gravar perfil: {e}")
+        return response
+
+    @app.teardown_request
+    def abort_profile(error=None):
+        # Requisição terminou com exceção antes do after_request
+        _stop()
+
+    return True
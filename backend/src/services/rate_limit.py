@@ -0,0 +1,199 @@
+import math
+import os
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, session
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, User, RateLimitBucket
+from src.services.plans import PLANS
+
+# Limites por escopo: (requisições por minuto, rajada). O upload de usuários
+# com plano pago usa uploads_per_minute de plans.PLANS.
+RATE_LIMITS = {
+    'upload': {
+        'anonymous': (int(os.environ.get('RATE_LIMIT_UPLOAD_ANONYMOUS', 3)), 3),
+        'free': (int(os.environ.get('RATE_LIMIT_UPLOAD_FREE', 5)), 5),
+    },
+    'auth': {
+        'anonymous': (int(os.environ.get('RATE_LIMIT_AUTH', 10)), 5),
+    },
+}
+
+# memory: buckets no processo (um nó); database: tabela compartilhada entre os nós
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+# Atrás de proxy/load balancer o IP do cliente vem do X-Forwarded-For
+TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', '').lower() in ('1', 'true', 'yes')
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+def _refill(tokens, updated_at, now, rate, burst):
+    """Tokens disponíveis agora (rate em tokens por segundo, teto em burst)"""
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _verdict(tokens, cost, rate):
+    """(permitido, tokens restantes, segundos até haver tokens suficientes)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class MemoryBackend:
+    """Token buckets em memória (válidos só para o processo atual)"""
+
+    # Buckets cheios (ociosos) são descartados quando o dicionário passa disso
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            allowed, remaining, retry_after = _verdict(_refill(tokens, updated_at, now, rate, burst), cost, rate)
+            self._buckets[key] = (remaining, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, remaining, retry_after
+
+    def _prune(self, now):
+        # Um bucket ocioso há mais de uma hora certamente já está cheio
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 3600}
+
+
+class DatabaseBackend:
+    """
+    Token buckets numa tabela (rate_limit_buckets), compartilhados entre os nós
+
+    Cada verificação é uma transação curta: a linha do bucket é travada
+    (SELECT ... FOR UPDATE), reabastecida, debitada e gravada.
+    """
+
+    def take(self, key, rate, burst, cost=1):
+        now = time.time()
+        for _ in range(2):
+            bucket = RateLimitBucket.query.with_for_update().get(key)
+            if bucket is None:
+                allowed, remaining, retry_after = _verdict(burst, cost, rate)
+                db.session.add(RateLimitBucket(key=key, tokens=remaining, updated_at=now))
+            else:
+                allowed, remaining, retry_after = _verdict(
+                    _refill(bucket.tokens, bucket.updated_at, now, rate, burst), cost, rate
+                )
+                bucket.tokens = remaining
+                bucket.updated_at = now
+            try:
+                db.session.commit()
+                return allowed, remaining, retry_after
+            except IntegrityError:
+                # Outro nó criou o bucket ao mesmo tempo: tenta de novo travando a linha
+                db.session.rollback()
+        return True, 0.0, 0.0
+
+    def prune(self, max_idle=3600):
+        deleted = RateLimitBucket.query.filter(RateLimitBucket.updated_at < time.time() - max_idle).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'database': DatabaseBackend,
+}
+
+
+class RateLimiter:
+    """Aplica os limites de RATE_LIMITS com o backend configurado"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls):
+        return cls(BACKENDS[RATE_LIMIT_BACKEND]())
+
+    def limit_for(self, scope, plan):
+        """(requisições por minuto, rajada) do escopo para o plano"""
+        limits = RATE_LIMITS[scope]
+        if plan is None:
+            return limits['anonymous']
+        if scope == 'upload' and plan in PLANS:
+            per_minute = PLANS[plan]['uploads_per_minute']
+            return per_minute, max(1, per_minute // 2)
+        return limits.get(plan) or limits.get('free') or limits['anonymous']
+
+    def check(self, scope, user_id=None, plan=None, ip=None):
+        """
+        Consome um token do bucket do usuário (ou do IP, se anônimo)
+
+        Returns:
+            tuple: (permitido, limite por minuto, tokens restantes, Retry-After em segundos)
+        """
+        per_minute, burst = self.limit_for(scope, plan if user_id else None)
+        key = f"{scope}:user:{user_id}" if user_id else f"{scope}:ip:{ip}"
+        allowed, remaining, retry_after = self.backend.take(key, per_minute / 60.0, burst)
+        return allowed, per_minute, int(remaining), max(1, math.ceil(retry_after))
+
+
+def prune_buckets():
+    """Remove buckets ociosos do backend compartilhado (no de memória é automático)"""
+    if isinstance(rate_limiter.backend, DatabaseBackend):
+        return rate_limiter.backend.prune()
+    return 0
+
+
+def user_plan(user_id):
+    """Plano do usuário logado (None para anônimos)"""
+    if not user_id:
+        return None
+    user = User.query.get(user_id)
+    return (user.subscription_plan or 'free') if user else None
+
+
+def client_ip():
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+
+def rate_limited(scope):
+    """
+    Limita a rota por usuário (sessão) ou por IP, antes de qualquer trabalho
+
+    Excedido o limite, responde 429 com Retry-After.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return view(*args, **kwargs)
+            user_id = session.get('user_id')
+            try:
+                allowed, limit, remaining, retry_after = rate_limiter.check(
+                    scope, user_id, user_plan(user_id), client_ip()
+                )
+            except Exception as e:
+                # Falha do backend não derruba a rota
+                db.session.rollback()
+                print(f"Erro no rate limiter: {e}")
+                return view(*args, **kwargs)
+
+            if not allowed:
+                response = jsonify({'error': 'Muitas requisições. Tente novamente em instantes.'})
+                response.headers['Retry-After'] = str(retry_after)
+                response.headers['X-RateLimit-Limit'] = str(limit)
+                response.headers['X-RateLimit-Remaining'] = '0'
+                return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+rate_limiter = RateLimiter.from_env()
@@ -0,0 +1,218 @@
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from src.models.user import db, ProcessingJob, JobQueueEntry
+from src.services.upload_service import download_output, output_extension
+from src.services.artifact_store import artifact_store
+from src.services.job_events import publish_job
+from src.services.job_queue import settle_job, acquire_task_lease
+from src.services.replicate_service import list_predictions, parse_replicate_time
+from src.services.resolution import resample_to
+from src.services.thumbnail_service import schedule_previews
+from src.services.usage_ledger import record_usage
+
+# Status de jobs que ainda esperam o resultado de uma predição
+IN_FLIGHT_STATUSES = ('uploaded', 'processing')
+
+# Jobs mais novos que isso ainda podem estar sendo acompanhados pela requisição original
+MIN_AGE = float(os.environ.get('RECONCILE_MIN_AGE', 600))
+
+# Teto de páginas da listagem por execução (100 predições por página)
+MAX_PAGES = int(os.environ.get('RECONCILE_MAX_PAGES', 50))
+
+# Saídas baixadas em paralelo
+DOWNLOAD_WORKERS = int(os.environ.get('RECONCILE_DOWNLOAD_WORKERS', 4))
+
+# Intervalo (segundos) entre reconciliações em background; 0 desativa a thread
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', 300))
+
+# A thread existe em todo processo web, mas só o dono do lease reconcilia
+RECONCILE_LEASE = 'prediction-reconciler'
+
+
+def _in_flight_jobs(now):
+    """prediction_id -> (job_id, created_at) dos jobs parados à espera do Replicate"""
+    leased = select(JobQueueEntry.job_id).where(JobQueueEntry.lease_expires_at >= now)
+    rows = db.session.query(ProcessingJob.id, ProcessingJob.replicate_prediction_id, ProcessingJob.created_at).filter(
+        ProcessingJob.status.in_(IN_FLIGHT_STATUSES),
+        ProcessingJob.replicate_prediction_id.isnot(None),
+        ProcessingJob.created_at < now - timedelta(seconds=MIN_AGE),
+        # Jobs com lease válido estão sendo acompanhados por um worker
+        ProcessingJob.id.notin_(leased)
+    ).all()
+    db.session.commit()
+    return {prediction_id: (job_id, created_at) for job_id, prediction_id, created_at in rows}
+
+
+def _final_sizes(job_ids):
+    """job_id -> tamanho final pedido (resolução-alvo), lido da fila antes de ela ser removida"""
+    sizes = {}
+    for job_id, params in db.session.query(JobQueueEntry.job_id, JobQueueEntry.params).filter(
+        JobQueueEntry.job_id.in_(list(job_ids))
+    ):
+        final_size = json.loads(params or '{}').get('final_size')
+        if final_size:
+            sizes[job_id] = final_size
+    return sizes
+
+
+def _store_output(output, final_size=None):
+    """Baixa a saída de uma predição (ajustada ao tamanho final, como no worker) para o artifact store"""
+    url = output if isinstance(output, str) else output[0]
+    ext = output_extension(url)
+    path = download_output(url, f".{ext}")
+    try:
+        if final_size:
+            resample_to(path, final_size)
+    except Exception:
+        os.unlink(path)
+        raise
+    return artifact_store.put_file(path, ext, move=True)
+
+
+def _apply(predictions, now):
+    """
+    Aplica as transições de uma página de predições numa única transação
+
+    As saídas das predições concluídas são baixadas em paralelo antes. Cada
+    job é então atualizado com um UPDATE condicional ao status (settle_job):
+    se a requisição original, o worker ou outra reconciliação já concluiu o
+    job, a transição não acontece e o uso não é cobrado de novo.
+
+    Returns:
+        tuple: (concluídos, falhos)
+    """
+    updates = {}
+    succeeded = []
+    for job_id, prediction in predictions:
+        status = prediction.get('status')
+        if status == 'succeeded' and prediction.get('output'):
+            succeeded.append((job_id, prediction['output']))
+        elif status in ('failed', 'canceled'):
+            updates[job_id] = {
+                'status': 'failed', 'completed_at': now,
+                'error_message': prediction.get('error') or f"Predição {status}",
+            }
+
+    if succeeded:
+        final_sizes = _final_sizes(job_id for job_id, _ in succeeded)
+        db.session.commit()
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            futures = {
+                job_id: pool.submit(_store_output, output, final_sizes.get(job_id))
+                for job_id, output in succeeded
+            }
+        for job_id, future in futures.items():
+            try:
+                updates[job_id] = {'status': 'completed', 'completed_at': now, 'output_path': future.result()}
+            except Exception as e:
+                updates[job_id] = {
+                    'status': 'failed', 'completed_at': now,
+                    'error_message': f"Erro ao baixar a imagem processada: {e}",
+                }
+    if not updates:
+        return 0, 0
+
+    owners = dict(db.session.query(ProcessingJob.id, ProcessingJob.user_id).filter(ProcessingJob.id.in_(list(updates))))
+    settled = [job_id for job_id, values in updates.items() if settle_job(job_id, IN_FLIGHT_STATUSES, **values)]
+    if not settled:
+        db.session.commit()
+        return 0, 0
+
+    completed = [job_id for job_id in settled if updates[job_id]['status'] == 'completed']
+    for job_id in completed:
+        record_usage(owners[job_id], job_id, commit=False)
+    JobQueueEntry.query.filter(JobQueueEntry.job_id.in_(settled)).delete(synchronize_session=False)
+    db.session.commit()
+
+    for job in ProcessingJob.query.filter(ProcessingJob.id.in_(settled)).all():
+        publish_job(job)
+        if job.status == 'completed':
+            schedule_previews(job.output_path)
+    return len(completed), len(settled) - len(completed)
+
+
+def reconcile_predictions(max_pages=MAX_PAGES):
+    """
+    Reconcilia os jobs parados com o estado das predições no Replicate
+
+    Em vez de uma consulta por job, percorre a listagem de predições (100 por
+    página, mais recentes primeiro) e casa os resultados com os jobs pelo
+    replicate_prediction_id, carregados numa única consulta. Para quando todos
+    os jobs foram encontrados ou a listagem passa do job mais antigo.
+
+    Returns:
+        dict: Jobs pendentes, páginas lidas, concluídos, falhos, ainda rodando e não encontrados
+    """
+    now = datetime.utcnow()
+    pending = _in_flight_jobs(now)
+    report = {'in_flight': len(pending), 'pages': 0, 'completed': 0, 'failed': 0, 'running': 0, 'not_found': 0}
+    if not pending:
+        return report
+    # Folga para diferenças de relógio entre o banco e o Replicate
+    oldest = min(created_at for _, created_at in pending.values()) - timedelta(minutes=5)
+
+    page_url = None
+    while pending and report['pages'] < max_pages:
+        results, page_url = list_predictions(page_url)
+        report['pages'] += 1
+
+        matched = []
+        for prediction in results:
+            entry = pending.pop(prediction.get('id'), None)
+            if entry is None:
+                continue
+            if prediction.get('status') in ('starting', 'processing'):
+                report['running'] += 1
+            else:
+                matched.append((entry[0], prediction))
+        completed, failed = _apply(matched, now)
+        report['completed'] += completed
+        report['failed'] += failed
+
+        if not page_url or not results:
+            break
+        last_created = parse_replicate_time(results[-1].get('created_at'))
+        if last_created and last_created < oldest:
+            break
+
+    report['not_found'] = len(pending)
+    return report
+
+
+def start_reconciler(app):
+    """
+    Executa reconcile_predictions periodicamente numa thread daemon (a primeira logo após o start)
+
+    Cada worker do gunicorn inicia a thread, mas a cada rodada só o processo
+    que detém o lease RECONCILE_LEASE reconcilia; se ele cair, outro assume
+    quando o lease vencer.
+    """
+    if RECONCILE_INTERVAL <= 0:
+        return None
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop():
+        delay = min(60, RECONCILE_INTERVAL)
+        while True:
+            time.sleep(delay)
+            delay = RECONCILE_INTERVAL
+            with app.app_context():
+                try:
+                    if not acquire_task_lease(RECONCILE_LEASE, holder, RECONCILE_INTERVAL * 2):
+                        continue
+                    report = reconcile_predictions()
+                    if report['in_flight']:
+                        app.logger.info(f"Reconciliação de predições: {report}")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro na reconciliação de predições: {e}")
+
+    thread = threading.Thread(target=loop, name='prediction-reconciler', daemon=True)
+    thread.start()
+    return thread
@@ -1,7 +1,83 @@
 import replicate
 import os
+import threading
+import time
 import requests
+import httpx
+from datetime import datetime
+from contextlib import asynccontextmanager, contextmanager
 from flask import current_app
+from src.services.concurrency_limiter import replicate_limiter, LimiterSaturated
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpen
+
+# API HTTP do Replicate (ou um substituto local, ex.: loadtest/fake_replicate.py)
+REPLICATE_API_URL = os.environ.get('REPLICATE_API_URL', 'https://api.replicate.com/v1')
+
+# Intervalo (segundos) entre verificações de saúde em background
+HEALTH_REFRESH_INTERVAL = float(os.environ.get('REPLICATE_HEALTH_INTERVAL', 30))
+
+def _http_status(exc):
+    """Status HTTP de um erro do Replicate/requests/httpx (None se não houver resposta)"""
+    status = getattr(exc, 'status', None)
+    if isinstance(status, int):
+        return status
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def _breaker_verdict(exc):
+    """
+    Classifica exceções para o circuit breaker do Replicate
+
+    Só contam como falha do provedor: 5xx, 429, timeouts e erros de conexão.
+    Outros 4xx (entrada inválida, token errado) mostram que o provedor está
+    respondendo; contá-los deixaria poucas requisições ruins (ex.: scale=999)
+    abrirem o circuito para todos os usuários.
+    """
+    if isinstance(exc, LimiterSaturated):
+        return None
+    if isinstance(exc, replicate.exceptions.ModelError):
+        # O provedor respondeu; o problema é a entrada
+        return False
+    status = _http_status(exc)
+    if status is not None:
+        return status >= 500 or status == 429
+    if isinstance(exc, (TimeoutError, ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ConnectionError, httpx.TransportError)):
+        return True
+    # Erro do cliente do Replicate sem resposta HTTP associada
+    return isinstance(exc, replicate.exceptions.ReplicateError)
+
+replicate_breaker = CircuitBreaker.from_env('replicate', 'REPLICATE', is_failure=_breaker_verdict)
+
+@contextmanager
+def replicate_call():
+    """
+    Protege uma chamada ao Replicate com o circuit breaker e o limitador de concorrência
+
+    Levanta CircuitOpen (circuito aberto) ou LimiterSaturated (fila cheia) sem
+    tocar a rede.
+    """
+    with replicate_breaker.guard(), replicate_limiter.slot():
+        yield
+
+@asynccontextmanager
+async def async_replicate_call():
+    """Versão asyncio de replicate_call()"""
+    replicate_breaker.before_call()
+    try:
+        async with replicate_limiter.async_slot():
+            yield
+    except Exception as e:
+        verdict = _breaker_verdict(e)
+        if verdict is None:
+            replicate_breaker.release_probe()
+        elif verdict:
+            replicate_breaker.record_failure()
+        else:
+            replicate_breaker.record_success()
+        raise
+    else:
+        replicate_breaker.record_success()
 
 def process_image_with_replicate(input_image_path):
     """
@@ -24,7 +100,7 @@ def process_image_with_replicate(input_image_path):
         replicate_client = replicate.Client(api_token=api_token)
         
         # Abrir e ler a imagem
-        with open(input_image_path, 'rb') as image_file:
+        with open(input_image_path, 'rb') as image_file, replicate_call():
             # Executar o modelo Real-ESRGAN
             output = replicate_client.run(
                 "nightmareai/real-esrgan:42fed1c4974146d4d2414e2be2c5277c7fcf05fcc3a73abf41610695738c1d7b",
@@ -43,6 +119,8 @@ def process_image_with_replicate(input_image_path):
                 current_app.logger.error("Replicate retornou output vazio")
                 return None
                 
+    except (LimiterSaturated, CircuitOpen):
+        raise
     except Exception as e:
         current_app.logger.error(f"Erro no processamento Replicate: {str(e)}")
         return None
@@ -68,7 +146,7 @@ def process_image_async(input_image_path):
         replicate_client = replicate.Client(api_token=api_token)
         
         # Abrir e ler a imagem
-        with open(input_image_path, 'rb') as image_file:
+        with open(input_image_path, 'rb') as image_file, replicate_call():
             # Criar predição assíncrona
             prediction = replicate_client.predictions.create(
                 version="42fed1c4974146d4d2414e2be2c5277c7fcf05fcc3a73abf41610695738c1d7b",
@@ -82,6 +160,8 @@ def process_image_async(input_image_path):
             current_app.logger.info(f"Predição criada: {prediction.id}")
             return prediction.id
                 
+    except (LimiterSaturated, CircuitOpen):
+        raise
     except Exception as e:
         current_app.logger.error(f"Erro ao criar predição: {str(e)}")
         return None
@@ -102,7 +182,8 @@ def get_prediction_status(prediction_id):
             return {'status': 'error', 'error': 'Token não configurado'}
         
         replicate_client = replicate.Client(api_token=api_token)
-        prediction = replicate_client.predictions.get(prediction_id)
+        with replicate_call():
+            prediction = replicate_client.predictions.get(prediction_id)
         
         return {
             'status': prediction.status,
@@ -110,10 +191,38 @@ def get_prediction_status(prediction_id):
             'error': prediction.error
         }
         
+    except (LimiterSaturated, CircuitOpen) as e:
+        return {'status': 'error', 'error': str(e), 'retry_after': e.retry_after}
     except Exception as e:
         current_app.logger.error(f"Erro ao verificar predição: {str(e)}")
         return {'status': 'error', 'error': str(e)}
 
+def parse_replicate_time(value):
+    """Converte um timestamp da API do Replicate (ISO 8601, UTC) em datetime; None se vazio/inválido"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+
+def list_predictions(page_url=None):
+    """
+    Busca uma página da listagem de predições (mais recentes primeiro)
+
+    Args:
+        page_url (str): URL "next" da página anterior (None = primeira página)
+
+    Returns:
+        tuple: (lista de predições em dict, URL da próxima página ou None)
+    """
+    headers = {'Authorization': f"Token {os.environ.get('REPLICATE_API_TOKEN', '')}"}
+    with replicate_call():
+        response = requests.get(page_url or f"{REPLICATE_API_URL}/predictions", headers=headers, timeout=30)
+        response.raise_for_status()
+    data = response.json()
+    return data.get('results', []), data.get('next')
+
 def download_image(url, output_path):
     """
     Baixa uma imagem de uma URL
@@ -155,10 +264,76 @@ def health_check():
         replicate_client = replicate.Client(api_token=api_token)
         
         # Fazer uma requisição simples para testar
+        # O probe ignora o circuit breaker (é ele que decide quando fechá-lo) e o
+        # limitador: sua latência baixa puxaria para baixo a média das predições
         models = list(replicate_client.models.list()[:1])
         
-        return {'status': 'healthy', 'message': 'Replicate acessível'}
+        return {
+            'status': 'healthy',
+            'message': 'Replicate acessível',
+            'limiter': replicate_limiter.snapshot()
+        }
         
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+_health_lock = threading.Lock()
+_health_state = {'status': 'unknown', 'message': 'Ainda não verificado', 'checked_at': None}
+_health_thread = None
+
+def refresh_health():
+    """
+    Executa o health check e atualiza o estado em cache
+    
+    Um probe bem-sucedido fecha o circuit breaker do Replicate.
+    
+    Returns:
+        dict: Resultado do health check
+    """
+    global _health_state
+    result = health_check()
+    result['checked_at'] = time.time()
+    if result['status'] == 'healthy':
+        replicate_breaker.record_success()
+    with _health_lock:
+        _health_state = result
+    return result
+
+def _health_loop(app):
+    last_status = None
+    while True:
+        try:
+            result = refresh_health()
+            if result['status'] != last_status and result['status'] != 'healthy':
+                app.logger.warning(f"Health check do Replicate: {result['status']} ({result.get('message')})")
+            last_status = result['status']
+        except Exception as e:
+            app.logger.error(f"Erro no health check do Replicate: {e}")
+        time.sleep(HEALTH_REFRESH_INTERVAL)
+
+def start_health_monitor(app):
+    """Inicia (uma vez por processo) a thread que atualiza o health check em background"""
+    global _health_thread
+    with _health_lock:
+        if _health_thread is not None and _health_thread.is_alive():
+            return _health_thread
+        _health_thread = threading.Thread(target=_health_loop, args=(app,), name='replicate-health', daemon=True)
+        _health_thread.start()
+        return _health_thread
+
+def get_cached_health():
+    """
+    Retorna o último estado de saúde conhecido sem fazer chamadas de rede
+    
+    Returns:
+        dict: Status em cache, idade da verificação e estado do circuit breaker
+    """
+    with _health_lock:
+        state = dict(_health_state)
+    breaker = replicate_breaker.snapshot()
+    if breaker['state'] == CircuitBreaker.OPEN and state['status'] == 'healthy':
+        state['status'] = 'degraded'
+    state['age'] = round(time.time() - state['checked_at'], 1) if state['checked_at'] else None
+    state['breaker'] = breaker
+    state['limiter'] = replicate_limiter.snapshot()
+    return state
@@ -0,0 +1,84 @@
+import math
+from PIL import Image
+
+# Escalas inteiras aceitas pelo Real-ESRGAN
+SUPPORTED_SCALES = (2, 3, 4, 5, 6, 7, 8)
+
+
+def fit_within(width, height, target_width=None, target_height=None):
+    """
+    Maior tamanho com a proporção de (width, height) que cabe no alvo
+
+    Se só uma das dimensões do alvo for informada, a outra segue a proporção.
+    Dimensões zero ou negativas levantam ValueError (400 nas rotas).
+
+    Returns:
+        tuple: (largura, altura) finais
+    """
+    if target_width is None and target_height is None:
+        raise ValueError("Informe target_width e/ou target_height")
+    for name, value in (('target_width', target_width), ('target_height', target_height)):
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} deve ser maior que zero")
+
+    ratios = []
+    if target_width is not None:
+        ratios.append(target_width / width)
+    if target_height is not None:
+        ratios.append(target_height / height)
+    ratio = min(ratios)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def plan_target(width, height, target_width=None, target_height=None):
+    """
+    Escolhe a menor escala do modelo que atinge (ou supera) o tamanho alvo
+
+    Args:
+        width (int): Largura da imagem enviada ao modelo
+        height (int): Altura da imagem enviada ao modelo
+        target_width (int): Largura desejada (opcional)
+        target_height (int): Altura desejada (opcional)
+
+    Returns:
+        tuple: (escala do modelo ou None se não precisar do modelo, (largura, altura) finais)
+    """
+    final_width, final_height = fit_within(width, height, target_width, target_height)
+    needed = max(final_width / width, final_height / height)
+    if needed <= 1:
+        # Alvo menor ou igual à origem: basta reamostrar localmente
+        return None, (final_width, final_height)
+
+    for scale in SUPPORTED_SCALES:
+        if scale >= needed:
+            return scale, (final_width, final_height)
+
+    max_scale = SUPPORTED_SCALES[-1]
+    raise ValueError(
+        f"Tamanho alvo {final_width}x{final_height} exige escala {math.ceil(needed)}x; "
+        f"o máximo é {max_scale}x ({width * max_scale}x{height * max_scale})"
+    )
+
+
+def resample_to(path, size, output_path=None):
+    """
+    Ajusta a imagem em disco ao tamanho final com reamostragem LANCZOS
+
+    Args:
+        path (str): Caminho da imagem
+        size (tuple): (largura, altura) finais
+        output_path (str): Onde salvar (padrão: sobrescreve path)
+
+    Returns:
+        str: Caminho da imagem ajustada
+    """
+    output_path = output_path or path
+    with Image.open(path) as img:
+        image_format = img.format or 'PNG'
+        if img.size == tuple(size):
+            if output_path != path:
+                img.save(output_path, format=image_format)
+            return output_path
+        resized = img.resize(tuple(size), Image.LANCZOS, reducing_gap=3.0)
+    resized.save(output_path, format=image_format)
+    return output_path
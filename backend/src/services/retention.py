@@ -0,0 +1,250 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select
+from src.models.user import db, User, ProcessingJob, JobQueueEntry
+from src.services.artifact_store import artifact_store, retention_days, RETENTION_DAYS
+from src.services.chunked_upload import purge_stale_sessions
+from src.services.job_metrics import purge_old_metrics
+from src.services.job_queue import OPEN_STATUSES, acquire_task_lease
+from src.services.rate_limit import prune_buckets
+
+# Retenção (em dias) do registro do job no histórico; os arquivos saem antes
+# (RETENTION_DAYS), a linha do job sai depois deste prazo.
+# Pode ser sobrescrita por plano: JOB_RETENTION_DAYS_PRO=180
+JOB_RETENTION_DAYS = {
+    'free': 30,
+    'basic': 90,
+    'pro': 365,
+    'enterprise': 730,
+}
+
+# Jobs por transação: cada lote trava poucas linhas por pouco tempo
+BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 500))
+
+# Pausa (segundos) entre lotes, para não monopolizar o banco e o disco
+BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', 0.05))
+
+# Intervalo (segundos) entre varreduras em background; 0 desativa a thread
+SWEEP_INTERVAL = float(os.environ.get('RETENTION_SWEEP_INTERVAL', os.environ.get('ARTIFACT_PURGE_INTERVAL', 3600)))
+
+
+# Intervalo (segundos) entre passadas da eviction LRU do armazenamento; 0 desativa
+EVICT_INTERVAL = float(os.environ.get('ARTIFACT_EVICT_INTERVAL', 60))
+
+# Arquivos mais novos que isso não saem na eviction (o job pode ainda não estar gravado)
+EVICT_MIN_AGE = float(os.environ.get('ARTIFACT_EVICT_MIN_AGE', 600))
+
+
+def job_retention_days(plan):
+    """Retorna a retenção (em dias) das linhas de job do plano informado"""
+    override = os.environ.get(f'JOB_RETENTION_DAYS_{(plan or "free").upper()}')
+    if override:
+        return int(override)
+    return JOB_RETENTION_DAYS.get(plan, JOB_RETENTION_DAYS['free'])
+
+
+def _plans():
+    plans = {p for (p,) in db.session.query(User.subscription_plan).distinct()}
+    return set(RETENTION_DAYS) | set(JOB_RETENTION_DAYS) | plans
+
+
+def _expired_batch(plan, cutoff, limit, with_artifacts):
+    """Ids e chaves de um lote de jobs do plano criados antes de cutoff"""
+    query = (
+        db.session.query(ProcessingJob.id, ProcessingJob.input_path, ProcessingJob.output_path)
+        .join(User, User.id == ProcessingJob.user_id)
+        .filter(func.coalesce(User.subscription_plan, 'free') == plan)
+        .filter(ProcessingJob.created_at < cutoff)
+        # Jobs ainda na fila dos workers não são tocados
+        .filter(ProcessingJob.id.notin_(select(JobQueueEntry.job_id)))
+    )
+    if with_artifacts:
+        query = query.filter(or_(ProcessingJob.input_path.isnot(None), ProcessingJob.output_path.isnot(None)))
+    rows = query.order_by(ProcessingJob.id).limit(limit).all()
+    ids = [job_id for job_id, _, _ in rows]
+    keys = {key for _, input_path, output_path in rows for key in (input_path, output_path) if key}
+    return ids, keys
+
+
+def _touched_since(key, since):
+    """Indica se o arquivo foi gravado/reaproveitado (put_file faz touch) depois de `since`"""
+    try:
+        return os.path.getmtime(artifact_store.path_for(key)) >= since
+    except OSError:
+        return False
+
+
+def _delete_unreferenced(keys, since):
+    """
+    Apaga os arquivos (e derivados) que nenhum job restante referencia
+
+    Um upload novo com o mesmo conteúdo pode reaproveitar a chave entre a
+    consulta e a remoção; como put_file atualiza o mtime ao reaproveitar,
+    arquivos tocados depois do início da varredura (`since`, epoch) ficam.
+
+    Returns:
+        tuple: (arquivos removidos, bytes liberados)
+    """
+    if not keys:
+        return 0, 0
+    referenced = set()
+    rows = db.session.query(ProcessingJob.input_path, ProcessingJob.output_path).filter(
+        or_(ProcessingJob.input_path.in_(keys), ProcessingJob.output_path.in_(keys))
+    ).all()
+    db.session.commit()
+    for input_path, output_path in rows:
+        referenced.update((input_path, output_path))
+
+    files = freed = 0
+    for key in keys - referenced:
+        if _touched_since(key, since):
+            continue
+        removed = artifact_store.delete_with_variants(key)
+        if removed:
+            files += 1
+            freed += removed
+    return files, freed
+
+
+def sweep_expired(now=None, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """
+    Remove artefatos e jobs cuja retenção (por plano) expirou, em lotes
+
+    Primeira fase: limpa input_path/output_path dos jobs além de RETENTION_DAYS.
+    Segunda fase: apaga as linhas dos jobs além de JOB_RETENTION_DAYS. Cada lote
+    é uma transação curta; os arquivos só são apagados depois do commit e se
+    nenhum outro job ainda apontar para o mesmo conteúdo. Por fim descarta os
+    uploads em partes abandonados e o histórico de tempos antigo.
+
+    Args:
+        now (datetime): Referência de tempo (padrão: agora, UTC)
+        batch_size (int): Jobs por transação
+        pause (float): Pausa entre lotes, em segundos
+
+    Returns:
+        dict: Jobs limpos/apagados, arquivos e bytes liberados, lotes e duração
+    """
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    started_at = time.time()
+    report = {'artifacts_cleared': 0, 'jobs_deleted': 0, 'files_deleted': 0, 'bytes_freed': 0, 'batches': 0}
+
+    for plan in sorted(_plans()):
+        phases = (
+            (now - timedelta(days=retention_days(plan)), True),
+            (now - timedelta(days=job_retention_days(plan)), False),
+        )
+        for cutoff, artifacts_only in phases:
+            while True:
+                ids, keys = _expired_batch(plan, cutoff, batch_size, artifacts_only)
+                if not ids:
+                    db.session.commit()
+                    break
+
+                jobs = ProcessingJob.query.filter(ProcessingJob.id.in_(ids))
+                if artifacts_only:
+                    jobs.update({'input_path': None, 'output_path': None}, synchronize_session=False)
+                    report['artifacts_cleared'] += len(ids)
+                else:
+                    jobs.delete(synchronize_session=False)
+                    report['jobs_deleted'] += len(ids)
+                db.session.commit()
+
+                files, freed = _delete_unreferenced(keys, started_at)
+                report['files_deleted'] += files
+                report['bytes_freed'] += freed
+                report['batches'] += 1
+
+                if len(ids) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+
+    # Uploads em partes abandonados
+    report['uploads_discarded'] = purge_stale_sessions(now)
+    # Histórico de tempos (mantido além da vida do job)
+    report['metrics_deleted'] = purge_old_metrics(now, batch_size)
+    prune_buckets()
+    report['seconds'] = round(time.monotonic() - started, 3)
+    return report
+
+
+def start_retention_sweeper(app):
+    """
+    Executa sweep_expired periodicamente numa thread daemon
+
+    Só o processo que detém o lease 'retention' varre em cada rodada.
+    """
+    if SWEEP_INTERVAL <= 0:
+        return None
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop():
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            with app.app_context():
+                try:
+                    if not acquire_task_lease('retention', holder, SWEEP_INTERVAL * 2):
+                        continue
+                    report = sweep_expired()
+                    if report['batches'] or report['uploads_discarded'] or report['metrics_deleted']:
+                        app.logger.info(f"Retenção: {report}")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro na varredura de retenção: {e}")
+
+    thread = threading.Thread(target=loop, name='retention-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def _open_job_keys():
+    """Artefatos de jobs ainda sem resultado (o worker ou a reconciliação ainda vão lê-los)"""
+    rows = db.session.query(ProcessingJob.input_path, ProcessingJob.output_path).filter(
+        ProcessingJob.status.in_(OPEN_STATUSES)
+    ).all()
+    db.session.commit()
+    return {key for row in rows for key in row if key}
+
+
+def evict_artifacts():
+    """
+    Aplica o orçamento de bytes do armazenamento (LRU), poupando os jobs em andamento
+
+    Returns:
+        int: Bytes liberados
+    """
+    return artifact_store.evict(protected=_open_job_keys(), min_age=EVICT_MIN_AGE)
+
+
+def start_artifact_evictor(app):
+    """
+    Executa evict_artifacts periodicamente numa thread daemon
+
+    A varredura do disco sai do caminho das requisições; só o processo que
+    detém o lease 'artifact-eviction' a executa em cada rodada.
+    """
+    if EVICT_INTERVAL <= 0:
+        return None
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop():
+        while True:
+            time.sleep(EVICT_INTERVAL)
+            with app.app_context():
+                try:
+                    if not acquire_task_lease('artifact-eviction', holder, EVICT_INTERVAL * 2):
+                        continue
+                    freed = evict_artifacts()
+                    if freed:
+                        app.logger.info(f"Eviction do armazenamento: {freed} bytes liberados")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro na eviction do armazenamento: {e}")
+
+    thread = threading.Thread(target=loop, name='artifact-evictor', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,110 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from src.services.animation import is_animated_file
+from src.services.artifact_store import artifact_store
+from src.services.tile_service import schedule_tiles
+
+# Variantes geradas para cada saída: nome -> lado máximo (px), qualidade WebP
+PREVIEW_SIZES = {
+    'preview': (1280, 82),
+    'thumb': (320, 75),
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('THUMBNAIL_WORKERS', 2)),
+    thread_name_prefix='thumbnails'
+)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def variant_key(source_key, name):
+    """Chave da miniatura/preview de um artefato"""
+    return artifact_store.variant_key(source_key, name, 'webp')
+
+
+def _to_webp_mode(img):
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    if img.mode in ('LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        return img.convert('RGBA')
+    return img.convert('RGB')
+
+
+def render_previews(source_key):
+    """
+    Gera as miniaturas/previews WebP de um artefato
+
+    A imagem é reduzida já na decodificação quando o formato permite (draft do
+    JPEG) e depois com Image.reduce via thumbnail(reducing_gap=...), que é bem
+    mais barato que um LANCZOS direto sobre a imagem inteira. Cada variante é
+    derivada da anterior (maior -> menor).
+
+    Returns:
+        dict: nome da variante -> chave do artefato
+    """
+    largest = max(size for size, _ in PREVIEW_SIZES.values())
+    keys = {}
+    with Image.open(artifact_store.path_for(source_key)) as img:
+        img.draft('RGB', (largest, largest))
+        current = _to_webp_mode(img)
+        for name, (size, quality) in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1][0]):
+            current.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            current.save(buffer, format='WEBP', quality=quality, method=4)
+            keys[name] = artifact_store.put_variant(source_key, name, 'webp', buffer.getvalue())
+    return keys
+
+
+def _render_and_forget(source_key):
+    try:
+        keys = render_previews(source_key)
+        # Saídas muito grandes também ganham a pirâmide de tiles (visualização com zoom)
+        schedule_tiles(source_key)
+        return keys
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(source_key, None)
+
+
+def schedule_previews(source_key):
+    """
+    Agenda a geração das previews no pool em background (sem duplicar trabalho)
+
+    Returns:
+        Future: futuro da geração em andamento para este artefato
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(source_key)
+        if future is None:
+            future = _executor.submit(_render_and_forget, source_key)
+            _in_flight[source_key] = future
+        return future
+
+
+def get_preview(source_key, name, timeout=30):
+    """
+    Retorna a chave da preview pedida, gerando-a se ainda não existir
+
+    Args:
+        source_key (str): Chave do artefato de origem
+        name (str): Nome da variante ('thumb' ou 'preview')
+        timeout (float): Tempo máximo de espera pela geração
+
+    Saídas animadas não têm previews (seriam só o primeiro quadro): a própria
+    saída é entregue no lugar.
+
+    Returns:
+        str: Chave da variante ou None se a origem não existir
+    """
+    if name not in PREVIEW_SIZES or not artifact_store.exists(source_key):
+        return None
+    key = variant_key(source_key, name)
+    if artifact_store.exists(key):
+        return key
+    if is_animated_file(artifact_store.path_for(source_key)):
+        return source_key
+    return schedule_previews(source_key).result(timeout=timeout).get(name)
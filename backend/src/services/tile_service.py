@@ -0,0 +1,207 @@
+import io
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from src.services.artifact_store import artifact_store
+
+# Pirâmide Deep Zoom (DZI): lado do tile, sobreposição entre tiles e qualidade WebP
+TILE_SIZE = int(os.environ.get('TILE_SIZE', 254))
+TILE_OVERLAP = 1
+TILE_QUALITY = int(os.environ.get('TILE_QUALITY', 80))
+
+# Saídas a partir deste tamanho ganham a pirâmide automaticamente ao concluir
+TILE_MIN_PIXELS = int(os.environ.get('TILE_MIN_PIXELS', 16000000))
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+    'Overlap="{overlap}" Format="webp"><Size Width="{width}" Height="{height}"/></Image>\n'
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('TILE_WORKERS', 1)),
+    thread_name_prefix='tiles'
+)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def descriptor_key(source_key):
+    """Chave do descritor .dzi (gravado por último: marca a pirâmide como pronta)"""
+    return artifact_store.variant_key(source_key, 'tiles', 'dzi')
+
+
+def tile_key(source_key, level, col, row):
+    """
+    Chave de um tile: um subdiretório por nível, ao lado da origem
+
+    ab/cd/<hash>.tiles/<nível>/<coluna>_<linha>.webp, assim os milhares de tiles
+    de uma saída grande não se acumulam no diretório do shard.
+    """
+    return os.path.join(artifact_store.variant_dir(source_key, 'tiles'), str(level), f"{col}_{row}.webp")
+
+
+def max_level(width, height):
+    return int(math.ceil(math.log2(max(width, height, 1))))
+
+
+def level_size(width, height, level):
+    """Dimensões de um nível da pirâmide (ceil a cada metade, como no DZI)"""
+    factor = 2 ** (max_level(width, height) - level)
+    return math.ceil(width / factor), math.ceil(height / factor)
+
+
+def level_grid(width, height):
+    """Colunas e linhas de tiles de um nível com as dimensões dadas"""
+    return int(math.ceil(width / TILE_SIZE)), int(math.ceil(height / TILE_SIZE))
+
+
+def _missing_tiles(source_key, level, width, height):
+    columns, rows = level_grid(width, height)
+    return [
+        (col, row)
+        for col in range(columns)
+        for row in range(rows)
+        if not artifact_store.exists(tile_key(source_key, level, col, row))
+    ]
+
+
+def _save_level(source_key, img, level, tiles):
+    width, height = img.size
+    for col, row in tiles:
+        left = col * TILE_SIZE - (TILE_OVERLAP if col else 0)
+        top = row * TILE_SIZE - (TILE_OVERLAP if row else 0)
+        right = min(width, (col + 1) * TILE_SIZE + TILE_OVERLAP)
+        bottom = min(height, (row + 1) * TILE_SIZE + TILE_OVERLAP)
+        buffer = io.BytesIO()
+        img.crop((left, top, right, bottom)).save(buffer, format='WEBP', quality=TILE_QUALITY, method=4)
+        artifact_store.put_key(tile_key(source_key, level, col, row), buffer.getvalue())
+
+
+def _open_source(source_key):
+    with Image.open(artifact_store.path_for(source_key)) as img:
+        return img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+
+def render_tiles(source_key):
+    """
+    Gera a pirâmide Deep Zoom de um artefato (só os tiles que faltam)
+
+    Começa pelo nível de resolução cheia e cada nível seguinte é a metade do
+    anterior (Image.reduce, sem reabrir a imagem), até 1x1. Tiles já presentes
+    (ex.: o descritor foi removido pela eviction, mas os tiles não) não são
+    regravados. Os tiles ficam em tile_key, ao lado da origem, então a retenção
+    os remove junto com ela.
+
+    Returns:
+        str: Chave do descritor .dzi
+    """
+    current = _open_source(source_key)
+    width, height = current.size
+
+    level = max_level(width, height)
+    while True:
+        missing = _missing_tiles(source_key, level, *current.size)
+        if missing:
+            _save_level(source_key, current, level, missing)
+        if level == 0:
+            break
+        # reduce arredonda para cima: ceil(w / 2), como a especificação do DZI
+        current = current.reduce(2)
+        level -= 1
+
+    descriptor = DZI_TEMPLATE.format(tile_size=TILE_SIZE, overlap=TILE_OVERLAP, width=width, height=height)
+    return artifact_store.put_variant(source_key, 'tiles', 'dzi', descriptor.encode('utf-8'))
+
+
+def render_level(source_key, level):
+    """
+    Regrava só os tiles que faltam num nível (ex.: removidos pela eviction)
+
+    O nível é obtido direto da origem com um único Image.reduce pelo fator do
+    nível, sem passar pelos outros.
+
+    Returns:
+        int: Tiles regravados
+    """
+    img = _open_source(source_key)
+    width, height = img.size
+    factor = 2 ** (max_level(width, height) - level)
+    missing = _missing_tiles(source_key, level, *level_size(width, height, level))
+    if not missing:
+        return 0
+    if factor > 1:
+        img = img.reduce(factor)
+    _save_level(source_key, img, level, missing)
+    return len(missing)
+
+
+def _run_and_forget(key, func, *args):
+    try:
+        return func(*args)
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def _submit(key, func, *args):
+    """Agenda func no executor, sem duplicar uma tarefa com a mesma chave ainda em andamento"""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _executor.submit(_run_and_forget, key, func, *args)
+            _in_flight[key] = future
+        return future
+
+
+def schedule_tiles(source_key, force=False):
+    """
+    Agenda a geração da pirâmide em background (sem duplicar trabalho)
+
+    Sem force, só agenda para saídas grandes (TILE_MIN_PIXELS) ainda sem pirâmide.
+
+    Returns:
+        Future: futuro da geração (ou None se não foi agendada)
+    """
+    if not force:
+        if artifact_store.exists(descriptor_key(source_key)):
+            return None
+        try:
+            with Image.open(artifact_store.path_for(source_key)) as img:
+                if img.width * img.height < TILE_MIN_PIXELS:
+                    return None
+        except Exception:
+            return None
+    return _submit(source_key, render_tiles, source_key)
+
+
+def schedule_level(source_key, level):
+    """
+    Agenda a regravação dos tiles que faltam num nível (pirâmide já gerada)
+
+    Returns:
+        Future: futuro da regravação (ou da geração completa em andamento)
+    """
+    with _in_flight_lock:
+        # A pirâmide inteira já está sendo gerada: ela inclui o nível
+        future = _in_flight.get(source_key)
+    if future is not None:
+        return future
+    return _submit((source_key, level), render_level, source_key, level)
+
+
+def valid_tile(source_key, level, col, row):
+    """Verifica, pelo descritor, se o tile existe na pirâmide (None se não houver descritor)"""
+    try:
+        with open(artifact_store.path_for(descriptor_key(source_key)), encoding='utf-8') as f:
+            match = re.search(r'Width="(\d+)" Height="(\d+)"', f.read())
+    except OSError:
+        return None
+    width, height = int(match.group(1)), int(match.group(2))
+    if not 0 <= level <= max_level(width, height):
+        return False
+    columns, rows = level_grid(*level_size(width, height, level))
+    return 0 <= col < columns and 0 <= row < rows
@@ -0,0 +1,676 @@
+"""
+Pipeline de upload compartilhado pelos dois front ends
+
+A rota Flask (/api/upload, /api/uploads/<id>/complete) e a app ASGI
+(src/asgi.py) usam as mesmas etapas, então os dois servidores se comportam
+igual (animações, modo assíncrono, resolução-alvo, erros):
+
+1. parse_upload_options: lê os campos do formulário
+2. prepare_upload: valida e prepara a imagem, cria o job; animações e o modo
+   assíncrono já terminam aqui
+3. predição e download: predict_upload (síncrono) ou a versão asyncio da app ASGI
+4. finish_upload: ajuste ao tamanho final, conclusão do job e resposta
+
+As funções rodam dentro de uma app context do Flask e devolvem UploadResult
+(payload JSON, status e headers), que cada front end converte na sua resposta.
+"""
+
+import base64
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import replicate
+import requests
+from PIL import Image
+from src.models.user import db, ProcessingJob
+from src.services.animation import (
+    AnimationTooLarge, is_animated, check_input_budget, extract_unique_frames, check_output_budget, assemble
+)
+from src.services.artifact_store import artifact_store
+from src.services.circuit_breaker import CircuitOpen
+from src.services.concurrency_limiter import replicate_limiter, LimiterSaturated
+from src.services.job_events import publish_job
+from src.services.job_metrics import record_job_metrics
+from src.services.job_queue import enqueue_job, settle_job
+from src.services.replicate_service import replicate_call, parse_replicate_time
+from src.services.resolution import SUPPORTED_SCALES, plan_target, resample_to
+from src.services.thumbnail_service import schedule_previews
+from src.services.usage_ledger import record_usage
+
+# Modelo Real-ESRGAN usado no upscale
+REPLICATE_MODEL = "nightmareai/real-esrgan:42fed1c4974146d4d2414e2be2c5277c7fdb0ef3c0669c590548134787689c5299b"
+
+# Definir um limite máximo de pixels para evitar erros de memória na GPU do Replicate
+# O limite de 2096784 pixels é para o modelo Real-ESRGAN.
+MAX_PIXELS = 2000000 # Um pouco abaixo do limite para ter margem de segurança
+
+# Limites de entrada: tamanho do corpo da requisição e pixels da imagem enviada.
+# As dimensões são lidas do cabeçalho antes de decodificar, então uma imagem
+# "bomba" é recusada sem alocar memória para ela.
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+MAX_INPUT_PIXELS = int(os.environ.get('MAX_INPUT_PIXELS', 50000000))
+MAX_OUTPUT_BYTES = int(os.environ.get('MAX_OUTPUT_BYTES', 200 * 1024 * 1024))
+MAX_SCALE = 8
+
+# Teto global do Pillow: cobre as entradas e as maiores saídas (MAX_PIXELS x 8x8)
+Image.MAX_IMAGE_PIXELS = max(MAX_INPUT_PIXELS, MAX_PIXELS * MAX_SCALE ** 2)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# O Replicate apaga as saídas das predições feitas pela API depois de uma hora;
+# predições concluídas há mais tempo que isso não são reaproveitadas
+PREDICTION_OUTPUT_TTL = timedelta(seconds=int(os.environ.get('REPLICATE_OUTPUT_TTL', 3000)))
+
+# Quadros únicos de uma animação enviados ao Replicate ao mesmo tempo
+ANIMATION_CONCURRENCY = int(os.environ.get('ANIMATION_CONCURRENCY', 4))
+
+
+class ImageTooLarge(Exception):
+    """Imagem enviada acima de MAX_INPUT_PIXELS"""
+
+
+class UploadResult:
+    """Resposta de um upload, independente do framework"""
+
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class PreparedUpload:
+    """Imagem pronta para o modelo (saída de prepare_upload)"""
+
+    def __init__(self, job_id, temp_img_path, scale, face_enhance, final_size, input_pixels, started, timings):
+        self.job_id = job_id
+        self.temp_img_path = temp_img_path
+        self.scale = scale
+        self.face_enhance = face_enhance
+        self.final_size = final_size
+        self.input_pixels = input_pixels
+        self.started = started
+        self.timings = timings
+
+
+def error(message, status_code, retry_after=None):
+    headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+    return UploadResult({"error": message}, status_code, headers)
+
+
+def form_flag(form, name):
+    """
+    Lê um campo booleano do formulário ('1', 'true', 'yes', 'on')
+
+    form.get(type=bool) faria bool('0') e bool('false'), ambos True.
+    """
+    return str(form.get(name) or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def form_int(form, name, default=None):
+    value = form.get(name)
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} deve ser um número inteiro")
+
+
+def parse_upload_options(form):
+    """
+    Lê os parâmetros do upload (formulário do Flask ou do Starlette)
+
+    Returns:
+        dict: scale, face_enhance, target_width, target_height e async
+
+    Raises:
+        ValueError: Campo numérico inválido ou escala fora de SUPPORTED_SCALES (400)
+    """
+    scale = form_int(form, 'scale', 2)
+    if scale not in SUPPORTED_SCALES:
+        raise ValueError(f"scale deve ser um de {', '.join(map(str, SUPPORTED_SCALES))}")
+    return {
+        'scale': scale,
+        'face_enhance': form_flag(form, 'face_enhance'),
+        'target_width': form_int(form, 'target_width'),
+        'target_height': form_int(form, 'target_height'),
+        'async': form_flag(form, 'async'),
+    }
+
+
+def load_input_image(stream):
+    """
+    Abre a imagem enviada e a prepara para o modelo (RGB, até MAX_PIXELS)
+
+    O Pillow só lê o cabeçalho ao abrir, então as dimensões são verificadas
+    antes de qualquer decodificação.
+
+    Args:
+        stream: Arquivo/stream com a imagem (já em disco quando o Werkzeug faz spool)
+
+    Returns:
+        Image: Imagem RGB pronta para envio
+    """
+    img = Image.open(stream)
+    original_width, original_height = img.size
+    print(f"Dimensões originais da imagem: {original_width}x{original_height} pixels")
+
+    if original_width * original_height > MAX_INPUT_PIXELS:
+        raise ImageTooLarge(f"Imagem muito grande ({original_width}x{original_height}). O máximo é {MAX_INPUT_PIXELS} pixels.")
+
+    # Redimensionar se exceder o MAX_PIXELS
+    if original_width * original_height > MAX_PIXELS:
+        ratio = (MAX_PIXELS / (original_width * original_height))**0.5
+        new_width = int(original_width * ratio)
+        new_height = int(original_height * ratio)
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8), sem alocar a imagem inteira
+        img.draft('RGB', (new_width, new_height))
+        img = img.convert("RGB").resize((new_width, new_height), Image.LANCZOS)
+        print(f"Imagem redimensionada para: {new_width}x{new_height} pixels (total: {new_width * new_height} pixels)")
+    else:
+        img = img.convert("RGB")
+        print(f"Imagem dentro do limite de pixels. Total: {original_width * original_height} pixels")
+    return img
+
+
+def save_temp_png(img):
+    """Salva a imagem num PNG temporário (direto em disco, sem buffer) e retorna o caminho"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_img_file:
+        img.save(temp_img_file, format='PNG')
+        return temp_img_file.name
+
+
+def output_extension(url, default='png'):
+    """Extensão do arquivo de saída a partir da URL do Replicate"""
+    ext = os.path.splitext(urlparse(str(url)).path)[1].lstrip('.').lower()
+    return ext or default
+
+
+def download_output(url, suffix):
+    """
+    Baixa a saída do Replicate em streaming para um arquivo temporário
+
+    Returns:
+        str: Caminho do arquivo temporário
+    """
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status() # Levanta um erro para status HTTP ruins (4xx ou 5xx)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as output_file:
+            written = 0
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_OUTPUT_BYTES:
+                    output_file.close()
+                    os.unlink(output_file.name)
+                    raise ValueError(f"Imagem processada excede {MAX_OUTPUT_BYTES} bytes")
+                output_file.write(chunk)
+            return output_file.name
+
+
+def get_job(job_id):
+    return ProcessingJob.query.get(job_id) if job_id is not None else None
+
+
+def fail_job(job_id, message):
+    """Marca o job como falho (se houver job rastreado)"""
+    if job_id is None:
+        return
+    try:
+        db.session.rollback()
+        job = get_job(job_id)
+        if job is None:
+            return
+        job.status = 'failed'
+        job.error_message = str(message)
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        publish_job(job)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao marcar job {job_id} como falho: {e}")
+
+
+def mark_processing(job, prediction_id, timings=None):
+    """
+    Marca o job como processing e grava o id da predição
+
+    Se o processo cair durante a espera, a reconciliação encontra o resultado
+    pelo id. A gravação é um auxílio: um erro de banco aqui é só registrado,
+    para não interromper a predição já criada nem contar como falha do
+    Replicate no circuit breaker.
+    """
+    if job is None:
+        return
+    try:
+        job.status = 'processing'
+        job.replicate_prediction_id = prediction_id
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao gravar a predição {prediction_id} do job {job.id}: {e}")
+        return
+    publish_job(job, timings=timings)
+
+
+def resume_prediction(prediction_id):
+    """
+    Retoma uma predição criada numa tentativa anterior do job
+
+    Returns:
+        Prediction: Predição ainda em andamento ou concluída com a saída ainda
+        disponível; None se falhou, foi cancelada, sumiu ou a saída já expirou
+        (aí uma nova predição é criada)
+    """
+    try:
+        prediction = replicate.predictions.get(prediction_id)
+    except replicate.exceptions.ReplicateError as e:
+        print(f"Predição {prediction_id} não encontrada ({e}); criando outra")
+        return None
+    if prediction.status in ('failed', 'canceled'):
+        return None
+    if prediction.status == 'succeeded':
+        completed_at = parse_replicate_time(prediction.completed_at)
+        if completed_at is None or datetime.utcnow() - completed_at > PREDICTION_OUTPUT_TTL:
+            return None
+    print(f"Reaproveitando a predição {prediction_id} ({prediction.status})")
+    return prediction
+
+
+def run_model(model_input, job=None, timings=None):
+    """
+    Executa o modelo como replicate.run, mas devolve a predição inteira
+
+    Com a predição temos o id (para reconciliação) e as métricas do Replicate
+    (predict_time), além da saída. Se o job já tem uma predição (tentativa
+    anterior no worker), ela é reaproveitada em vez de pagar a GPU de novo.
+    Deve rodar dentro de replicate_call(); o bloco só contém chamadas ao
+    Replicate (ver mark_processing).
+    """
+    prediction = None
+    if job is not None and job.replicate_prediction_id:
+        # Nova tentativa de um job: reaproveita a predição já paga, se ainda servir
+        prediction = resume_prediction(job.replicate_prediction_id)
+    if prediction is None:
+        version = REPLICATE_MODEL.split(':', 1)[1]
+        prediction = replicate.predictions.create(version=version, input=model_input)
+        mark_processing(job, prediction.id, timings)
+    prediction.wait()
+    if prediction.status != 'succeeded':
+        raise replicate.exceptions.ModelError(prediction.error or f"Predição {prediction.status}")
+    return prediction
+
+
+def upscale_frame(path, scale, face_enhance):
+    """Amplia um quadro no Replicate e retorna o caminho temporário da saída"""
+    with replicate_call():
+        with open(path, 'rb') as image_file:
+            output_url = replicate.run(
+                REPLICATE_MODEL,
+                input={"image": image_file, "scale": scale, "face_enhance": face_enhance}
+            )
+    return download_output(output_url, f".{output_extension(output_url)}")
+
+
+def encode_file(path):
+    with open(path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+def upscale_animation(stream, filename, options, user_id):
+    """
+    Amplia uma animação (GIF/WebP/APNG) quadro a quadro
+
+    Quadros repetidos são detectados antes do envio, então cada quadro único
+    vai ao Replicate uma única vez (em paralelo); a animação é remontada com a
+    temporização original. O uso registrado é o número de quadros únicos.
+
+    Args:
+        stream: Arquivo/stream com a animação enviada
+        filename (str): Nome original do arquivo
+        options (dict): Parâmetros do upload (parse_upload_options)
+        user_id (int): Usuário da sessão (None para anônimos)
+
+    Returns:
+        UploadResult: Animação ampliada em base64
+    """
+    scale = options['scale']
+    face_enhance = options['face_enhance']
+
+    job = None
+    started = time.monotonic()
+    timings = {}
+    frame_paths = []
+    output_paths = []
+    animation_path = None
+    try:
+        with Image.open(stream) as img:
+            # Dimensões e número de quadros vêm do cabeçalho: nada é decodificado antes
+            check_input_budget(img, MAX_INPUT_PIXELS)
+            unique, mapping, durations, loop, ext = extract_unique_frames(img)
+        check_output_budget(unique[0].size, len(unique), scale)
+        input_pixels = unique[0].width * unique[0].height * len(unique)
+        print(f"Animação com {len(mapping)} quadros, {len(unique)} únicos: scale={scale}, face_enhance={face_enhance}")
+        frame_paths = [save_temp_png(frame) for frame in unique]
+        del unique[:]
+
+        if user_id:
+            stream.seek(0)
+            input_path, file_size = artifact_store.put_stream(stream, ext)
+            job = ProcessingJob(
+                user_id=user_id,
+                status='processing',
+                original_filename=filename,
+                file_size=file_size,
+                input_path=input_path
+            )
+            db.session.add(job)
+            db.session.commit()
+        timings['preprocess'] = round(time.monotonic() - started, 3)
+        publish_job(job, timings=timings)
+
+        predict_started = time.monotonic()
+        first_error = None
+        with ThreadPoolExecutor(max_workers=min(ANIMATION_CONCURRENCY, len(frame_paths))) as pool:
+            futures = [pool.submit(upscale_frame, path, scale, face_enhance) for path in frame_paths]
+            for future in futures:
+                try:
+                    output_paths.append(future.result())
+                except Exception as e:
+                    first_error = first_error or e
+        if first_error is not None:
+            raise first_error
+        timings['predict'] = round(time.monotonic() - predict_started, 3)
+
+        animation_path = assemble(output_paths, mapping, durations, loop, ext)
+        if job is not None:
+            job.output_path = artifact_store.put_file(animation_path, ext, move=True)
+            animation_path = None
+            job.status = 'completed'
+            job.completed_at = datetime.utcnow()
+            record_usage(job.user_id, job.id, images=len(frame_paths), commit=False)
+            db.session.commit()
+            timings['total'] = round(time.monotonic() - started, 3)
+            publish_job(job, timings=timings)
+            # Sem schedule_previews: miniaturas e tiles seriam só o primeiro quadro
+
+        delivery_started = time.monotonic()
+        output_path = animation_path or artifact_store.path_for(job.output_path)
+        result = {"image": encode_file(output_path), "format": ext, "frames": len(mapping), "unique_frames": len(frame_paths)}
+        if job is None:
+            return UploadResult(result)
+
+        result["job_id"] = job.id
+        timings['delivery'] = round(time.monotonic() - delivery_started, 3)
+        try:
+            record_job_metrics(job, timings, scale, input_pixels, output_path)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro ao registrar métricas do job {job.id}: {e}")
+        return UploadResult(result)
+
+    except Exception as e:
+        return error_result(e, job.id if job is not None else None)
+    finally:
+        for path in frame_paths + output_paths + [animation_path]:
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+
+def prepare_upload(stream, filename, options, user_id):
+    """
+    Primeira etapa do upload: valida e prepara a imagem e cria o job
+
+    Animações são processadas inteiras aqui (quadro a quadro, sempre de forma
+    síncrona) e, no modo assíncrono, o job vai para a fila de worker.py.
+
+    Args:
+        stream: Arquivo/stream com a imagem enviada
+        filename (str): Nome original do arquivo
+        options (dict): Parâmetros do upload (parse_upload_options)
+        user_id (int): Usuário da sessão (None para anônimos)
+
+    Returns:
+        UploadResult | PreparedUpload: Resposta final (animação, fila ou erro)
+        ou a imagem pronta para o modelo
+    """
+    # Modo assíncrono: o job vai para a fila e é processado por worker.py
+    if options['async'] and not user_id:
+        return error("Processamento assíncrono requer login", 401)
+
+    job = None
+    temp_img_path = None
+    started = time.monotonic()
+    timings = {}
+    try:
+        # GIF/WebP/APNG animados são ampliados quadro a quadro
+        if is_animated(stream):
+            return upscale_animation(stream, filename, options, user_id)
+
+        # O corpo já está em disco (spool); nada é lido inteiro na memória
+        img = load_input_image(stream)
+
+        # Modo resolução-alvo: o cliente pede o tamanho final e a escala do modelo
+        # é a menor que o atinge; o ajuste fino é feito localmente
+        scale = options['scale']
+        face_enhance = options['face_enhance']
+        target_width = options['target_width']
+        target_height = options['target_height']
+        final_size = None
+        if target_width is not None or target_height is not None:
+            try:
+                scale, final_size = plan_target(img.width, img.height, target_width, target_height)
+            except ValueError as e:
+                return error(str(e), 400)
+
+        print(f"Parâmetros recebidos do frontend: scale={scale}, face_enhance={face_enhance}, final_size={final_size}")
+
+        # Salvar temporariamente a imagem para o Replicate
+        temp_img_path = save_temp_png(img)
+        input_pixels = img.width * img.height
+        img.close()
+
+        print(f"Imagem temporária criada em: {temp_img_path}")
+
+        # Usuários autenticados têm o job registrado e os artefatos guardados localmente
+        if user_id:
+            job = ProcessingJob(
+                user_id=user_id,
+                status='uploaded',
+                original_filename=filename,
+                file_size=os.path.getsize(temp_img_path),
+                input_path=artifact_store.put_file(temp_img_path, 'png')
+            )
+            db.session.add(job)
+            db.session.commit()
+
+            if options['async']:
+                enqueue_job(job, {'scale': scale, 'face_enhance': face_enhance, 'final_size': final_size})
+                os.unlink(temp_img_path)
+                publish_job(job)
+                return UploadResult({"job_id": job.id, "status": job.status}, 202)
+        timings['preprocess'] = round(time.monotonic() - started, 3)
+        publish_job(job, timings=timings)
+        return PreparedUpload(job.id if job is not None else None, temp_img_path, scale, face_enhance,
+                              final_size, input_pixels, started, timings)
+
+    except Exception as e:
+        if temp_img_path and os.path.exists(temp_img_path):
+            os.unlink(temp_img_path)
+        return error_result(e, job.id if job is not None else None)
+
+
+def resample_upload(prepared):
+    """
+    Alvo não maior que a imagem: nada para o modelo fazer, só a reamostragem local
+
+    Returns:
+        tuple: (caminho temporário da saída, 'png', None)
+    """
+    print("Tamanho alvo atingível sem o modelo; reamostrando localmente")
+    fd, output_path = tempfile.mkstemp(suffix='.png')
+    os.close(fd)
+    try:
+        resample_to(prepared.temp_img_path, prepared.final_size, output_path)
+    except Exception:
+        os.unlink(output_path)
+        raise
+    finally:
+        os.unlink(prepared.temp_img_path)
+    return output_path, 'png', None
+
+
+def predict_upload(prepared):
+    """
+    Executa o modelo (ou só a reamostragem) para um upload preparado
+
+    O arquivo temporário da entrada é sempre removido.
+
+    Returns:
+        tuple: (caminho temporário da saída, extensão, métricas da predição ou None)
+    """
+    if prepared.scale is None:
+        return resample_upload(prepared)
+
+    timings = prepared.timings
+    try:
+        # Circuit breaker + limitador global controlam quantas predições rodam ao mesmo tempo
+        print("Iniciando processamento Replicate...")
+        job = get_job(prepared.job_id)
+        publish_job(job, status='queued')
+        queued_at = time.monotonic()
+        with replicate_call():
+            timings['queue'] = round(time.monotonic() - queued_at, 3)
+            predict_started = time.monotonic()
+            with open(prepared.temp_img_path, "rb") as image_file:
+                prediction = run_model({
+                    "image": image_file,
+                    "scale": prepared.scale,
+                    "face_enhance": prepared.face_enhance,
+                }, job, timings)
+    finally:
+        os.unlink(prepared.temp_img_path)
+    output_url = prediction.output
+    timings['predict'] = round(time.monotonic() - predict_started, 3)
+    print(f"Processamento Replicate concluído. Output URL: {output_url}")
+
+    # Baixar a imagem processada (em streaming, direto para o disco)
+    publish_job(job, status='downloading', timings=timings)
+    download_started = time.monotonic()
+    output_ext = output_extension(output_url)
+    output_path = download_output(output_url, f".{output_ext}")
+    timings['download'] = round(time.monotonic() - download_started, 3)
+    return output_path, output_ext, prediction.metrics
+
+
+def finish_upload(prepared, output_path, output_ext, prediction_metrics=None):
+    """
+    Última etapa: ajusta ao tamanho final, conclui o job e monta a resposta
+
+    Args:
+        prepared (PreparedUpload): Upload preparado
+        output_path (str): Saída temporária (do modelo ou da reamostragem)
+        output_ext (str): Extensão da saída
+        prediction_metrics (dict): Campo metrics da predição do Replicate
+
+    Returns:
+        UploadResult: Imagem em base64 (e job_id, se houver job)
+    """
+    timings = prepared.timings
+    job = None
+    try:
+        if prepared.scale is not None and prepared.final_size is not None:
+            resample_to(output_path, prepared.final_size)
+
+        job = get_job(prepared.job_id)
+        if job is not None:
+            # A URL do Replicate expira; guardar a saída evita reprocessar em novos downloads
+            output_key = artifact_store.put_file(output_path, output_ext, move=True)
+            output_path = artifact_store.path_for(output_key)
+            # Condicional ao status: se a reconciliação já concluiu o job, não cobra de novo
+            if settle_job(job.id, status='completed', completed_at=datetime.utcnow(), output_path=output_key):
+                record_usage(job.user_id, job.id, commit=False)
+            db.session.commit()
+            timings['total'] = round(time.monotonic() - prepared.started, 3)
+            publish_job(job, timings=timings)
+            # Miniaturas para o histórico são geradas em background
+            schedule_previews(job.output_path)
+
+        # Retornar a imagem como base64
+        delivery_started = time.monotonic()
+        result = {"image": encode_file(output_path)}
+        if job is None:
+            os.unlink(output_path)
+            return UploadResult(result)
+
+        result["job_id"] = job.id
+        timings['delivery'] = round(time.monotonic() - delivery_started, 3)
+        try:
+            record_job_metrics(job, timings, prepared.scale, prepared.input_pixels, output_path, prediction_metrics)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro ao registrar métricas do job {job.id}: {e}")
+        return UploadResult(result)
+
+    except Exception as e:
+        if job is None and output_path and os.path.exists(output_path):
+            os.unlink(output_path)
+        return error_result(e, prepared.job_id)
+
+
+def error_result(e, job_id=None):
+    """
+    Converte uma exceção do pipeline na resposta de erro (e marca o job como falho)
+
+    Returns:
+        UploadResult: Erro com o status HTTP correspondente
+    """
+    if isinstance(e, (ImageTooLarge, AnimationTooLarge)):
+        print(f"Imagem recusada: {e}")
+        fail_job(job_id, e)
+        return error(str(e), 413)
+
+    fail_job(job_id, e)
+    if isinstance(e, CircuitOpen):
+        print(f"Circuit breaker do Replicate aberto: {e}")
+        # Replicate degradado: falha imediata em vez de esperar o timeout
+        return error("Serviço de processamento temporariamente indisponível. Tente novamente em instantes.",
+                     503, e.retry_after)
+    if isinstance(e, LimiterSaturated):
+        print(f"Limitador do Replicate saturado: {replicate_limiter.snapshot()}")
+        # Falha rápida em vez de empilhar workers bloqueados
+        return error("Serviço sobrecarregado no momento. Tente novamente em instantes.", 503, e.retry_after)
+    if isinstance(e, Image.DecompressionBombError):
+        print(f"Imagem recusada (decompression bomb): {e}")
+        return error(f"Imagem muito grande. O máximo é {MAX_INPUT_PIXELS} pixels.", 413)
+    if isinstance(e, Image.UnidentifiedImageError):
+        print(f"Arquivo de imagem inválido: {e}")
+        return error("Arquivo enviado não é uma imagem válida", 400)
+    if isinstance(e, replicate.exceptions.ModelError):
+        print(f"Erro do Replicate (ModelError): {e}")
+        return error(f"Erro no processamento da imagem: {e}. Por favor, tente com uma imagem menor ou de menor resolução.", 400)
+    if isinstance(e, requests.exceptions.RequestException):
+        # Erros de rede ou HTTP ao baixar a imagem do Replicate
+        print(f"Erro de requisição HTTP: {e}")
+        return error(f"Erro ao baixar a imagem processada: {e}", 500)
+    print(f"Erro inesperado no upload: {e}")
+    return error(f"Ocorreu um erro inesperado: {e}", 500)
+
+
+def process_upload(stream, filename, options, user_id):
+    """
+    Pipeline síncrono completo (rota Flask e uploads montados em partes)
+
+    Returns:
+        UploadResult: Resposta do upload
+    """
+    prepared = prepare_upload(stream, filename, options, user_id)
+    if isinstance(prepared, UploadResult):
+        return prepared
+    try:
+        output_path, output_ext, prediction_metrics = predict_upload(prepared)
+    except Exception as e:
+        return error_result(e, prepared.job_id)
+    return finish_upload(prepared, output_path, output_ext, prediction_metrics)
@@ -0,0 +1,313 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from src.models.user import (
+    db, User, UsageEvent, UsageEventArchive, UsageTotal, UsageCompactionState, UsageCompactionCursor,
+    UsageRolloverState
+)
+from src.services.job_queue import acquire_task_lease
+
+# Intervalo (segundos) entre consolidações do ledger; 0 desativa a thread
+COMPACTION_INTERVAL = float(os.environ.get('USAGE_COMPACTION_INTERVAL', 60))
+
+# Eventos mais novos que isso ficam para a próxima consolidação: a marca d'água
+# é por tempo (created_at), e uma transação com commit atrasado ainda cai na
+# janela seguinte em vez de ser pulada
+COMPACTION_GRACE = float(os.environ.get('USAGE_COMPACTION_GRACE', 30))
+
+# Usuários por transação na virada mensal
+ROLLOVER_CHUNK_SIZE = int(os.environ.get('USAGE_ROLLOVER_CHUNK_SIZE', 5000))
+
+
+def current_period(now=None):
+    """Período de cobrança (mês corrente, AAAA-MM)"""
+    return (now or datetime.utcnow()).strftime('%Y-%m')
+
+
+def previous_period(now=None):
+    """Período imediatamente anterior ao corrente (o que a virada encerra)"""
+    first_day = (now or datetime.utcnow()).replace(day=1)
+    return current_period(first_day - timedelta(days=1))
+
+
+def record_usage(user_id, job_id=None, images=1, commit=True):
+    """
+    Registra o uso de uma imagem processada
+
+    É só um INSERT: nenhuma linha existente é alterada, então uploads
+    simultâneos do mesmo usuário não disputam lock.
+    """
+    event = UsageEvent(user_id=user_id, job_id=job_id, period=current_period(), images=images)
+    db.session.add(event)
+    if commit:
+        db.session.commit()
+    return event
+
+
+def reset_usage_count(user_id, commit=True):
+    """
+    Zera o uso do período corrente com um evento de ajuste (images negativo)
+
+    O ledger continua append-only: o histórico de uso é mantido e o ajuste
+    fica registrado (job_id vazio).
+
+    Returns:
+        UsageEvent: Evento de ajuste (None se o uso já era zero)
+    """
+    used = get_usage_count(user_id)
+    if used == 0:
+        return None
+    return record_usage(user_id, None, images=-used, commit=commit)
+
+
+def get_usage_count(user_id, period=None):
+    """
+    Total de imagens do usuário no período
+
+    Soma o total consolidado com a "cauda" de eventos ainda não consolidados
+    (created_at a partir da marca d'água). O total e a marca d'água são lidos
+    no mesmo SELECT, então uma consolidação concorrente não conta nada duas
+    vezes nem deixa eventos de fora.
+    """
+    period = period or current_period()
+    compacted, last_event_id, compacted_until = db.session.query(
+        select(UsageTotal.images).where(UsageTotal.user_id == user_id, UsageTotal.period == period).scalar_subquery(),
+        select(UsageTotal.last_event_id).where(UsageTotal.user_id == user_id, UsageTotal.period == period).scalar_subquery(),
+        select(UsageCompactionCursor.compacted_until).where(UsageCompactionCursor.id == 1).scalar_subquery(),
+    ).one()
+
+    tail = db.session.query(func.coalesce(func.sum(UsageEvent.images), 0)).filter(
+        UsageEvent.user_id == user_id,
+        UsageEvent.period == period,
+        # Totais anteriores à marca d'água por tempo ainda seguem a marca por id
+        UsageEvent.created_at >= compacted_until if compacted_until is not None else UsageEvent.id > (last_event_id or 0)
+    ).scalar()
+    return int(compacted or 0) + int(tail or 0)
+
+
+def get_usage_counts(user_ids, period=None):
+    """
+    Versão em lote de get_usage_count (listagens): três consultas para todos os usuários
+
+    Returns:
+        dict: user_id -> total de imagens no período
+    """
+    period = period or current_period()
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    watermark = select(UsageCompactionCursor.compacted_until).where(UsageCompactionCursor.id == 1).scalar_subquery()
+    rows = db.session.query(UsageTotal.user_id, UsageTotal.images, watermark).filter(
+        UsageTotal.user_id.in_(user_ids), UsageTotal.period == period
+    ).all()
+    counts = {user_id: 0 for user_id in user_ids}
+    for user_id, images, _ in rows:
+        counts[user_id] = int(images or 0)
+    compacted_until = rows[0][2] if rows else db.session.query(watermark).scalar()
+
+    events = db.session.query(UsageEvent.user_id, func.sum(UsageEvent.images)).filter(
+        UsageEvent.user_id.in_(user_ids), UsageEvent.period == period
+    )
+    if compacted_until is not None:
+        events = events.filter(UsageEvent.created_at >= compacted_until)
+    else:
+        # Totais anteriores à marca d'água por tempo ainda seguem a marca por id
+        events = events.outerjoin(UsageTotal, (UsageTotal.user_id == UsageEvent.user_id) & (UsageTotal.period == period)) \
+            .filter(UsageEvent.id > func.coalesce(UsageTotal.last_event_id, 0))
+    for user_id, images in events.group_by(UsageEvent.user_id):
+        counts[user_id] += int(images or 0)
+    return counts
+
+
+def compact_usage():
+    """
+    Consolida os eventos novos em UsageTotal numa única transação
+
+    Consolida os eventos com created_at entre a marca d'água e agora menos
+    COMPACTION_GRACE. Uma marca por id pularia para sempre os eventos cujo
+    commit chega depois de outro com id maior. Roda num único processo (lease
+    'usage-compaction' em start_usage_compactor); a linha do cursor também é
+    travada para a execução manual.
+
+    Returns:
+        int: Número de pares (usuário, período) atualizados
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=COMPACTION_GRACE)
+    cursor = UsageCompactionCursor.query.with_for_update().get(1)
+    if cursor is None:
+        # Primeira execução: continua da antiga marca d'água por id
+        legacy = UsageCompactionState.query.get(1)
+        window = (UsageEvent.id > (legacy.last_event_id if legacy else 0), UsageEvent.created_at < cutoff)
+        cursor = UsageCompactionCursor(id=1, compacted_until=cutoff)
+        db.session.add(cursor)
+    else:
+        if cutoff <= cursor.compacted_until:
+            db.session.rollback()
+            return 0
+        window = (UsageEvent.created_at >= cursor.compacted_until, UsageEvent.created_at < cutoff)
+        cursor.compacted_until = cutoff
+
+    rows = db.session.query(
+        UsageEvent.user_id, UsageEvent.period, func.sum(UsageEvent.images), func.max(UsageEvent.id)
+    ).filter(*window).group_by(UsageEvent.user_id, UsageEvent.period).all()
+
+    existing = {}
+    if rows:
+        user_ids = {user_id for user_id, _, _, _ in rows}
+        periods = {period for _, period, _, _ in rows}
+        for total in UsageTotal.query.filter(UsageTotal.user_id.in_(user_ids), UsageTotal.period.in_(periods)).all():
+            existing[(total.user_id, total.period)] = total
+
+    for user_id, period, images, max_id in rows:
+        total = existing.get((user_id, period))
+        if total is None:
+            total = UsageTotal(user_id=user_id, period=period, images=0, last_event_id=0)
+            db.session.add(total)
+        total.images += int(images or 0)
+        total.last_event_id = max(total.last_event_id or 0, max_id)
+
+    db.session.commit()
+    return len(rows)
+
+
+def period_end(period):
+    """Início do mês seguinte ao período (AAAA-MM)"""
+    year, month = map(int, period.split('-'))
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def compacted_until():
+    cursor = UsageCompactionCursor.query.get(1)
+    db.session.commit()
+    return cursor.compacted_until if cursor else None
+
+
+def _start_rollover(period):
+    """Cria o estado da virada (só depois que a consolidação passou do fim do período)"""
+    state = UsageRolloverState(period=period)
+    db.session.add(state)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo iniciou a mesma virada
+        db.session.rollback()
+
+
+def rollover_pending(period=None):
+    state = UsageRolloverState.query.get(period or previous_period())
+    db.session.commit()
+    return state is None or state.completed_at is None
+
+
+def rollover_usage(period=None, chunk_size=ROLLOVER_CHUNK_SIZE):
+    """
+    Virada mensal: encerra o período e arquiva seus eventos
+
+    As cotas já viram sozinhas (o uso é contado por período), então a virada
+    só tira os eventos do período encerrado da tabela quente. Percorre os
+    usuários em faixas de id; cada faixa é uma transação curta com dois
+    comandos em lote: INSERT ... SELECT dos eventos em usage_events_archive e
+    DELETE dos mesmos eventos em usage_events. Nada é perdido: o histórico
+    bruto (auditoria/cobrança) fica no arquivo e UsageTotal guarda o total do
+    período. Só eventos já consolidados (created_at antes da marca d'água da
+    consolidação) são movidos; a virada espera a marca passar do fim do período.
+
+    O progresso fica em UsageRolloverState, então uma virada interrompida
+    continua de onde parou e rodar de novo não tem efeito. A linha de estado é
+    travada a cada faixa, serializando processos concorrentes.
+
+    Args:
+        period (str): Período encerrado, AAAA-MM (padrão: o mês anterior)
+        chunk_size (int): Usuários por transação
+
+    Returns:
+        dict: Estado da virada (eventos arquivados, conclusão)
+    """
+    period = period or previous_period()
+    if period >= current_period():
+        raise ValueError(f"Período {period} ainda não encerrou")
+
+    if UsageRolloverState.query.get(period) is None:
+        compact_usage()
+        watermark = compacted_until()
+        if watermark is None or watermark < period_end(period):
+            # Eventos do fim do período ainda dentro da carência: tenta na próxima rodada
+            return {'period': period, 'events_archived': 0, 'completed_at': None}
+        _start_rollover(period)
+
+    columns = ('id', 'user_id', 'job_id', 'period', 'images', 'created_at')
+    while True:
+        state = UsageRolloverState.query.with_for_update().get(period)
+        if state.completed_at is not None:
+            db.session.commit()
+            break
+
+        last_user_id = state.last_user_id
+        upper = db.session.query(User.id).filter(User.id > last_user_id).order_by(User.id).offset(chunk_size - 1).limit(1).scalar()
+        if upper is None:
+            # Última faixa
+            upper = db.session.query(func.max(User.id)).filter(User.id > last_user_id).scalar()
+        if upper is None:
+            state.completed_at = datetime.utcnow()
+            db.session.commit()
+            break
+
+        events = (
+            UsageEvent.user_id > last_user_id,
+            UsageEvent.user_id <= upper,
+            UsageEvent.period == period,
+            UsageEvent.created_at < compacted_until(),
+        )
+        db.session.execute(insert(UsageEventArchive).from_select(
+            columns, select(*(getattr(UsageEvent, name) for name in columns)).where(*events)
+        ))
+        state.events_archived += UsageEvent.query.filter(*events).delete(synchronize_session=False)
+        state.last_user_id = upper
+        db.session.commit()
+
+    state = UsageRolloverState.query.get(period)
+    db.session.commit()
+    return {
+        'period': state.period,
+        'events_archived': state.events_archived,
+        'completed_at': state.completed_at.isoformat() if state.completed_at else None,
+    }
+
+
+def start_usage_compactor(app):
+    """
+    Executa compact_usage periodicamente numa thread daemon
+
+    Na mesma thread dispara a virada mensal (rollover_usage) quando o mês
+    anterior ainda não foi encerrado. Só o processo que detém o lease
+    'usage-compaction' executa as duas em cada rodada.
+    """
+    if COMPACTION_INTERVAL <= 0:
+        return None
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop():
+        while True:
+            time.sleep(COMPACTION_INTERVAL)
+            with app.app_context():
+                try:
+                    if not acquire_task_lease('usage-compaction', holder, COMPACTION_INTERVAL * 2):
+                        continue
+                    compact_usage()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro ao consolidar uso: {e}")
+                try:
+                    if rollover_pending():
+                        app.logger.info(f"Virada mensal de uso: {rollover_usage()}")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro na virada mensal de uso: {e}")
+
+    thread = threading.Thread(target=loop, name='usage-compactor', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Varredura de retenção do UltraImageAI
+
+Remove os arquivos e, depois, os registros dos jobs cuja retenção do plano
+expirou, em lotes pequenos (transações curtas). A mesma varredura roda em
+background no servidor (RETENTION_SWEEP_INTERVAL); este script serve para
+execução manual ou via cron.
+
+Uso: python sweep_retention.py --batch-size 500
+"""
+
+import argparse
+import os
+import sys
+
+# Permite importar o pacote src (mesmo layout usado pelo gunicorn: src.main:app)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Só a app: as threads de manutenção rodam no servidor web
+os.environ.setdefault('BACKGROUND_TASKS', 'false')
+
+from src.main import app
+from src.services.artifact_store import artifact_store
+from src.services.retention import BATCH_SIZE, BATCH_PAUSE, sweep_expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Varredura de retenção de jobs e artefatos')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=BATCH_PAUSE, help='Pausa entre lotes (segundos)')
+    args = parser.parse_args()
+
+    print("🧹 Iniciando varredura de retenção...")
+    with app.app_context():
+        report = sweep_expired(batch_size=args.batch_size, pause=args.pause)
+
+    print(f"✅ Artefatos limpos em {report['artifacts_cleared']} jobs")
+    print(f"✅ Jobs removidos: {report['jobs_deleted']}")
+    print(f"📦 Arquivos apagados: {report['files_deleted']} ({report['bytes_freed'] / (1024 * 1024):.1f} MB)")
+    print(f"📊 Armazenamento atual: {artifact_store.usage()['bytes'] / (1024 * 1024):.1f} MB")
+    print(f"🎉 Concluído em {report['seconds']}s ({report['batches']} lotes)")
+
+
+if __name__ == "__main__":
+    main()
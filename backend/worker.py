@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Worker de processamento do UltraImageAI
+
+Reserva jobs da fila (job_queue) com lease, renova os leases via heartbeat
+enquanto processa e executa até N jobs em paralelo. Jobs cujo lease expira
+(worker caiu no meio) voltam a ficar disponíveis para outro worker. Para
+escalar, basta iniciar mais processos, em quantos nós forem necessários.
+
+Uso: python worker.py --concurrency 8
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Permite importar o pacote src (mesmo layout usado pelo gunicorn: src.main:app)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Só a app: as threads de manutenção rodam no servidor web
+os.environ.setdefault('BACKGROUND_TASKS', 'false')
+
+from src.main import app
+from src.models.user import db
+from src.services.job_queue import LEASE_SECONDS, claim_jobs, heartbeat, queue_stats
+from src.services.job_runner import run_job
+
+
+class Worker:
+    def __init__(self, concurrency, poll_interval, lease_seconds):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _run(self, job_id, params, attempts):
+        try:
+            with app.app_context():
+                try:
+                    run_job(job_id, params, attempts, self.worker_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ Erro inesperado no job {job_id}: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(job_id)
+
+    def _heartbeat_loop(self):
+        interval = max(1, self.lease_seconds // 3)
+        while not self.stopping.wait(interval):
+            with self.lock:
+                job_ids = set(self.in_flight)
+            if not job_ids:
+                continue
+            with app.app_context():
+                try:
+                    owned = heartbeat(self.worker_id, job_ids, self.lease_seconds)
+                    lost = job_ids - owned
+                    if lost:
+                        print(f"⚠️  Leases perdidos: {sorted(lost)}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️  Erro no heartbeat: {e}")
+
+    def run(self):
+        print(f"🚀 Worker {self.worker_id} iniciado (concorrência {self.concurrency})")
+        threading.Thread(target=self._heartbeat_loop, name='heartbeat', daemon=True).start()
+
+        while not self.stopping.is_set():
+            with self.lock:
+                free = self.concurrency - len(self.in_flight)
+            claimed = []
+            if free > 0:
+                with app.app_context():
+                    try:
+                        claimed = claim_jobs(self.worker_id, free, self.lease_seconds)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"⚠️  Erro ao reservar jobs: {e}")
+
+            for job_id, params, attempts in claimed:
+                with self.lock:
+                    self.in_flight.add(job_id)
+                self.pool.submit(self._run, job_id, params, attempts)
+
+            # Fila vazia ou worker cheio: espera antes de consultar de novo
+            if not claimed or free <= len(claimed):
+                self.stopping.wait(self.poll_interval)
+
+        print("🛑 Encerrando: aguardando jobs em andamento...")
+        self.pool.shutdown(wait=True)
+
+    def stop(self, *args):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker de processamento do UltraImageAI')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('WORKER_CONCURRENCY', 4)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.environ.get('WORKER_POLL_INTERVAL', 1.0)))
+    parser.add_argument('--lease-seconds', type=int, default=LEASE_SECONDS)
+    parser.add_argument('--stats', action='store_true', help='Mostra o estado da fila e sai')
+    args = parser.parse_args()
+
+    if args.stats:
+        with app.app_context():
+            print(queue_stats())
+        return
+
+    worker = Worker(args.concurrency, args.poll_interval, args.lease_seconds)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()